@@ -0,0 +1,107 @@
+"""
+Admission control and request deadlines for the detection endpoints.
+
+For real-time recognition a late answer is worthless, so a worker bounds the
+detection requests it works on at once: past ``max_in_flight`` a request is
+turned away immediately (the app answers ``429`` with ``Retry-After``)
+instead of queueing behind work the model cannot get to in time.
+
+Clients may also say how long an answer stays useful, with either header:
+
+- ``X-Request-Timeout-Ms`` - milliseconds from when the worker picks the request up
+- ``X-Request-Deadline`` - absolute Unix time in seconds (needs reasonably synced clocks)
+
+Deadlines are kept on the monotonic clock. Work whose deadline has passed is
+dropped before it reaches the model, including frames already waiting in the
+batch scheduler.
+"""
+
+import math
+import threading
+import time
+
+TIMEOUT_HEADER = 'X-Request-Timeout-Ms'
+DEADLINE_HEADER = 'X-Request-Deadline'
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when work is dropped because its deadline passed."""
+
+
+class AdmissionController:
+    """Bounded count of in-flight requests, with admitted/rejected counters.
+
+    ``max_in_flight`` of 0 admits everything (the counters still run).
+    """
+
+    def __init__(self, max_in_flight):
+        self.max_in_flight = max(0, int(max_in_flight))
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._admitted = 0
+        self._rejected = 0
+        self._expired = 0
+
+    @property
+    def in_flight(self):
+        return self._in_flight
+
+    def try_acquire(self):
+        """Take an in-flight slot; False (and counted as rejected) when full."""
+        with self._lock:
+            if self.max_in_flight and self._in_flight >= self.max_in_flight:
+                self._rejected += 1
+                return False
+            self._in_flight += 1
+            self._admitted += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self._in_flight -= 1
+
+    def expired(self):
+        """Count a request dropped because its deadline passed."""
+        with self._lock:
+            self._expired += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "max_in_flight": self.max_in_flight,
+                "in_flight": self._in_flight,
+                "admitted": self._admitted,
+                "rejected": self._rejected,
+                "expired": self._expired,
+            }
+
+
+def parse_deadline(headers):
+    """Monotonic deadline from the request headers, or None when neither is set.
+
+    Raises ValueError for malformed values, including ``nan`` and ``inf``.
+    """
+    now = time.monotonic()
+    deadlines = []
+    if headers.get(TIMEOUT_HEADER):
+        deadlines.append(now + _finite(headers[TIMEOUT_HEADER], TIMEOUT_HEADER) / 1000.0)
+    if headers.get(DEADLINE_HEADER):
+        deadlines.append(now + _finite(headers[DEADLINE_HEADER], DEADLINE_HEADER) - time.time())
+    return min(deadlines) if deadlines else None
+
+
+def _finite(value, header):
+    number = float(value)
+    if not math.isfinite(number):
+        raise ValueError(f"{header} must be a finite number, got {value!r}")
+    return number
+
+
+def expired(deadline):
+    return deadline is not None and time.monotonic() >= deadline
+
+
+def check(deadline, what="request"):
+    """Raise ``DeadlineExceeded`` if ``deadline`` has passed."""
+    if expired(deadline):
+        raise DeadlineExceeded(f"Deadline passed before the {what} ran")
@@ -1,11 +1,9 @@
-from flask import Flask, request, Response, jsonify
+from flask import Flask, request, Response, g, has_request_context, jsonify, stream_with_context
 from flask_cors import CORS
 import cv2
 import numpy as np
-import torch
-from ultralytics import YOLO
-import base64
 import os
+import struct
 import time
 import logging
 import io
@@ -13,11 +11,38 @@ import sys
 import traceback
 import threading
 
+from admission import AdmissionController, DeadlineExceeded, parse_deadline
+import admission
+from batching import BatchScheduler
+from debug_capture import DebugRecorder
+from result_cache import ResultCache
+from frame_gate import FrameGate
+from inference_executor import InferenceExecutor, clone_predictor
+from inference_pool import InferencePool
+from inference_backends import BACKENDS, artifact_path, load_classifier_runtime, load_yolo_backend
+from image_io import decode_base64_image, decode_image_bytes, decode_raw_rgb
+from lean_engine import LeanClassifier, TorchRuntime
+import landmarks
+import postprocess
+import response_formats
+from postprocess import ClassNames
+from metrics import Registry, clear_timer, current_timer, stage, start_timer
+from profiler import ProfilerBusyError, SamplingProfiler, collapse
+from model_slots import ModelSlot, ModelSlots
+from sessions import SessionStore
+from worker_topology import apply_thread_budget, configure_torch, thread_budget
+
 # Configure logging
 logging.basicConfig(level=logging.DEBUG, 
                     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+if postprocess.orjson is None:
+    logger.warning("orjson is not installed; serializing responses with the slower standard json encoder")
+if response_formats.msgpack is None:
+    logger.warning("msgpack is not installed; Accept: application/msgpack gets JSON "
+                   "(pip install -r requirements-backends.txt)")
+
 # YOLO Model Mapping
 ACTION_NAMES = {
     0: 'Are', 1: 'Can', 2: 'Come', 3: 'Dont', 4: 'Going', 
@@ -26,6 +51,7 @@ ACTION_NAMES = {
     14: 'This', 15: 'Today', 16: 'Understand', 17: 'What', 
     18: 'Where', 19: 'You', 20: 'Your'
 }
+ACTION_CLASS_NAMES = ClassNames(ACTION_NAMES)
 
 app = Flask(__name__)
 # Enable CORS for all routes and all origins
@@ -36,70 +62,654 @@ model = None
 model_path = os.environ.get('MODEL_PATH', 'best(4).pt')
 model_loading = False
 model_error = None
+_load_lock = threading.Lock()
+current_model_version = 0
+model_load_seconds = None
+model_imgsz = int(os.environ.get('MODEL_IMGSZ', 64))
+
+# Load (and warm up) the model on a background thread at startup (gunicorn.conf.py turns this off when preloading)
+MODEL_BACKGROUND_LOAD = os.environ.get('MODEL_BACKGROUND_LOAD', '1').lower() not in ('0', 'false', 'no')
+
+# Lean execution path for -cls models, bypassing the ultralytics predictor (LEAN_CLASSIFIER=0 disables it)
+LEAN_CLASSIFIER = os.environ.get('LEAN_CLASSIFIER', '1').lower() not in ('0', 'false', 'no')
+lean_engine = None
+
+# Forward-pass backend: pytorch, onnx (ONNX Runtime CPU), openvino, or onnx-int8 (see quantize_model.py)
+INFERENCE_BACKEND = os.environ.get('INFERENCE_BACKEND', 'pytorch').lower()
+BACKEND_PARITY_TOLERANCE = float(os.environ.get('BACKEND_PARITY_TOLERANCE', 1e-3))
+# INT8 models trade some precision for speed, so they are held to a looser bound
+QUANTIZED_PARITY_TOLERANCE = float(os.environ.get('QUANTIZED_PARITY_TOLERANCE', 0.1))
+active_backend = 'pytorch'
+# Why the last load fell back from INFERENCE_BACKEND to pytorch (None when it did not)
+backend_error = None
+
+# Decode compressed uploads at reduced resolution when they are much larger than the model input
+REDUCED_DECODE = os.environ.get('REDUCED_DECODE', '1').lower() not in ('0', 'false', 'no')
+
+# Independent predictors over the shared weights; at most this many forward passes run at once per worker
+INFERENCE_PREDICTORS = int(os.environ.get('INFERENCE_PREDICTORS', 2))
+INFERENCE_PREDICTOR_TIMEOUT = float(os.environ.get('INFERENCE_PREDICTOR_TIMEOUT', 30))
+inference_executor = None
+
+# Serving model; reloads build a standby model and swap it in (see model_slots.py)
+model_slots = ModelSlots()
+
+# Micro-batching settings (set BATCH_MAX_SIZE=1 to disable batching)
+BATCH_MAX_SIZE = int(os.environ.get('BATCH_MAX_SIZE', 8))
+BATCH_MAX_WAIT_MS = float(os.environ.get('BATCH_MAX_WAIT_MS', 5))
+batch_scheduler = None
+
+# Separate inference processes fed frames through shared memory (0 keeps inference in the request worker)
+INFERENCE_PROCESSES = int(os.environ.get('INFERENCE_PROCESSES', 0))
+INFERENCE_POOL_SLOTS = int(os.environ.get('INFERENCE_POOL_SLOTS', 32))
+INFERENCE_POOL_FRAME_BYTES = int(os.environ.get('INFERENCE_POOL_FRAME_BYTES', 8 * 1024 * 1024))
+INFERENCE_POOL_TIMEOUT = float(os.environ.get('INFERENCE_POOL_TIMEOUT', 30))
+inference_pool = None
+
+# Admission control for /detect and /detect_batch: past this many requests in flight per worker,
+# requests get an immediate 429 (0 disables the limit). Keep it below GUNICORN_THREADS so spare
+# threads are left to refuse requests instead of letting them queue inside gunicorn.
+ADMISSION_MAX_IN_FLIGHT = int(os.environ.get('ADMISSION_MAX_IN_FLIGHT', 8))
+ADMISSION_RETRY_AFTER = int(os.environ.get('ADMISSION_RETRY_AFTER', 1))
+admission_controller = AdmissionController(ADMISSION_MAX_IN_FLIGHT)
+
+# Maximum number of images accepted by a single /detect_batch request
+DETECT_BATCH_MAX_IMAGES = int(os.environ.get('DETECT_BATCH_MAX_IMAGES', 64))
+
+# Streaming session settings
+STREAM_MAX_SESSIONS = int(os.environ.get('STREAM_MAX_SESSIONS', 256))
+STREAM_SESSION_TTL = float(os.environ.get('STREAM_SESSION_TTL', 60))
+STREAM_MAX_FRAME_BYTES = int(os.environ.get('STREAM_MAX_FRAME_BYTES', 8 * 1024 * 1024))
+
+session_store = SessionStore(max_sessions=STREAM_MAX_SESSIONS, idle_ttl=STREAM_SESSION_TTL)
+
+# Latest frame wins per X-Session-Id on /detect: a session has one frame running and at most one
+# waiting, and a newer frame supersedes the waiting one (LATEST_FRAME_WINS=0 disables this)
+LATEST_FRAME_WINS = os.environ.get('LATEST_FRAME_WINS', '1').lower() not in ('0', 'false', 'no')
+SESSION_TURN_TIMEOUT = float(os.environ.get('SESSION_TURN_TIMEOUT', 30))
+
+# Result cache keyed by upload bytes + model version (RESULT_CACHE_SIZE=0 disables it)
+result_cache = ResultCache(
+    max_entries=int(os.environ.get('RESULT_CACHE_SIZE', 1024)),
+    ttl=float(os.environ.get('RESULT_CACHE_TTL', 60))
+)
+
+# Sampled debug captures, written by a background thread (DEBUG_CAPTURE_EVERY_N=0 disables sampling)
+debug_recorder = DebugRecorder(
+    directory=os.environ.get('DEBUG_CAPTURE_DIR', 'debug_captures'),
+    ring_size=int(os.environ.get('DEBUG_CAPTURE_RING', 50)),
+    sample_every=int(os.environ.get('DEBUG_CAPTURE_EVERY_N', 100)),
+    low_confidence=float(os.environ['DEBUG_CAPTURE_LOW_CONF']) if os.environ.get('DEBUG_CAPTURE_LOW_CONF') else None
+)
+
+# Frame-difference gating: reuse a session's last result when its frame has not changed
+frame_gate = FrameGate(
+    threshold=float(os.environ.get('FRAME_GATE_THRESHOLD', 2.0)),
+    size=int(os.environ.get('FRAME_GATE_SIZE', 16)),
+    enabled=os.environ.get('FRAME_GATE_ENABLED', '1').lower() not in ('0', 'false', 'no')
+)
+
+# Per-stage timings in a Server-Timing header on every response (SERVER_TIMING=0 disables it)
+SERVER_TIMING = os.environ.get('SERVER_TIMING', '1').lower() not in ('0', 'false', 'no')
+
+# On-demand stack sampling at /debug/profile. Off by default: the endpoint is unauthenticated
+# and ties up a request thread, so only turn it on where the port is not public
+DEBUG_PROFILE_ENABLED = os.environ.get('DEBUG_PROFILE_ENABLED', '0').lower() in ('1', 'true', 'yes')
+profiler = SamplingProfiler(
+    interval=float(os.environ.get('DEBUG_PROFILE_INTERVAL_MS', 5)) / 1000.0,
+    max_seconds=float(os.environ.get('DEBUG_PROFILE_MAX_SECONDS', 60))
+)
+
+# Prometheus metrics served at /metrics (per worker process)
+metrics_registry = Registry('signserenade_')
+requests_total = metrics_registry.counter(
+    'requests_total', 'HTTP requests handled', ('endpoint', 'method', 'status'))
+request_duration = metrics_registry.histogram(
+    'request_duration_seconds', 'Time from request start to response headers', ('endpoint',))
+stage_duration = metrics_registry.histogram(
+    'stage_duration_seconds', 'Time spent in each request stage', ('endpoint', 'stage'))
+errors_total = metrics_registry.counter(
+    'errors_total', 'Failed requests and stream frames by cause', ('endpoint', 'type'))
+rejected_total = metrics_registry.counter(
+    'admission_rejected_total', 'Requests refused with 429 because the worker was at capacity', ('endpoint',))
+expired_total = metrics_registry.counter(
+    'deadline_expired_total', 'Requests dropped because their deadline passed before inference', ('endpoint',))
+superseded_total = metrics_registry.counter(
+    'superseded_total', 'Frames dropped because a newer frame from the same session arrived', ('endpoint',))
+metrics_registry.gauge(
+    'requests_in_flight', 'Admitted detection requests currently being handled',
+    lambda: admission_controller.in_flight)
+metrics_registry.gauge(
+    'model_loaded', 'Whether a model is serving (1) or not (0)', lambda: int(model_slots.current() is not None))
+metrics_registry.gauge(
+    'model_version', 'Version of the serving model (increments on reload)', lambda: current_model_version)
+metrics_registry.gauge(
+    'model_load_seconds', 'Duration of the last successful model load and warm-up', lambda: model_load_seconds)
+metrics_registry.gauge(
+    'batch_queue_depth', 'Frames waiting for the micro-batching scheduler',
+    lambda: batch_scheduler.stats()['queue_depth'] if batch_scheduler is not None else None)
+metrics_registry.gauge(
+    'predictors_busy', 'Predictors currently running a forward pass',
+    lambda: inference_executor.stats()['busy'] if inference_executor is not None else None)
+metrics_registry.gauge(
+    'inference_pool_slots_in_use', 'Shared-memory inference pool slots holding a frame',
+    lambda: inference_pool.stats()['slots_in_use'] if inference_pool is not None else None)
 
-def load_model():
-    """Load the YOLO model in a separate function for better error handling."""
-    global model, model_loading, model_error
+def get_model_imgsz(yolo_model):
+    """Input size the model was trained at (MODEL_IMGSZ overrides it)."""
+    if os.environ.get('MODEL_IMGSZ'):
+        return int(os.environ['MODEL_IMGSZ'])
     
-    if model_loading:
+    imgsz = None
+    args = getattr(getattr(yolo_model, 'model', None), 'args', None)
+    if isinstance(args, dict):
+        imgsz = args.get('imgsz')
+    if imgsz is None:
+        imgsz = getattr(yolo_model, 'overrides', {}).get('imgsz')
+    if isinstance(imgsz, (list, tuple)):
+        imgsz = max(imgsz)
+    return int(imgsz) if imgsz else 64
+
+def decode_target_size():
+    """Smallest side the decoders may reduce an upload to, or None to decode at full size."""
+    return model_imgsz if REDUCED_DECODE else None
+
+def load_model(path=None):
+    """Load and warm up a model, then swap it in. Only one load runs at a time.
+    
+    The previous model keeps serving until the new one is ready, and keeps
+    serving if the load fails. ``/health`` reports ``loading`` until the
+    first model has finished warming up.
+    """
+    global model_loading
+    
+    if not _load_lock.acquire(blocking=False):
         return False, "Model is already loading"
     
     model_loading = True
+    try:
+        return _load_model(path or model_path)
+    finally:
+        model_loading = False
+        _load_lock.release()
+
+def load_model_in_background(path=None):
+    """Start load_model() on a daemon thread so the server can accept connections meanwhile."""
+    global model_loading
+    
+    # Report loading before the thread gets scheduled
+    model_loading = True
+    
+    def load_model_thread():
+        success, message = load_model(path)
+        logger.info(f"Model load {'succeeded' if success else 'failed'}: {message}")
+    
+    thread = threading.Thread(target=load_model_thread, name="model-loader")
+    thread.daemon = True
+    thread.start()
+    return thread
+
+def _load_model(path):
+    """Build a complete, warmed-up standby model from ``path`` and make it active."""
+    global model_error, model_load_seconds, backend_error
+    
+    # Heavy imports are deferred to here so the server starts without waiting for them
+    import torch
+    from ultralytics import YOLO
+    
+    configure_torch()
     model_error = None
+    load_start = time.time()
     
     try:
-        logger.info(f"Loading model from {model_path}")
+        logger.info(f"Loading model from {path}")
         
-        if not os.path.exists(model_path):
-            model_error = f"Model file not found at {model_path}"
+        if not os.path.exists(path):
+            model_error = f"Model file not found at {path}"
             logger.error(model_error)
-            model_loading = False
             return False, model_error
         
         # Load the model
-        model = YOLO(model_path)
+        new_model = YOLO(path)
         
         # Verify the model is loaded correctly
-        if model is None:
+        if new_model is None:
             model_error = "Model failed to initialize"
             logger.error(model_error)
-            model_loading = False
             return False, model_error
         
         # Check if the model has names attribute
-        if not hasattr(model, 'names') or not model.names:
+        if not hasattr(new_model, 'names') or not new_model.names:
             model_error = "Model loaded but has no class names"
             logger.error(model_error)
-            model_loading = False
             return False, model_error
         
-        logger.info(f"Successfully loaded model from {model_path}")
-        logger.info(f"Model classes: {model.names}")
+        imgsz = get_model_imgsz(new_model)
+        logger.info(f"Successfully loaded model from {path} (imgsz={imgsz})")
+        logger.info(f"Model classes: {new_model.names}")
         
-        # Run a simple inference to verify the model works
-        test_img = np.zeros((640, 640, 3), dtype=np.uint8)
+        # Run a simple inference at the model's input size to verify the model works
+        test_img = np.zeros((imgsz, imgsz, 3), dtype=np.uint8)
         try:
-            _ = model(test_img)
+            _ = new_model(test_img)
             logger.info("Model successfully ran inference on test image")
         except Exception as e:
             model_error = f"Model loaded but failed on test inference: {str(e)}"
             logger.error(model_error)
             logger.error(traceback.format_exc())
-            model_loading = False
             return False, model_error
         
-        model_loading = False
+        # Pick the execution path: classification models run through the lean engine on
+        # the configured backend, other models through ultralytics on an exported backend
+        engine = None
+        backend = 'pytorch'
+        fallback = None
+        if INFERENCE_BACKEND not in BACKENDS:
+            fallback = f"Unknown INFERENCE_BACKEND '{INFERENCE_BACKEND}'"
+            logger.error(f"{fallback}, using pytorch")
+        
+        if LeanClassifier.supports(new_model) and (LEAN_CLASSIFIER or INFERENCE_BACKEND != 'pytorch'):
+            runtime = TorchRuntime(new_model)
+            if INFERENCE_BACKEND in BACKENDS and INFERENCE_BACKEND != 'pytorch':
+                try:
+                    tolerance = (QUANTIZED_PARITY_TOLERANCE if INFERENCE_BACKEND == 'onnx-int8'
+                                 else BACKEND_PARITY_TOLERANCE)
+                    runtime = load_classifier_runtime(path, INFERENCE_BACKEND, imgsz, runtime,
+                                                      tolerance=tolerance, threads=torch.get_num_threads())
+                    backend = INFERENCE_BACKEND
+                except Exception as e:
+                    fallback = f"{INFERENCE_BACKEND} backend unavailable: {e}"
+                    logger.warning(f"{INFERENCE_BACKEND} backend unavailable, using pytorch "
+                                   f"(pip install -r requirements-backends.txt): {e}")
+            try:
+                engine = LeanClassifier(runtime, imgsz)
+                engine([test_img])
+                logger.info(f"Using lean classifier execution path on {backend}")
+            except Exception as e:
+                logger.warning(f"Lean classifier unavailable, using ultralytics predictor: {e}")
+                engine = None
+                backend = 'pytorch'
+        elif INFERENCE_BACKEND in BACKENDS and INFERENCE_BACKEND != 'pytorch':
+            try:
+                new_model = load_yolo_backend(new_model, path, INFERENCE_BACKEND, imgsz,
+                                              tolerance=BACKEND_PARITY_TOLERANCE)
+                backend = INFERENCE_BACKEND
+            except Exception as e:
+                fallback = f"{INFERENCE_BACKEND} backend unavailable: {e}"
+                logger.warning(f"{INFERENCE_BACKEND} backend unavailable, using pytorch "
+                               f"(pip install -r requirements-backends.txt): {e}")
+        
+        executor = build_executor(new_model, engine, imgsz)
+        activate(ModelSlot(
+            version=current_model_version + 1,
+            path=path,
+            model=new_model,
+            executor=executor,
+            scheduler=make_scheduler(executor),
+            imgsz=imgsz,
+            backend=backend,
+            lean_engine=engine
+        ))
+        backend_error = fallback
+        
+        model_load_seconds = time.time() - load_start
+        logger.info(f"Model load and warm-up took {model_load_seconds:.2f} seconds")
         return True, "Model loaded successfully"
     
     except Exception as e:
         model_error = f"Error loading model: {str(e)}"
         logger.error(model_error)
         logger.error(traceback.format_exc())
-        model_loading = False
         return False, model_error
 
-# Try to load the model on startup
-success, message = load_model()
+def activate(slot):
+    """Swap a warmed-up slot in as the serving model and mirror it in the module globals."""
+    global model, model_path, current_model_version, model_imgsz, lean_engine, active_backend
+    global inference_executor, batch_scheduler
+    
+    model_slots.swap(slot)
+    
+    model = slot.model
+    model_path = slot.path
+    model_imgsz = slot.imgsz
+    lean_engine = slot.lean_engine
+    active_backend = slot.backend
+    inference_executor = slot.executor
+    batch_scheduler = slot.scheduler
+    current_model_version = slot.version
+    
+    # New weights: results cached for the previous model are no longer valid
+    result_cache.clear()
+    logger.info(f"Serving model version {slot.version} from {slot.path}")
+
+def warmup_batch_sizes():
+    """Batch sizes to warm up: 1, the powers of two below BATCH_MAX_SIZE, and BATCH_MAX_SIZE."""
+    sizes = {1, max(1, BATCH_MAX_SIZE)}
+    size = 2
+    while size < BATCH_MAX_SIZE:
+        sizes.add(size)
+        size *= 2
+    return sorted(sizes)
+
+def build_executor(yolo_model, engine, imgsz):
+    """Pool of INFERENCE_PREDICTORS predictors over a loaded model, each warmed up.
+    
+    Every predictor runs once per warm-up batch size at the model's input size, so
+    first requests do not pay for lazy setup, buffer allocation or kernel selection.
+    This also makes every ultralytics predictor finish its one-time setup (which
+    fuses the shared weights) before any request thread can reach it.
+    """
+    warmup_frame = np.zeros((imgsz, imgsz, 3), dtype=np.uint8)
+    batch_sizes = warmup_batch_sizes()
+    if engine is not None:
+        runtime = engine.runtime
+        make = lambda: LeanClassifier(runtime, imgsz)
+    else:
+        make = lambda: clone_predictor(yolo_model)
+    
+    def factory():
+        predictor = make()
+        for batch_size in batch_sizes:
+            predictor([warmup_frame] * batch_size)
+        return predictor
+    
+    start = time.time()
+    executor = InferenceExecutor(factory, size=INFERENCE_PREDICTORS, timeout=INFERENCE_PREDICTOR_TIMEOUT)
+    logger.info(f"Warmed up {INFERENCE_PREDICTORS} predictors at {imgsz}x{imgsz}, "
+                f"batch sizes {batch_sizes}, in {time.time() - start:.2f} seconds")
+    return executor
+
+def make_scheduler(executor):
+    """Micro-batching scheduler over one model's executor, or None when batching is off.
+    
+    Each model gets its own scheduler so frames pinned to different model
+    versions are never batched together during a swap.
+    """
+    if BATCH_MAX_SIZE <= 1:
+        return None
+    return BatchScheduler(executor, max_batch_size=BATCH_MAX_SIZE, max_wait_ms=BATCH_MAX_WAIT_MS)
+
+def pinned_slot():
+    """The model this request runs on, pinned on first use until the request ends.
+    
+    Outside a request (inference pool processes, scripts) the active model is used as is.
+    """
+    if not has_request_context():
+        slot = model_slots.current()
+    else:
+        slot = g.get('model_slot')
+        if slot is None:
+            slot = model_slots.acquire()
+            g.model_slot = slot
+    
+    if slot is None:
+        raise RuntimeError("Model not loaded")
+    return slot
+
+def endpoint_label():
+    """Endpoint name used as a metrics label (unmatched URLs share one label)."""
+    return request.endpoint or 'unmatched'
+
+def count_error(kind, endpoint=None):
+    errors_total.inc(endpoint=endpoint or endpoint_label(), type=kind)
+
+def json_response(payload):
+    """JSON response for a successful detection payload, timed as the serialize stage.
+    
+    Uses the fast encoder in postprocess (orjson) instead of ``jsonify``.
+    """
+    with stage('serialize'):
+        return Response(postprocess.dumps(payload), mimetype='application/json')
+
+def detection_response(payload):
+    """Successful /detect response in the format the ``Accept`` header asks for (JSON by default)."""
+    mimetype = response_formats.negotiate(request.accept_mimetypes)
+    if mimetype == response_formats.JSON:
+        response = json_response(payload)
+    else:
+        with stage('serialize'):
+            response = Response(response_formats.encode(payload, mimetype), mimetype=mimetype)
+    response.vary.add('Accept')
+    return response
+
+@app.before_request
+def start_request_timer():
+    start_timer()
+
+@app.after_request
+def record_request_metrics(response):
+    """Feed the request's total and per-stage timings into the metrics and Server-Timing."""
+    timer = current_timer()
+    if timer is not None:
+        endpoint = endpoint_label()
+        if SERVER_TIMING:
+            response.headers['Server-Timing'] = timer.server_timing()
+            # Lets pages on other origins read the timings too (CORS is open to all origins)
+            response.headers['Timing-Allow-Origin'] = '*'
+        # Streamed responses are timed up to their headers; their frames are timed per stage
+        request_duration.observe(timer.elapsed(), endpoint=endpoint)
+        for name, seconds in timer.stages.items():
+            stage_duration.observe(seconds, endpoint=endpoint, stage=name)
+        requests_total.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+        clear_timer()
+    return response
+
+def current_deadline():
+    """This request's monotonic deadline, or None (also outside requests)."""
+    return g.get('deadline') if has_request_context() else None
+
+def admit_request():
+    """Admission control for inference endpoints; returns an error response, or None to proceed."""
+    try:
+        deadline = parse_deadline(request.headers)
+    except ValueError as e:
+        count_error('invalid_deadline')
+        return jsonify({"error": f"Invalid deadline header: {e}", "success": False}), 400
+    
+    if not admission_controller.try_acquire():
+        logger.warning(f"Rejecting request: {admission_controller.in_flight} requests already in flight")
+        count_error('overloaded')
+        rejected_total.inc(endpoint=endpoint_label())
+        response = jsonify({"error": "Server is at capacity, retry shortly", "success": False})
+        response.headers['Retry-After'] = str(ADMISSION_RETRY_AFTER)
+        return response, 429
+    
+    g.admitted = True
+    g.deadline = deadline
+    if admission.expired(deadline):
+        return deadline_exceeded()
+    return None
+
+def deadline_exceeded():
+    """Response for a request dropped because its deadline passed."""
+    logger.info("Dropping request whose deadline has passed")
+    admission_controller.expired()
+    expired_total.inc(endpoint=endpoint_label())
+    count_error('deadline')
+    return jsonify({"error": "Deadline exceeded before inference", "success": False}), 504
+
+def take_session_turn(session):
+    """Queue this request behind the session's running frame; returns a response if it should not run."""
+    deadline = current_deadline()
+    timeout = max(0.0, deadline - time.monotonic()) if deadline is not None else SESSION_TURN_TIMEOUT
+    try:
+        if not session.claim_turn(timeout):
+            logger.debug(f"Frame superseded by a newer one from session {session.id}")
+            superseded_total.inc(endpoint=endpoint_label())
+            return detection_response({
+                "success": False,
+                "superseded": True,
+                "error": "Superseded by a newer frame from this session",
+                "timestamp": time.time()
+            })
+    except TimeoutError:
+        if admission.expired(deadline):
+            return deadline_exceeded()
+        count_error('session_timeout')
+        return jsonify({"error": "Timed out behind this session's previous frame", "success": False}), 503
+    
+    g.session_turn = session
+    return None
+
+@app.teardown_request
+def release_session_turn(exc):
+    session = g.pop('session_turn', None)
+    if session is not None:
+        session.release_turn()
+
+@app.teardown_request
+def release_admission(exc):
+    if g.pop('admitted', False):
+        admission_controller.release()
+
+@app.teardown_request
+def release_model_slot(exc):
+    """Let a retired model drain once the request that pinned it is done."""
+    slot = g.pop('model_slot', None)
+    if slot is not None:
+        slot.release()
+
+def run_model(img, slot=None):
+    """Run inference on a single image, sharing a forward pass with concurrent requests."""
+    return [(slot or pinned_slot()).run(img, current_deadline())]
+
+def run_model_many(imgs, slot=None):
+    """Run inference on several images in a single forward pass, one result per image."""
+    return (slot or pinned_slot()).run_many(imgs, current_deadline())
+
+def detect_local(img, slot=None):
+    """Run the model in this process on a decoded RGB image and return its detections."""
+    with stage('inference'):
+        results = run_model(img, slot)
+    
+    if results is None:
+        raise RuntimeError("Model returned None results")
+    
+    with stage('postprocess'):
+        return format_detections(results)
+
+def detect_image(img, slot=None):
+    """Run the shared /detect inference path on a decoded RGB image."""
+    if inference_pool is not None:
+        admission.check(current_deadline(), "forward pass")
+        # Postprocessing happens in the inference process, so it is part of this stage
+        with stage('inference'):
+            return inference_pool.detect_frame(img)
+    return detect_local(img, slot)
+
+def detect_images(imgs, slot=None):
+    """Run several decoded RGB images together, one detections list per image."""
+    if inference_pool is not None:
+        admission.check(current_deadline(), "forward pass")
+        with stage('inference'):
+            return inference_pool.detect_frames(imgs)
+    with stage('inference'):
+        results = run_model_many(imgs, slot)
+    with stage('postprocess'):
+        return [format_detections([result]) for result in results]
+
+def init_inference_process(index):
+    """Set up one inference pool process forked from the loaded app."""
+    apply_thread_budget(*thread_budget(INFERENCE_PROCESSES))
+    init_worker()
+
+def detect_session_image(session, img, slot=None):
+    """Run detect_image() unless the session's frame is unchanged since its last inference.
+    
+    Returns ``(detections, reused)``.
+    """
+    slot = slot or pinned_slot()
+    detections, fingerprint = frame_gate.check(session, img, slot.version)
+    if detections is not None:
+        return detections, True
+    
+    detections = detect_image(img, slot)
+    frame_gate.record(session, fingerprint, detections, slot.version)
+    return detections, False
+
+def format_detections(results):
+    """Convert the model results for one image into the /detect detections list."""
+    detections = postprocess.format_detections(results, ACTION_CLASS_NAMES)
+    logger.debug(f"Postprocessed {len(detections)} detections")
+    return detections
+
+def init_worker():
+    """Per-worker setup after gunicorn forks a preloaded app (see gunicorn.conf.py).
+    
+    PyTorch weights loaded in the master are shared copy-on-write and need nothing.
+    Exported-backend sessions own native thread pools that do not survive a fork,
+    so they are rebuilt here with the worker's thread budget.
+    """
+    global model, inference_executor
+    
+    slot = model_slots.current()
+    if slot is None or slot.backend == 'pytorch':
+        return
+    
+    import torch
+    from ultralytics import YOLO
+    
+    threads = torch.get_num_threads()
+    if slot.lean_engine is not None:
+        runtime = slot.lean_engine.runtime
+        slot.lean_engine.runtime = type(runtime)(runtime.path, threads=threads)
+    else:
+        slot.model = model = YOLO(artifact_path(slot.path, slot.backend), task=slot.model.task)
+    # No requests have reached this process yet, so the slot can be updated in place
+    slot.executor = inference_executor = build_executor(slot.model, slot.lean_engine, slot.imgsz)
+    if slot.scheduler is not None:
+        slot.scheduler.run_batch = slot.executor
+    logger.info(f"Rebuilt {slot.backend} runtime in worker {os.getpid()} with {threads} threads")
+
+def start_inference_pool():
+    """Fork the inference processes from this (model-holding) process."""
+    global inference_pool
+    
+    pool = InferencePool(
+        # Each inference process serves one frame at a time, so skip the batch scheduler's wait
+        lambda img: format_detections(model_slots.current().run_batch([img])),
+        processes=INFERENCE_PROCESSES,
+        slots=INFERENCE_POOL_SLOTS,
+        max_frame_bytes=INFERENCE_POOL_FRAME_BYTES,
+        timeout=INFERENCE_POOL_TIMEOUT,
+        init_process=init_inference_process
+    )
+    pool.start()
+    inference_pool = pool
+
+# Load the model on startup. By default this happens on a background thread so the server
+# binds its port right away; the gunicorn master (preload) and the inference pool need the
+# model before they fork, so those load synchronously.
+if MODEL_BACKGROUND_LOAD and INFERENCE_PROCESSES == 0:
+    load_model_in_background()
+else:
+    success, message = load_model()
+    if success and INFERENCE_PROCESSES > 0:
+        start_inference_pool()
+
+def model_ready():
+    """True once a model is loaded and warmed up for inference."""
+    return model_slots.current() is not None
+
+def model_unavailable():
+    """Response for inference endpoints when there is no model to run."""
+    count_error('model_unavailable')
+    if model_loading:
+        logger.warning("Request received while the model is loading")
+        response = jsonify({
+            "error": "Model is loading",
+            "status": "loading",
+            "model_path": model_path
+        })
+        response.headers['Retry-After'] = '1'
+        return response, 503
+    
+    logger.error("Model not loaded")
+    return jsonify({
+        "error": "Model not loaded", 
+        "model_path": model_path,
+        "model_error": model_error
+    }), 500
 
 @app.route('/', methods=['GET'])
 def index():
@@ -120,21 +730,30 @@ def health_check():
     """Endpoint to check if the server is running and model is loaded."""
     global model, model_path, model_error, model_loading
     
-    if model_loading:
-        return jsonify({
+    # Not ready for traffic until the first model has finished warming up
+    if model_loading and not model_ready():
+        response = jsonify({
             "status": "loading", 
             "model_loaded": False,
             "model_path": model_path,
             "message": "Model is currently loading"
         })
+        response.headers['Retry-After'] = '1'
+        return response, 503
     
-    if model is not None and hasattr(model, 'names'):
-        return jsonify({
+    # A reload warms the new model up on the side, so the current one stays healthy meanwhile
+    if model_ready() and hasattr(model, 'names'):
+        response = {
             "status": "healthy", 
             "model_loaded": True,
             "model_path": model_path,
-            "model_classes": list(model.names.values()) if model.names else []
-        })
+            "model_version": current_model_version,
+            "model_classes": list(model.names.values()) if model.names else [],
+            "reloading": model_loading
+        }
+        if model_error:
+            response["last_reload_error"] = model_error
+        return jsonify(response)
     else:
         return jsonify({
             "status": "unhealthy", 
@@ -146,15 +765,30 @@ def health_check():
 
 @app.route('/reload_model', methods=['POST'])
 def reload_model():
-    """Endpoint to reload the model."""
-    global model_path
+    """Endpoint to reload the model.
+    
+    The new model is loaded and warmed up while the current one keeps serving,
+    then swapped in; requests already running finish on the model they started
+    with. If the load fails the current model stays active.
+    """
+    if inference_pool is not None:
+        return jsonify({
+            "success": False,
+            "error": "Inference processes keep the model they were started with; restart the server to reload"
+        }), 409
     
-    # Check if a new model path is provided
+    if _load_lock.locked():
+        return jsonify({
+            "success": False,
+            "error": "Model is already loading"
+        }), 409
+    
+    # Check if a new model path is provided (it only becomes model_path once it loads)
+    new_path = model_path
     if request.json and 'model_path' in request.json:
         new_path = request.json['model_path']
         if os.path.exists(new_path):
-            model_path = new_path
-            logger.info(f"Updated model path to {model_path}")
+            logger.info(f"Reloading model from {new_path}")
         else:
             return jsonify({
                 "success": False,
@@ -162,18 +796,13 @@ def reload_model():
             }), 400
     
     # Load the model in a separate thread to avoid blocking
-    def load_model_thread():
-        success, message = load_model()
-        logger.info(f"Model reload {'succeeded' if success else 'failed'}: {message}")
-    
-    thread = threading.Thread(target=load_model_thread)
-    thread.daemon = True
-    thread.start()
+    load_model_in_background(new_path)
     
     return jsonify({
         "success": True,
         "message": "Model reload initiated",
-        "model_path": model_path
+        "model_path": new_path,
+        "model_version": current_model_version
     })
 
 @app.route('/detect', methods=['POST'])
@@ -183,206 +812,494 @@ def detect_signs():
     
     logger.info("Received detect request")
     
-    if model is None:
-        logger.error("Model not loaded")
+    if not model_ready():
+        return model_unavailable()
+    
+    rejection = admit_request()
+    if rejection is not None:
+        return rejection
+    
+    # Everything below runs on (and reports) the model that is active now, even if a reload swaps it
+    slot = pinned_slot()
+    
+    try:
+        # Read the payload (for multipart bodies, touching request.files parses the form)
+        with stage('read'):
+            # Log request details
+            logger.debug(f"Request content type: {request.content_type}")
+            logger.debug(f"Request has files: {len(request.files) > 0}")
+            logger.debug(f"Request has JSON: {request.is_json}")
+            
+            # Get raw image payload from request
+            raw_data = None
+            
+            if 'image' in request.files:
+                logger.debug("Processing image from files")
+                file = request.files['image']
+                logger.debug(f"Received file: {file.filename}, content type: {file.content_type}")
+                
+                # Read file data
+                raw_data = file.read()
+                logger.debug(f"File data length: {len(raw_data)} bytes")
+                decode = decode_image_bytes
+                
+            elif request.mimetype == 'application/octet-stream':
+                logger.debug("Processing raw RGB image from body")
+                raw_data = request.get_data()
+                logger.debug(f"Raw data length: {len(raw_data)} bytes")
+                decode = decode_raw_rgb
+                
+            elif request.is_json and 'image' in request.json:
+                logger.debug("Processing image from JSON")
+                raw_data = request.json['image']
+                
+                # Check if it's a base64 string
+                if not isinstance(raw_data, str):
+                    logger.error("JSON image data is not a string")
+                    count_error('invalid_payload')
+                    return jsonify({"error": "Invalid image format in JSON"}), 400
+                decode = decode_base64_image
+            else:
+                logger.error("No image provided in request")
+                count_error('no_image')
+                return jsonify({"error": "No image provided"}), 400
+        
+        return detect_payload(slot, raw_data, decode)
+    
+    except Exception as e:
+        logger.error(f"Error during detection: {e}")
+        logger.error(traceback.format_exc())
+        count_error('internal')
         return jsonify({
-            "error": "Model not loaded", 
-            "model_path": model_path,
-            "model_error": model_error
+            "error": str(e),
+            "traceback": traceback.format_exc(),
+            "success": False
         }), 500
+
+def detect_payload(slot, raw_data, decode, kind='detect', what='image'):
+    """The /detect pipeline once the request payload has been read; returns the response.
+    
+    ``decode(raw_data, target_size)`` turns the payload into an RGB frame.
+    ``kind`` keeps the result cache entries of different payload types apart
+    and ``what`` names the payload in error messages.
+    """
+    # Latest frame wins: wait behind this session's running frame unless a newer one replaces us
+    session_id = request.headers.get('X-Session-Id')
+    session = session_store.get(session_id) if session_id else None
+    if session is not None and LATEST_FRAME_WINS:
+        rejection = take_session_turn(session)
+        if rejection is not None:
+            return rejection
+    
+    # Identical uploads for the same model version are answered from the cache
+    cache_key = result_cache.make_key(raw_data, slot.version, kind)
+    detections = result_cache.get(cache_key)
+    if detections is not None:
+        logger.debug("Returning cached detections")
+        return detection_response({
+            "success": True,
+            "detections": detections,
+            "cached": True,
+            "model_version": slot.version,
+            "timestamp": time.time()
+        })
     
     try:
-        # Log request details
-        logger.debug(f"Request content type: {request.content_type}")
-        logger.debug(f"Request has files: {len(request.files) > 0}")
-        logger.debug(f"Request has JSON: {request.is_json}")
-        
-        # Get image from request
-        img = None
-        
-        if 'image' in request.files:
-            logger.debug("Processing image from files")
-            file = request.files['image']
-            logger.debug(f"Received file: {file.filename}, content type: {file.content_type}")
-            
-            # Read file data
-            file_data = file.read()
-            logger.debug(f"File data length: {len(file_data)} bytes")
+        # imdecode/color/base64 (or rasterize) are also timed on their own inside this stage
+        with stage('decode'):
+            img = decode(raw_data, decode_target_size())
+        logger.debug(f"Decoded image, shape: {img.shape if img is not None else 'None'}")
+    except Exception as e:
+        logger.error(f"Error decoding {what} payload: {e}")
+        count_error('decode')
+        return jsonify({"error": f"Invalid {what} payload: {str(e)}"}), 400
+    
+    if img is None:
+        logger.error("Failed to decode image")
+        count_error('decode')
+        return jsonify({"error": "Failed to decode image"}), 400
+    
+    # Skip inference when this session's frame has not meaningfully changed
+    detections, fingerprint = frame_gate.check(session, img, slot.version)
+    if detections is not None:
+        logger.debug(f"Frame unchanged for session {session_id}, reusing previous result")
+        return detection_response({
+            "success": True,
+            "detections": detections,
+            "reused": True,
+            "model_version": slot.version,
+            "timestamp": time.time()
+        })
+    
+    # Reading and decoding took time too; do not start a forward pass nobody will wait for
+    if admission.expired(current_deadline()):
+        return deadline_exceeded()
+    
+    logger.info(f"Running inference on image with shape {img.shape}")
+    
+    # Run inference with explicit error handling; concurrent identical uploads share one run
+    try:
+        detections, cached = result_cache.get_or_compute(cache_key, lambda: detect_image(img, slot),
+                                                         deadline=current_deadline())
+    except DeadlineExceeded:
+        return deadline_exceeded()
+    except Exception as e:
+        logger.error(f"Error during model inference: {e}")
+        logger.error(traceback.format_exc())
+        count_error('inference')
+        return jsonify({
+            "error": f"Model inference failed: {str(e)}",
+            "traceback": traceback.format_exc(),
+            "success": False
+        }), 500
+    
+    frame_gate.record(session, fingerprint, detections, slot.version)
+    
+    # Hand sampled frames to the background recorder for debugging
+    if not cached:
+        debug_recorder.capture(img, detections, session_id=session_id)
+    
+    return detection_response({
+        "success": True,
+        "detections": detections,
+        "cached": cached,
+        "model_version": slot.version,
+        "timestamp": time.time()
+    })
+
+@app.route('/detect_landmarks', methods=['POST'])
+def detect_landmarks():
+    """Endpoint to detect signs from MediaPipe hand and face landmarks.
+    
+    The landmarks are drawn the way ``ML/ds.py`` drew the training images and
+    the drawing is classified like a decoded /detect upload. The body is JSON
+    or the compact ``application/vnd.signserenade.landmarks`` format (see
+    ``landmarks.py``). Sessions, caching, deadlines and response formats work
+    as for /detect.
+    """
+    global model
+    
+    logger.info("Received detect_landmarks request")
+    
+    if not model_ready():
+        return model_unavailable()
+    
+    rejection = admit_request()
+    if rejection is not None:
+        return rejection
+    
+    slot = pinned_slot()
+    
+    try:
+        with stage('read'):
+            raw_data = request.get_data()
             
-            # Convert to numpy array
-            nparr = np.frombuffer(file_data, np.uint8)
-            img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+            if not raw_data:
+                logger.error("No landmarks provided in request")
+                count_error('no_image')
+                return jsonify({"error": "No landmarks provided"}), 400
             
-            if img is None:
-                logger.error("Failed to decode image")
-                return jsonify({"error": "Failed to decode image"}), 400
-                
-            logger.debug(f"Image shape: {img.shape}")
+            try:
+                parsed = landmarks.decode(raw_data, request.mimetype)
+            except (TypeError, ValueError) as e:
+                logger.error(f"Invalid landmark payload: {e}")
+                count_error('invalid_payload')
+                return jsonify({"error": f"Invalid landmark payload: {str(e)}"}), 400
+        
+        def decode(data, target_size):
+            # Drawn straight at the size the image decoders would reduce to
+            with stage('rasterize'):
+                return landmarks.rasterize(parsed, target_size)
+        
+        return detect_payload(slot, raw_data, decode, kind='landmarks', what='landmark')
+    
+    except Exception as e:
+        logger.error(f"Error during landmark detection: {e}")
+        logger.error(traceback.format_exc())
+        count_error('internal')
+        return jsonify({
+            "error": str(e),
+            "traceback": traceback.format_exc(),
+            "success": False
+        }), 500
+
+@app.route('/detect_batch', methods=['POST'])
+def detect_signs_batch():
+    """Endpoint to detect signs in several images with a single forward pass.
+    
+    Accepts multipart ``image[]`` fields, or a JSON array of base64 strings
+    (either the body itself or under an ``images`` key). Returns one entry per
+    input image, in order, using the same detections schema as /detect.
+    """
+    global model
+    
+    logger.info("Received detect_batch request")
+    
+    if not model_ready():
+        return model_unavailable()
+    
+    rejection = admit_request()
+    if rejection is not None:
+        return rejection
+    
+    slot = pinned_slot()
+    
+    try:
+        # Collect the raw inputs, decoding each one independently
+        decoded = []
+        
+        files = request.files.getlist('image[]') or request.files.getlist('image')
+        if files:
+            logger.debug(f"Processing {len(files)} images from files")
+            for file in files:
+                try:
+                    decoded.append(decode_image_bytes(file.read(), decode_target_size()))
+                except Exception as e:
+                    logger.error(f"Error decoding uploaded image {file.filename!r}: {e}")
+                    decoded.append(None)
+        elif request.is_json:
+            payload = request.get_json(silent=True)
+            images = payload.get('images') if isinstance(payload, dict) else payload
             
-        elif request.is_json and 'image' in request.json:
-            logger.debug("Processing image from JSON")
-            image_data = request.json['image']
+            if not isinstance(images, list) or not all(isinstance(i, str) for i in images):
+                logger.error("JSON images must be an array of base64 strings")
+                return jsonify({"error": "Invalid images format in JSON"}), 400
             
-            # Check if it's a base64 string
-            if isinstance(image_data, str):
-                if ',' in image_data:
-                    image_data = image_data.split(',')[1]
+            logger.debug(f"Processing {len(images)} images from JSON")
+            for image_data in images:
                 try:
-                    image_data = base64.b64decode(image_data)
-                    nparr = np.frombuffer(image_data, np.uint8)
-                    img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-                    logger.debug(f"Decoded base64 image, shape: {img.shape if img is not None else 'None'}")
+                    decoded.append(decode_base64_image(image_data, decode_target_size()))
                 except Exception as e:
                     logger.error(f"Error decoding base64 image: {e}")
-                    return jsonify({"error": f"Invalid base64 image: {str(e)}"}), 400
-            else:
-                logger.error("JSON image data is not a string")
-                return jsonify({"error": "Invalid image format in JSON"}), 400
+                    decoded.append(None)
         else:
-            logger.error("No image provided in request")
-            return jsonify({"error": "No image provided"}), 400
+            logger.error("No images provided in request")
+            return jsonify({"error": "No images provided"}), 400
         
-        if img is None:
-            logger.error("Failed to process image")
-            return jsonify({"error": "Failed to process image"}), 400
-            
-        # Save the image for debugging (optional)
-        debug_path = "debug_image.jpg"
-        cv2.imwrite(debug_path, img)
-        logger.debug(f"Saved debug image to {debug_path}")
+        if not decoded:
+            return jsonify({"error": "No images provided"}), 400
         
-        logger.info(f"Running inference on image with shape {img.shape}")
+        if len(decoded) > DETECT_BATCH_MAX_IMAGES:
+            return jsonify({
+                "error": f"Too many images: {len(decoded)} (max {DETECT_BATCH_MAX_IMAGES})"
+            }), 413
         
-        # Run inference with explicit error handling
-        try:
-            # Convert to RGB for YOLO
-            img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-            results = model(img_rgb)
-            
-            if results is None:
-                logger.error("Model returned None results")
+        # Only valid images go to the model; keep their positions for the response
+        valid = [(i, img) for i, img in enumerate(decoded) if img is not None]
+        
+        logger.info(f"Running batched inference on {len(valid)} of {len(decoded)} images")
+        
+        if admission.expired(current_deadline()):
+            return deadline_exceeded()
+        
+        batch_results = []
+        if valid:
+            try:
+                batch_results = detect_images([img for _, img in valid], slot)
+            except DeadlineExceeded:
+                return deadline_exceeded()
+            except Exception as e:
+                logger.error(f"Error during model inference: {e}")
+                logger.error(traceback.format_exc())
+                count_error('inference')
                 return jsonify({
-                    "error": "Model returned None results",
+                    "error": f"Model inference failed: {str(e)}",
+                    "traceback": traceback.format_exc(),
                     "success": False
                 }), 500
-                
-        except Exception as e:
-            logger.error(f"Error during model inference: {e}")
-            logger.error(traceback.format_exc())
-            return jsonify({
-                "error": f"Model inference failed: {str(e)}",
-                "traceback": traceback.format_exc(),
-                "success": False
-            }), 500
         
-        # Process results
-        detections = []
-        
-        # Check if we have classification results
-        if hasattr(results[0], 'probs') and results[0].probs is not None:
-            # This is a classification model
-            probs = results[0].probs.data.cpu().numpy()
-            
-            # Get top 5 predictions
-            top_indices = probs.argsort()[-5:][::-1]
-            
-            for idx in top_indices:
-                confidence = float(probs[idx])
-                if confidence > 0.01:  # Only include predictions with >1% confidence
-                    class_name = ACTION_NAMES.get(idx, f"unknown_{idx}")
-                    detections.append({
-                        "class_id": int(idx),
-                        "class_name": class_name,
-                        "confidence": confidence
-                    })
-            
-            logger.info(f"Classification detected {len(detections)} classes")
-            return jsonify({
+        entries = [{"success": False, "error": "Failed to decode image"} for _ in decoded]
+        for (i, _), detections in zip(valid, batch_results):
+            entries[i] = {
                 "success": True,
-                "detections": detections,
-                "timestamp": time.time()
-            })
-        
-        # If not classification, try object detection results
-        # Verify results structure
-        if not hasattr(results, '__iter__'):
-            logger.error(f"Results is not iterable: {type(results)}")
-            return jsonify({
-                "error": f"Invalid results format: {type(results)}",
-                "success": False
-            }), 500
-            
-        for i, result in enumerate(results):
-            if not hasattr(result, 'boxes'):
-                logger.error(f"Result {i+1} has no boxes attribute")
-                continue
-                
-            boxes = result.boxes
-            
-            # Check if boxes is None or empty
-            if boxes is None:
-                logger.warning(f"Boxes is None for result {i+1}")
-                continue
-                
-            # Try to get the length to verify it's iterable
-            try:
-                num_boxes = len(boxes)
-                logger.debug(f"Found {num_boxes} boxes in result {i+1}")
-            except TypeError:
-                logger.error(f"Boxes is not iterable in result {i+1}")
-                continue
-                
-            if num_boxes == 0:
-                logger.debug(f"No detections in result {i+1}")
-                continue
-                
-            for j, box in enumerate(boxes):
-                try:
-                    x1, y1, x2, y2 = box.xyxy[0].tolist()
-                    confidence = float(box.conf[0])
-                    class_id = int(box.cls[0])
-                    
-                    # Safely get class name
-                    if class_id in result.names:
-                        class_name = result.names[class_id]
-                    else:
-                        logger.warning(f"Class ID {class_id} not found in names dictionary")
-                        class_name = f"unknown_{class_id}"
-                    
-                    logger.debug(f"Detection {j+1}: {class_name} ({confidence:.2f}) at [{x1:.1f}, {y1:.1f}, {x2:.1f}, {y2:.1f}]")
-                    
-                    detections.append({
-                        "class_id": class_id,
-                        "class_name": class_name,
-                        "confidence": confidence,
-                        "bbox": [x1, y1, x2, y2]
-                    })
-                except Exception as e:
-                    logger.error(f"Error processing box {j+1}: {e}")
-                    continue
+                "detections": detections
+            }
         
-        logger.info(f"Detected {len(detections)} objects")
-        return jsonify({
+        return json_response({
             "success": True,
-            "detections": detections,
+            "results": entries,
+            "count": len(entries),
+            "model_version": slot.version,
             "timestamp": time.time()
         })
     
     except Exception as e:
-        logger.error(f"Error during detection: {e}")
+        logger.error(f"Error during batch detection: {e}")
         logger.error(traceback.format_exc())
+        count_error('internal')
         return jsonify({
             "error": str(e),
             "traceback": traceback.format_exc(),
             "success": False
         }), 500
 
+def process_stream_frame(session, data, endpoint=None):
+    """Run detection on one /stream frame and return its result line as a dict.
+    
+    Shared by the Flask route and the ASGI stream handler; ``endpoint`` labels
+    error metrics when there is no Flask request to take it from.
+    """
+    # Touch the session on every frame so active streams are never evicted as idle
+    session.frames += 1
+    
+    # A session with a frame in flight is never evicted (see SessionStore)
+    with session.in_use():
+        try:
+            img = decode_image_bytes(data, decode_target_size())
+            if img is None:
+                count_error('decode', endpoint)
+                return {"frame": session.frames, "success": False, "error": "Failed to decode image"}
+            
+            # Pin per frame so a long stream moves to a reloaded model at the next frame
+            with model_slots.use() as slot:
+                if slot is None:
+                    raise RuntimeError("Model not loaded")
+                detections, reused = detect_session_image(session, img, slot)
+            return {
+                "frame": session.frames,
+                "success": True,
+                "detections": detections,
+                "reused": reused,
+                "model_version": slot.version,
+                "timestamp": time.time()
+            }
+        except Exception as e:
+            logger.error(f"Error processing stream frame: {e}")
+            count_error('inference', endpoint)
+            return {"frame": session.frames, "success": False, "error": str(e)}
+
+@app.route('/stream', methods=['POST'])
+def detect_stream():
+    """Endpoint to run detection on a continuous stream of frames.
+    
+    The request body is a sequence of length-prefixed frames: a 4-byte
+    big-endian length followed by that many bytes of JPEG/PNG data. A zero
+    length (or the end of the body) closes the stream. One JSON line is
+    pushed back per frame as soon as it has been processed. The session id
+    comes from the ``X-Session-Id`` header or ``session_id`` query parameter,
+    and is generated when absent.
+    """
+    global model
+    
+    if not model_ready():
+        return model_unavailable()
+    
+    session_id = (request.headers.get('X-Session-Id') or request.args.get('session_id')
+                  or SessionStore.new_id())
+    stream = request.stream
+    
+    logger.info(f"Opened stream for session {session_id}")
+    
+    def read_exact(size):
+        chunks = []
+        while size > 0:
+            chunk = stream.read(size)
+            if not chunk:
+                return None
+            chunks.append(chunk)
+            size -= len(chunk)
+        return b"".join(chunks)
+    
+    def generate():
+        while True:
+            header = read_exact(4)
+            if header is None:
+                break
+            
+            (length,) = struct.unpack('>I', header)
+            if length == 0:
+                break
+            
+            if length > STREAM_MAX_FRAME_BYTES:
+                logger.error(f"Stream frame of {length} bytes exceeds limit")
+                yield postprocess.dumps({
+                    "success": False,
+                    "error": f"Frame too large: {length} bytes (max {STREAM_MAX_FRAME_BYTES})"
+                }) + b"\n"
+                break
+            
+            data = read_exact(length)
+            if data is None:
+                break
+            
+            line = process_stream_frame(session_store.get(session_id), data)
+            yield postprocess.dumps(line) + b"\n"
+        
+        logger.info(f"Closed stream for session {session_id}")
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson',
+                    headers={'X-Session-Id': session_id})
+
+@app.route('/session_stats', methods=['GET'])
+def session_stats():
+    """Endpoint to report client session counters."""
+    return jsonify(session_store.stats())
+
+@app.route('/frame_gate', methods=['GET', 'POST'])
+def frame_gate_settings():
+    """Endpoint to read frame-gating skip counters or update its settings.
+    
+    POST a JSON body with ``threshold`` and/or ``enabled`` to change them at runtime.
+    """
+    if request.method == 'POST':
+        settings = request.get_json(silent=True) or {}
+        if not isinstance(settings, dict):
+            return jsonify({"error": "Frame gate settings must be a JSON object"}), 400
+        try:
+            frame_gate.configure(threshold=settings.get('threshold'), enabled=settings.get('enabled'))
+        except (TypeError, ValueError) as e:
+            return jsonify({"error": f"Invalid frame gate settings: {str(e)}"}), 400
+        logger.info(f"Updated frame gate settings: {settings}")
+    
+    return jsonify(frame_gate.stats())
+
+@app.route('/cache_stats', methods=['GET'])
+def cache_stats():
+    """Endpoint to report result cache hit/miss/eviction counters."""
+    stats = result_cache.stats()
+    stats["model_version"] = current_model_version
+    return jsonify(stats)
+
+@app.route('/debug_captures', methods=['GET'])
+def debug_captures():
+    """Endpoint to report debug capture counters and the frames in the on-disk ring."""
+    stats = debug_recorder.stats()
+    stats["captures"] = debug_recorder.recent()
+    return jsonify(stats)
+
+@app.route('/batch_stats', methods=['GET'])
+def batch_stats():
+    """Endpoint to report micro-batching counters, batch-size distribution and predictor usage."""
+    executor_stats = inference_executor.stats() if inference_executor is not None else None
+    if batch_scheduler is None:
+        return jsonify({"enabled": False, "executor": executor_stats})
+    
+    stats = batch_scheduler.stats()
+    stats["enabled"] = True
+    stats["executor"] = executor_stats
+    return jsonify(stats)
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus metrics for this worker process."""
+    return Response(metrics_registry.render(), content_type=Registry.CONTENT_TYPE)
+
+@app.route('/inference_pool', methods=['GET'])
+def inference_pool_stats():
+    """Endpoint to report inference process pool counters."""
+    if inference_pool is None:
+        return jsonify({"enabled": False})
+    
+    stats = inference_pool.stats()
+    stats["enabled"] = True
+    return jsonify(stats)
+
 @app.route('/model_info', methods=['GET'])
 def model_info():
     """Endpoint to get information about the loaded model."""
     global model, model_path, model_error, model_loading
     
-    if model_loading:
+    if model_loading and not model_ready():
         return jsonify({
             "loaded": False,
             "loading": True,
@@ -409,8 +1326,22 @@ def model_info():
             "model_classes": model.names if has_names else {},
             "num_classes": len(model.names) if has_names else 0,
             "class_names": list(model.names.values()) if has_names else [],
-            "pytorch_version": torch.__version__,
-            "ultralytics_available": True
+            # Names for the class_id values in /detect responses (binary formats omit class_name)
+            "detection_class_names": ACTION_NAMES if getattr(model, 'task', None) == 'classify' else (model.names if has_names else {}),
+            "response_formats": response_formats.available(),
+            # Payloads /detect_landmarks accepts
+            "landmark_input_formats": ['application/json', landmarks.MIMETYPE],
+            "pytorch_version": sys.modules['torch'].__version__,
+            "ultralytics_available": True,
+            "inference_backend": active_backend,
+            # Set when INFERENCE_BACKEND could not be used and the model runs on pytorch instead
+            "requested_inference_backend": INFERENCE_BACKEND,
+            "inference_backend_error": backend_error,
+            "lean_engine": lean_engine is not None,
+            "imgsz": model_imgsz,
+            "model_version": current_model_version,
+            "reloading": model_loading,
+            "serving": model_slots.stats()
         })
     except Exception as e:
         logger.error(f"Error getting model info: {e}")
@@ -444,7 +1375,7 @@ def test_detect():
         
         # Run inference with explicit error handling
         try:
-            results = model(img)
+            results = run_model(img)
             
             if results is None:
                 logger.error("Model returned None results")
@@ -462,63 +1393,8 @@ def test_detect():
                 "success": False
             }), 500
         
-        # Process results
-        detections = []
-        
-        # Verify results structure
-        if not hasattr(results, '__iter__'):
-            logger.error(f"Results is not iterable: {type(results)}")
-            return jsonify({
-                "error": f"Invalid results format: {type(results)}",
-                "success": False
-            }), 500
-            
-        for result in results:
-            if not hasattr(result, 'boxes'):
-                logger.error("Result has no boxes attribute")
-                continue
-                
-            boxes = result.boxes
-            
-            # Check if boxes is None or empty
-            if boxes is None:
-                logger.warning("Boxes is None for this result")
-                continue
-                
-            # Try to get the length to verify it's iterable
-            try:
-                num_boxes = len(boxes)
-                logger.debug(f"Found {num_boxes} boxes")
-            except TypeError:
-                logger.error("Boxes is not iterable")
-                continue
-                
-            if num_boxes == 0:
-                logger.debug("No detections in this result")
-                continue
-                
-            for box in boxes:
-                try:
-                    x1, y1, x2, y2 = box.xyxy[0].tolist()
-                    confidence = float(box.conf[0])
-                    class_id = int(box.cls[0])
-                    
-                    # Safely get class name
-                    if class_id in result.names:
-                        class_name = result.names[class_id]
-                    else:
-                        logger.warning(f"Class ID {class_id} not found in names dictionary")
-                        class_name = f"unknown_{class_id}"
-                    
-                    detections.append({
-                        "class_id": class_id,
-                        "class_name": class_name,
-                        "confidence": confidence,
-                        "bbox": [x1, y1, x2, y2]
-                    })
-                except Exception as e:
-                    logger.error(f"Error processing box: {e}")
-                    continue
+        # Same postprocessing as /detect
+        detections = format_detections(results)
         
         # Even if no detections, return success
         return jsonify({
@@ -544,6 +1420,8 @@ def test_detect():
 @app.route('/model_version', methods=['GET'])
 def model_version():
     """Endpoint to get version information."""
+    import torch
+    
     return jsonify({
         "pytorch_version": torch.__version__,
         "opencv_version": cv2.__version__,
@@ -552,7 +1430,40 @@ def model_version():
         "server_time": time.strftime("%Y-%m-%d %H:%M:%S")
     })
 
+@app.route('/debug/profile', methods=['GET'])
+def debug_profile():
+    """Sample this worker's thread stacks for ``seconds`` and return collapsed stacks.
+    
+    Query parameters: ``seconds`` (default 10, capped by DEBUG_PROFILE_MAX_SECONDS),
+    ``interval_ms`` (default DEBUG_PROFILE_INTERVAL_MS) and ``idle=1`` to keep
+    threads that are only waiting for work. The text body feeds straight into
+    flamegraph.pl or speedscope; ``format=json`` returns the stacks with a summary.
+    """
+    if not DEBUG_PROFILE_ENABLED:
+        return jsonify({"error": "Profiling is disabled (set DEBUG_PROFILE_ENABLED=1)"}), 404
+    
+    include_idle = request.args.get('idle', '0').lower() in ('1', 'true', 'yes')
+    try:
+        seconds = float(request.args.get('seconds', 10))
+        interval_ms = request.args.get('interval_ms')
+        interval = float(interval_ms) / 1000.0 if interval_ms else None
+        logger.info(f"Profiling worker {os.getpid()} for {seconds} seconds")
+        stacks, summary = profiler.run(seconds, interval=interval, include_idle=include_idle)
+    except ValueError as e:
+        return jsonify({"error": f"Invalid profile parameters: {e}"}), 400
+    except ProfilerBusyError as e:
+        return jsonify({"error": str(e)}), 409
+    
+    summary["model_version"] = current_model_version
+    summary["backend"] = active_backend
+    if request.args.get('format') == 'json':
+        return jsonify({"summary": summary, "stacks": dict(stacks.most_common())})
+    
+    headers = {f"X-Profile-{key.replace('_', '-').title()}": str(value) for key, value in summary.items()}
+    return Response(collapse(stacks), mimetype='text/plain', headers=headers)
+
 @app.route('/debug_model', methods=['POST'])
+@app.route('/debug/model', methods=['POST'])
 def debug_model():
     """Endpoint to debug model results structure."""
     global model
@@ -566,13 +1477,14 @@ def debug_model():
         cv2.rectangle(img, (100, 100), (300, 300), (255, 255, 255), -1)
         
         # Run inference
-        results = model(img)
+        results = run_model(img)
         
         # Collect debug info
         debug_info = {
             "results_type": str(type(results)),
             "results_dir": str(dir(results)),
             "is_iterable": hasattr(results, '__iter__'),
+            "lean_engine": lean_engine is not None,
             "items": []
         }
         
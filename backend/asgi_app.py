@@ -0,0 +1,297 @@
+"""
+ASGI entry point: the same API served by an async server (uvicorn).
+
+Under gunicorn's threaded workers every open connection holds a request
+thread, including the time spent receiving an upload from a slow client and
+the whole life of a ``/stream`` session. Here connections live on the event
+loop instead, and threads are only used to run the app:
+
+- ``/stream`` is handled natively. Frames are read from the request body on
+  the event loop, and each one is decoded and run through the model on the
+  inference executor, so an idle stream costs a coroutine, not a thread.
+- Every other route (``/detect``, ``/detect_batch``, ``/health``,
+  ``/model_info``, ``/reload_model``, ``/metrics`` ...) is the Flask app
+  itself. Its request body is received on the event loop, then the Flask view
+  runs on the inference executor with the body already in memory, so
+  admission control, deadlines, sessions, metrics and response formats behave
+  exactly as under gunicorn.
+
+The executor is bounded: ``ASGI_EXECUTOR_THREADS`` threads (default 12; keep
+it above ``ADMISSION_MAX_IN_FLIGHT`` so spare threads can answer 429s and
+health checks) and at most ``ASGI_MAX_PENDING`` requests waiting for one
+(default 64) before further requests get an immediate ``429``. Request bodies
+larger than ``ASGI_MAX_BODY_BYTES`` (default 16 MiB) get a ``413``.
+
+Run it with uvicorn, or with gunicorn and uvicorn workers to keep the
+preload and per-worker setup of ``gunicorn.conf.py``::
+
+    uvicorn asgi_app:app --host 0.0.0.0 --port 8000
+    gunicorn -c gunicorn.conf.py -k uvicorn_worker.UvicornWorker asgi_app:app
+
+The packages this entry point needs are in ``requirements-asgi.txt``;
+``app:app`` keeps working without them.
+"""
+
+import asyncio
+import contextlib
+import contextvars
+import io
+import logging
+import os
+import struct
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from starlette.applications import Starlette
+from starlette.requests import ClientDisconnect, Request
+from starlette.routing import Mount, Route
+
+import app as server
+import postprocess
+from metrics import clear_timer, start_timer
+from sessions import SessionStore
+
+logger = logging.getLogger(__name__)
+
+ASGI_EXECUTOR_THREADS = int(os.environ.get('ASGI_EXECUTOR_THREADS', 12))
+ASGI_MAX_PENDING = int(os.environ.get('ASGI_MAX_PENDING', 64))
+ASGI_MAX_BODY_BYTES = int(os.environ.get('ASGI_MAX_BODY_BYTES', 16 * 1024 * 1024))
+
+executor = ThreadPoolExecutor(max_workers=ASGI_EXECUTOR_THREADS, thread_name_prefix='asgi-app')
+
+
+class BodyTooLarge(Exception):
+    """The request body is over ``ASGI_MAX_BODY_BYTES``."""
+
+
+def run_blocking(fn, *args):
+    """Run ``fn(*args)`` on the inference executor in a copy of the current context."""
+    context = contextvars.copy_context()
+    return asyncio.get_running_loop().run_in_executor(executor, context.run, fn, *args)
+
+
+async def send_json(send, status, payload, headers=()):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json'), (b'access-control-allow-origin', b'*'),
+                    *headers],
+    })
+    await send({'type': 'http.response.body', 'body': postprocess.dumps(payload)})
+
+
+def wsgi_environ(scope, body):
+    """PEP 3333 environ for an ASGI HTTP scope whose body has been read in full."""
+    server_name, server_port = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server_name,
+        'SERVER_PORT': str(server_port),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope['headers']:
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name == 'CONTENT_TYPE':
+            environ['CONTENT_TYPE'] = value
+        elif name != 'CONTENT_LENGTH':
+            key = f"HTTP_{name}"
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+def call_wsgi(wsgi_app, environ):
+    """Run a WSGI app to completion; returns ``(status, headers, body)``."""
+    started = {}
+
+    def start_response(status, headers, exc_info=None):
+        started['status'] = int(status.split(' ', 1)[0])
+        started['headers'] = headers
+
+    iterable = wsgi_app(environ, start_response)
+    try:
+        body = b''.join(iterable)
+    finally:
+        if hasattr(iterable, 'close'):
+            iterable.close()
+    return started['status'], started['headers'], body
+
+
+class WSGIBridge:
+    """Serves a WSGI app from ASGI: the body is received on the event loop, the app runs on the executor."""
+
+    def __init__(self, wsgi_app, max_pending=ASGI_MAX_PENDING, max_body=ASGI_MAX_BODY_BYTES):
+        self.wsgi_app = wsgi_app
+        self.max_pending = max_pending
+        self.max_body = max_body
+        # Only touched from the event loop, so no lock
+        self.pending = 0
+
+    async def read_body(self, receive):
+        body = bytearray()
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return None
+            body += message.get('body', b'')
+            if len(body) > self.max_body:
+                raise BodyTooLarge()
+            if not message.get('more_body', False):
+                return bytes(body)
+
+    async def respond(self, scope, send, body):
+        """Answer with the WSGI app's response to ``scope`` carrying ``body``."""
+        if self.max_pending and self.pending >= self.max_pending:
+            logger.warning(f"Rejecting {scope['path']}: {self.pending} requests waiting for the executor")
+            server.count_error('overloaded', 'asgi_executor')
+            await send_json(send, 429, {"error": "Server is at capacity, retry shortly", "success": False},
+                            [(b'retry-after', str(server.ADMISSION_RETRY_AFTER).encode())])
+            return
+
+        self.pending += 1
+        try:
+            status, headers, content = await run_blocking(call_wsgi, self.wsgi_app, wsgi_environ(scope, body))
+        finally:
+            self.pending -= 1
+
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers],
+        })
+        await send({'type': 'http.response.body', 'body': content})
+
+    async def __call__(self, scope, receive, send):
+        try:
+            body = await self.read_body(receive)
+        except BodyTooLarge:
+            server.count_error('body_too_large', 'asgi_executor')
+            await send_json(send, 413, {"error": f"Request body over {self.max_body} bytes", "success": False})
+            return
+        if body is None:
+            return
+        await self.respond(scope, send, body)
+
+
+flask_bridge = WSGIBridge(server.app.wsgi_app)
+
+
+class FrameReader:
+    """Reads length-prefixed frames from an ASGI request body."""
+
+    def __init__(self, chunks):
+        self.chunks = chunks.__aiter__()
+        self.buffer = bytearray()
+
+    async def read_exact(self, size):
+        """The next ``size`` bytes, or None if the body ends first."""
+        while len(self.buffer) < size:
+            try:
+                self.buffer += await self.chunks.__anext__()
+            except StopAsyncIteration:
+                return None
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
+
+
+def stream_frame(session_id, data):
+    """Process one /stream frame on the executor and feed its stage timings into the metrics."""
+    timer = start_timer()
+    try:
+        return server.process_stream_frame(server.session_store.get(session_id), data, 'detect_stream')
+    finally:
+        for name, seconds in timer.stages.items():
+            server.stage_duration.observe(seconds, endpoint='detect_stream', stage=name)
+        clear_timer()
+
+
+class StreamEndpoint:
+    """``POST /stream`` on the event loop; same framing and result lines as the Flask route."""
+
+    async def __call__(self, scope, receive, send):
+        if not server.model_ready():
+            # The Flask route answers before it reads the body, with the usual 503/500 payload
+            await flask_bridge.respond(scope, send, b'')
+            return
+
+        request = Request(scope, receive)
+        session_id = (request.headers.get('X-Session-Id') or request.query_params.get('session_id')
+                      or SessionStore.new_id())
+        reader = FrameReader(request.stream())
+
+        logger.info(f"Opened stream for session {session_id}")
+        server.request_duration.observe(0.0, endpoint='detect_stream')
+        server.requests_total.inc(endpoint='detect_stream', method='POST', status=200)
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [(b'content-type', b'application/x-ndjson'), (b'access-control-allow-origin', b'*'),
+                        (b'x-session-id', session_id.encode('latin-1'))],
+        })
+
+        # A client that goes away mid-stream ends it: Starlette raises ClientDisconnect while reading
+        # the body, the server OSError if a result line can no longer be sent
+        with contextlib.suppress(ClientDisconnect, OSError):
+            while True:
+                header = await reader.read_exact(4)
+                if header is None:
+                    break
+
+                (length,) = struct.unpack('>I', header)
+                if length == 0:
+                    break
+
+                if length > server.STREAM_MAX_FRAME_BYTES:
+                    logger.error(f"Stream frame of {length} bytes exceeds limit")
+                    line = {
+                        "success": False,
+                        "error": f"Frame too large: {length} bytes (max {server.STREAM_MAX_FRAME_BYTES})"
+                    }
+                    await send({'type': 'http.response.body', 'body': postprocess.dumps(line) + b"\n",
+                                'more_body': True})
+                    break
+
+                data = await reader.read_exact(length)
+                if data is None:
+                    break
+
+                line = await run_blocking(stream_frame, session_id, data)
+                await send({'type': 'http.response.body', 'body': postprocess.dumps(line) + b"\n",
+                            'more_body': True})
+
+            await send({'type': 'http.response.body', 'body': b''})
+
+        logger.info(f"Closed stream for session {session_id}")
+
+
+@contextlib.asynccontextmanager
+async def lifespan(_app):
+    logger.info(f"ASGI app ready: {ASGI_EXECUTOR_THREADS} executor threads, "
+                f"up to {ASGI_MAX_PENDING} requests waiting")
+    yield
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+app = Starlette(
+    routes=[
+        Route('/stream', StreamEndpoint(), methods=['POST']),
+        # Everything else, including OPTIONS preflights for /stream, is the Flask app
+        Mount('', app=flask_bridge),
+    ],
+    lifespan=lifespan,
+)
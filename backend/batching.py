@@ -0,0 +1,219 @@
+"""
+Dynamic micro-batching for model inference.
+
+Frames submitted by concurrent requests are gathered for up to
+``max_wait_ms`` milliseconds (or until ``max_batch_size`` frames are queued)
+and then run through the model in a single call. Each caller gets back only
+the result for its own frame. Frames whose caller's deadline passed while
+they were queued are dropped before the batch runs.
+"""
+
+import logging
+import queue
+import threading
+import time
+from collections import Counter
+
+from admission import DeadlineExceeded
+
+logger = logging.getLogger(__name__)
+
+
+class _Job:
+    """One or more frames from a single caller waiting to be batched."""
+
+    __slots__ = ("frames", "deadline", "done", "results", "error")
+
+    def __init__(self, frames, deadline=None):
+        self.frames = frames
+        self.deadline = deadline
+        self.done = threading.Event()
+        self.results = None
+        self.error = None
+
+
+class BatchScheduler:
+    """Collects frames from concurrent callers and runs them as one batch.
+
+    ``run_batch`` is called with a list of frames and must return a sequence
+    of per-frame results in the same order.
+    """
+
+    def __init__(self, run_batch, max_batch_size=8, max_wait_ms=5.0):
+        self.run_batch = run_batch
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+
+        self._queue = queue.Queue()
+        self._carry = None
+        self._worker = None
+        self._worker_lock = threading.Lock()
+
+        self._stats_lock = threading.Lock()
+        self._batch_sizes = Counter()
+        self._frames = 0
+        self._errors = 0
+        self._expired = 0
+
+    def submit(self, frame, timeout=None, deadline=None):
+        """Queue a frame and block until its result is available."""
+        return self.submit_many([frame], timeout=timeout, deadline=deadline)[0]
+
+    def submit_many(self, frames, timeout=None, deadline=None):
+        """Queue several frames from one caller and return their results in order.
+
+        The frames are always kept together in the same forward pass, even if
+        they exceed ``max_batch_size`` on their own. If ``deadline`` (on the
+        ``time.monotonic`` clock) passes before their batch runs, they are
+        dropped and ``DeadlineExceeded`` is raised.
+        """
+        if not frames:
+            return []
+
+        self._ensure_worker()
+
+        job = _Job(list(frames), deadline)
+        self._queue.put(job)
+
+        wait = timeout
+        if deadline is not None:
+            # Give up at the deadline; the worker drops the job if it is still queued
+            remaining = max(0.0, deadline - time.monotonic())
+            wait = remaining if wait is None else min(wait, remaining)
+
+        if not job.done.wait(wait):
+            if deadline is not None and time.monotonic() >= deadline:
+                raise DeadlineExceeded("Deadline passed while queued for batched inference")
+            raise TimeoutError("Timed out waiting for batched inference")
+        if job.error is not None:
+            raise job.error
+        return job.results
+
+    def close(self):
+        """Stop the worker thread once the frames already queued have run."""
+        self._queue.put(None)
+
+    def stats(self):
+        """Return counters and the realized batch-size distribution."""
+        with self._stats_lock:
+            batches = sum(self._batch_sizes.values())
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000.0,
+                "queue_depth": self._queue.qsize(),
+                "batches": batches,
+                "frames": self._frames,
+                "errors": self._errors,
+                "expired": self._expired,
+                "mean_batch_size": (self._frames / batches) if batches else 0.0,
+                "batch_size_histogram": {
+                    str(size): count for size, count in sorted(self._batch_sizes.items())
+                },
+            }
+
+    def _ensure_worker(self):
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._worker_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(
+                    target=self._run, name="batch-scheduler", daemon=True
+                )
+                self._worker.start()
+
+    def _next_job(self, timeout=None):
+        if self._carry is not None:
+            job, self._carry = self._carry, None
+            return job
+        if timeout is None:
+            return self._queue.get()
+        if timeout <= 0:
+            return self._queue.get_nowait()
+        return self._queue.get(timeout=timeout)
+
+    def _collect(self):
+        """Block for the first job, then gather more until full or timed out.
+
+        Returns ``(None, 0)`` once the scheduler has been closed.
+        """
+        first = self._next_job()
+        if first is None:
+            return None, 0
+
+        jobs = [first]
+        size = len(jobs[0].frames)
+        deadline = time.monotonic() + self.max_wait
+
+        while size < self.max_batch_size:
+            try:
+                job = self._next_job(deadline - time.monotonic())
+            except queue.Empty:
+                break
+
+            if job is None:
+                # Closed: run what was gathered, then stop on the re-queued marker
+                self._queue.put(None)
+                break
+
+            if size + len(job.frames) > self.max_batch_size:
+                # Does not fit; it starts the next batch instead
+                self._carry = job
+                break
+
+            jobs.append(job)
+            size += len(job.frames)
+
+        return jobs, size
+
+    def _drop_expired(self, jobs, size):
+        """Fail the jobs whose deadline has passed; returns the rest and their frame count."""
+        now = time.monotonic()
+        live = []
+        for job in jobs:
+            if job.deadline is not None and job.deadline <= now:
+                job.error = DeadlineExceeded("Deadline passed while queued for batched inference")
+                size -= len(job.frames)
+                with self._stats_lock:
+                    self._expired += 1
+                job.done.set()
+            else:
+                live.append(job)
+        return live, size
+
+    def _run(self):
+        while True:
+            jobs, size = self._collect()
+            if jobs is None:
+                return
+
+            jobs, size = self._drop_expired(jobs, size)
+            if not jobs:
+                continue
+
+            try:
+                frames = [frame for job in jobs for frame in job.frames]
+                results = self.run_batch(frames)
+                if results is None or len(results) != size:
+                    raise RuntimeError(
+                        f"Batch returned {0 if results is None else len(results)} "
+                        f"results for {size} frames"
+                    )
+                start = 0
+                for job in jobs:
+                    job.results = list(results[start:start + len(job.frames)])
+                    start += len(job.frames)
+                error = None
+            except Exception as e:
+                logger.error(f"Batched inference failed for {size} frames: {e}")
+                error = e
+                for job in jobs:
+                    job.error = e
+
+            with self._stats_lock:
+                self._batch_sizes[size] += 1
+                self._frames += size
+                if error is not None:
+                    self._errors += 1
+
+            for job in jobs:
+                job.done.set()
@@ -0,0 +1,490 @@
+"""
+HTTP load test that replays the labeled frames in ML/dataset/test against the server.
+
+By default the script starts the server itself (gunicorn with
+``gunicorn.conf.py`` on a free port) and stops it afterwards; pass ``--url``
+to benchmark a server that is already running. Every payload mode is run in
+turn:
+
+- ``multipart``  - ``/detect`` with the file as multipart ``image``
+- ``base64``     - ``/detect`` with a JSON base64 data URL
+- ``raw``        - ``/detect`` with an ``application/octet-stream`` raw RGB body
+- ``batch``      - ``/detect_batch`` with ``--batch-size`` files as ``image[]``
+- ``stream``     - ``/stream`` with ``--stream-frames`` length-prefixed files per
+  connection, at most ``--stream-window`` of them waiting for their result line
+
+Requests are sent from ``--concurrency`` client threads, either as fast as
+the server answers (closed loop) or at a fixed ``--rate`` of requests per
+second (open loop). In open-loop mode latency is measured from the time a
+request was scheduled, so a server that falls behind is charged for the
+queueing it causes. In ``stream`` mode every frame counts as a request and
+its latency runs until its result line is read; result lines carry no
+``Server-Timing``, and frames the frame gate answered (``reused``) are
+counted as cached.
+
+For each mode the report has throughput, p50/p95/p99 latency, error rate,
+top-1 accuracy against the folder labels and the mean of each
+``Server-Timing`` stage. It is printed and written as JSON so runs can be
+diffed between releases.
+
+The result cache would answer replayed frames without running the model, so
+a server started by this script gets ``RESULT_CACHE_SIZE=0``; responses that
+still come back cached are counted in the report.
+"""
+
+import os
+import sys
+import glob
+import json
+import time
+import base64
+import socket
+import struct
+import argparse
+import platform
+import threading
+import subprocess
+import random
+import collections
+import http.client
+from urllib.parse import urlsplit
+
+import cv2
+import numpy as np
+import requests
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+DATASET_DIR = os.path.join(BACKEND_DIR, '..', 'ML', 'dataset')
+
+MODES = ('multipart', 'base64', 'raw', 'batch', 'stream')
+
+def list_samples(folder, per_class=None, seed=0):
+    """Return ``(path, label)`` pairs with the class folder name as the label."""
+    rng = random.Random(seed)
+    samples = []
+    for label in sorted(os.listdir(folder)):
+        class_dir = os.path.join(folder, label)
+        if not os.path.isdir(class_dir):
+            continue
+        paths = sorted(glob.glob(os.path.join(class_dir, '*.png')) + glob.glob(os.path.join(class_dir, '*.jpg')))
+        if per_class:
+            rng.shuffle(paths)
+            paths = paths[:per_class]
+        samples.extend((path, label) for path in paths)
+    rng.shuffle(samples)
+    return samples
+
+def build_payloads(samples, mode, batch_size):
+    """Encode every sample for ``mode`` up front, so encoding is not part of the timing.
+
+    Returns ``(endpoint, request kwargs, labels)`` tuples, one per request.
+    """
+    files = []
+    for path, label in samples:
+        with open(path, 'rb') as f:
+            files.append((os.path.basename(path), f.read(), label))
+
+    payloads = []
+    if mode == 'batch':
+        for start in range(0, len(files), batch_size):
+            group = files[start:start + batch_size]
+            payloads.append(('/detect_batch',
+                             {'files': [('image[]', (name, data, 'image/png')) for name, data, _ in group]},
+                             [label for _, _, label in group]))
+        return payloads
+
+    for name, data, label in files:
+        if mode == 'multipart':
+            kwargs = {'files': {'image': (name, data, 'image/png')}}
+        elif mode == 'base64':
+            body = json.dumps({'image': 'data:image/png;base64,' + base64.b64encode(data).decode('ascii')})
+            kwargs = {'data': body, 'headers': {'Content-Type': 'application/json'}}
+        elif mode == 'raw':
+            img = cv2.cvtColor(cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR), cv2.COLOR_BGR2RGB)
+            body = struct.pack('<HHH', *img.shape) + img.tobytes()
+            kwargs = {'data': body, 'headers': {'Content-Type': 'application/octet-stream'}}
+        elif mode == 'stream':
+            payloads.append(('/stream', {'data': struct.pack('>I', len(data)) + data}, [label]))
+            continue
+        else:
+            raise ValueError(f"Unknown payload mode: {mode}")
+        payloads.append(('/detect', kwargs, [label]))
+    return payloads
+
+def parse_server_timing(header):
+    """``{"stage": milliseconds}`` from a Server-Timing header value."""
+    stages = {}
+    for entry in (header or '').split(','):
+        parts = entry.strip().split(';')
+        for param in parts[1:]:
+            if param.startswith('dur='):
+                stages[parts[0]] = float(param[4:])
+    return stages
+
+def predictions(response_json, mode):
+    """Top-1 class name per image in a detection response (None when there is no detection)."""
+    if mode == 'batch':
+        entries = response_json.get('results', [])
+        return [(e.get('detections') or [{}])[0].get('class_name') if e.get('success') else None for e in entries]
+    return [(response_json.get('detections') or [{}])[0].get('class_name')]
+
+def send(session, url, mode, payload, timeout):
+    """Send one request and return its outcome as a dict."""
+    endpoint, kwargs, labels = payload
+    start = time.perf_counter()
+    try:
+        response = session.post(url + endpoint, timeout=timeout, **kwargs)
+        outcome = {'status': response.status_code}
+        if response.status_code == 200:
+            body = response.json()
+            outcome['predicted'] = predictions(body, mode)
+            outcome['cached'] = bool(body.get('cached'))
+            outcome['stages'] = parse_server_timing(response.headers.get('Server-Timing'))
+    except requests.RequestException as e:
+        outcome = {'status': None, 'error': type(e).__name__}
+    outcome['finished'] = time.perf_counter()
+    outcome['sent'] = start
+    outcome['labels'] = labels
+    return outcome
+
+class StreamConnection:
+    """One ``/stream`` request: frames go out as HTTP chunks while result lines come back."""
+
+    def __init__(self, url, timeout):
+        self.url = urlsplit(url)
+        connection = http.client.HTTPSConnection if self.url.scheme == 'https' else http.client.HTTPConnection
+        self.conn = connection(self.url.hostname, self.url.port, timeout=timeout)
+        self.opened = False
+        self.broken = False
+
+    def _chunk(self, data):
+        self.conn.send(b'%x\r\n%s\r\n' % (len(data), data))
+
+    def send(self, frame):
+        """Send one length-prefixed frame (connecting on the first one)."""
+        if not self.opened:
+            self.opened = True
+            self.conn.putrequest('POST', self.url.path + '/stream')
+            self.conn.putheader('Content-Type', 'application/octet-stream')
+            self.conn.putheader('Transfer-Encoding', 'chunked')
+            self.conn.endheaders()
+        self._chunk(frame)
+
+    def finish(self):
+        """End the stream: a zero-length frame, then the last chunk."""
+        self._chunk(struct.pack('>I', 0))
+        self._chunk(b'')
+
+    def lines(self):
+        """Decoded result lines, in frame order, until the server ends the response."""
+        response = self.conn.getresponse()
+        if response.status != 200:
+            raise http.client.HTTPException(f"/stream answered {response.status}")
+        while True:
+            line = response.readline()
+            if not line:
+                return
+            yield json.loads(line)
+
+    def close(self):
+        self.conn.close()
+
+def read_results(stream, pending, window, record):
+    """Match ``stream``'s result lines to the frames in ``pending`` (oldest first) and record them."""
+    error = 'no_result'
+    try:
+        for line in stream.lines():
+            outcome = pending.popleft()
+            outcome['finished'] = time.perf_counter()
+            if line.get('success'):
+                outcome.update(status=200, cached=bool(line.get('reused')), stages={},
+                               predicted=[(line.get('detections') or [{}])[0].get('class_name')])
+            else:
+                outcome.update(status=None, error='frame_error')
+            record(outcome)
+            window.release()
+    except (OSError, ValueError, IndexError, http.client.HTTPException) as e:
+        error = type(e).__name__
+    stream.broken = True
+    fail_pending(pending, error, record)
+    # Unblock a sender waiting for a free slot; it sees ``broken`` and stops
+    window.release()
+
+def fail_pending(pending, error, record):
+    while pending:
+        outcome = pending.popleft()
+        outcome.update(status=None, error=error, finished=time.perf_counter())
+        record(outcome)
+
+def run_load(url, mode, payloads, total, concurrency, rate=None, timeout=30.0, stream_frames=50, stream_window=2):
+    """Send ``total`` requests cycling through ``payloads`` and collect the outcomes.
+
+    Without ``rate`` each client thread sends its next request as soon as the
+    previous one returns. With ``rate`` request ``i`` is due at ``i / rate``
+    seconds and its latency counts from then. In ``stream`` mode a request is
+    one frame: each client thread sends ``stream_frames`` of them over a
+    connection, at most ``stream_window`` without a result yet, before
+    opening the next.
+    """
+    outcomes = []
+    lock = threading.Lock()
+    counter = iter(range(total))
+    t0 = time.perf_counter() + 0.05
+
+    def take():
+        """Next request index and its due time (waiting for it in open-loop mode)."""
+        with lock:
+            index = next(counter, None)
+        if index is None:
+            return None, None
+        due = t0 + index / rate if rate else None
+        if due is not None:
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        return index, due
+
+    def record(outcome):
+        with lock:
+            outcomes.append(outcome)
+
+    def client():
+        session = requests.Session()
+        while True:
+            index, due = take()
+            if index is None:
+                return
+            outcome = send(session, url, mode, payloads[index % len(payloads)], timeout)
+            outcome['due'] = due if due is not None else outcome['sent']
+            record(outcome)
+
+    def stream_client():
+        # Frames are pipelined: the server may hold a frame's result until the next frame
+        # arrives (gunicorn reads chunked bodies ahead), as a camera client's would be
+        while True:
+            stream = StreamConnection(url, timeout)
+            pending = collections.deque()
+            window = threading.Semaphore(stream_window)
+            reader = threading.Thread(target=read_results, args=(stream, pending, window, record), daemon=True)
+            frames = 0
+            index = 0
+            while frames < stream_frames:
+                window.acquire()
+                if stream.broken:
+                    break
+                index, due = take()
+                if index is None:
+                    break
+                _, kwargs, labels = payloads[index % len(payloads)]
+                sent = time.perf_counter()
+                pending.append({'labels': labels, 'sent': sent, 'due': due if due is not None else sent})
+                try:
+                    stream.send(kwargs['data'])
+                except (OSError, http.client.HTTPException):
+                    break
+                if not frames:
+                    reader.start()
+                frames += 1
+            try:
+                if stream.opened:
+                    stream.finish()
+            except (OSError, http.client.HTTPException):
+                pass
+            if frames:
+                reader.join()
+            stream.close()
+            # Frames the reader never saw (it was not started, or stopped first)
+            fail_pending(pending, 'no_result', record)
+            if index is None:
+                return
+
+    target = stream_client if mode == 'stream' else client
+    threads = [threading.Thread(target=target, daemon=True) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return outcomes
+
+def summarize(mode, outcomes):
+    """Throughput, latency percentiles, error rate, top-1 and stage means for one mode."""
+    ok = [o for o in outcomes if o['status'] == 200]
+    latencies = np.array([(o['finished'] - o['due']) * 1000.0 for o in ok]) if ok else np.zeros(0)
+    wall = max(o['finished'] for o in outcomes) - min(o['due'] for o in outcomes) if outcomes else 0.0
+
+    images = correct = 0
+    for o in ok:
+        for label, predicted in zip(o['labels'], o['predicted']):
+            images += 1
+            correct += int(predicted == label)
+
+    stages = {}
+    for o in ok:
+        for name, ms in o.get('stages', {}).items():
+            stages.setdefault(name, []).append(ms)
+
+    errors = {}
+    for o in outcomes:
+        if o['status'] != 200:
+            key = str(o['status']) if o['status'] is not None else o['error']
+            errors[key] = errors.get(key, 0) + 1
+
+    def pct(q):
+        return float(np.percentile(latencies, q)) if latencies.size else None
+
+    return {
+        "mode": mode,
+        "requests": len(outcomes),
+        "ok": len(ok),
+        "error_rate": (len(outcomes) - len(ok)) / len(outcomes) if outcomes else 0.0,
+        "errors": errors,
+        "cached": sum(1 for o in ok if o.get('cached')),
+        "wall_seconds": wall,
+        "requests_per_second": len(ok) / wall if wall else 0.0,
+        "images_per_second": images / wall if wall else 0.0,
+        "latency_ms_mean": float(latencies.mean()) if latencies.size else None,
+        "latency_ms_p50": pct(50),
+        "latency_ms_p95": pct(95),
+        "latency_ms_p99": pct(99),
+        "latency_ms_max": float(latencies.max()) if latencies.size else None,
+        "images": images,
+        "top1": correct / images if images else None,
+        "server_timing_ms_mean": {name: float(np.mean(values)) for name, values in stages.items()},
+    }
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def wait_until_healthy(url, timeout):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if requests.get(f"{url}/health", timeout=2).status_code == 200:
+                return True
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    return False
+
+def start_server(port, extra_env, log_path):
+    """Start gunicorn from the backend directory; returns the process."""
+    env = dict(os.environ)
+    env.setdefault('RESULT_CACHE_SIZE', '0')
+    env.update(extra_env)
+    env['PORT'] = str(port)
+    log = open(log_path, 'w')
+    return subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'app:app'],
+                            cwd=BACKEND_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR,
+                              capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay ML/dataset/test against the detection server and report latency/accuracy')
+    parser.add_argument('--url', default=None, help='Benchmark a running server instead of starting one')
+    parser.add_argument('--test-dir', default=os.path.join(DATASET_DIR, 'test'), help='Labeled images (one folder per class)')
+    parser.add_argument('--per-class', type=int, default=None, help='Use at most this many images per class')
+    parser.add_argument('--modes', default=','.join(MODES), help=f'Comma-separated payload modes ({", ".join(MODES)})')
+    parser.add_argument('--requests', type=int, default=None, help='Requests per mode (defaults to one pass over the images)')
+    parser.add_argument('--concurrency', type=int, default=8, help='Client threads')
+    parser.add_argument('--rate', type=float, default=None, help='Open-loop request rate per second (default: closed loop)')
+    parser.add_argument('--batch-size', type=int, default=8, help='Images per /detect_batch request')
+    parser.add_argument('--stream-frames', type=int, default=50, help='Frames per /stream connection')
+    parser.add_argument('--stream-window', type=int, default=2, help='Frames per /stream connection awaiting their result')
+    parser.add_argument('--warmup', type=int, default=20, help='Unrecorded requests per mode before measuring')
+    parser.add_argument('--timeout', type=float, default=30.0, help='Per-request timeout in seconds')
+    parser.add_argument('--env', action='append', default=[], metavar='KEY=VALUE',
+                        help='Extra environment for the started server (repeatable), e.g. INFERENCE_BACKEND=onnx')
+    parser.add_argument('--startup-timeout', type=float, default=300.0, help='Seconds to wait for /health')
+    parser.add_argument('--server-log', default='benchmark_server.log', help='Where the started server logs to')
+    parser.add_argument('--report', default='benchmark_report.json', help='Where to write the JSON report')
+
+    args = parser.parse_args()
+
+    modes = [m.strip() for m in args.modes.split(',') if m.strip()]
+    unknown = [m for m in modes if m not in MODES]
+    if unknown:
+        print(f"ERROR: Unknown payload modes: {', '.join(unknown)}")
+        sys.exit(1)
+
+    samples = list_samples(args.test_dir, args.per_class)
+    if not samples:
+        print(f"ERROR: No test images found in {args.test_dir}")
+        sys.exit(1)
+
+    server_env = dict(item.split('=', 1) for item in args.env)
+    process = None
+    url = args.url.rstrip('/') if args.url else None
+    if url is None:
+        port = free_port()
+        url = f"http://127.0.0.1:{port}"
+        print(f"Starting server on {url} (log: {args.server_log})")
+        process = start_server(port, server_env, args.server_log)
+
+    try:
+        if not wait_until_healthy(url, args.startup_timeout):
+            print(f"ERROR: Server at {url} did not become healthy")
+            sys.exit(1)
+
+        model_info = requests.get(f"{url}/model_info", timeout=10).json()
+        print(f"Replaying {len(samples)} images from {args.test_dir} with concurrency {args.concurrency}"
+              + (f" at {args.rate:g} req/s" if args.rate else " (closed loop)"))
+
+        results = []
+        for mode in modes:
+            payloads = build_payloads(samples, mode, args.batch_size)
+            total = args.requests or len(payloads)
+            if args.warmup:
+                run_load(url, mode, payloads, args.warmup, args.concurrency, timeout=args.timeout,
+                         stream_frames=args.stream_frames, stream_window=args.stream_window)
+            outcomes = run_load(url, mode, payloads, total, args.concurrency, args.rate, args.timeout,
+                                stream_frames=args.stream_frames, stream_window=args.stream_window)
+            results.append(summarize(mode, outcomes))
+    finally:
+        if process is not None:
+            stop_server(process)
+
+    report = {
+        "timestamp": time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        "revision": git_revision(),
+        "host": {"platform": platform.platform(), "python": platform.python_version(), "cpus": os.cpu_count()},
+        "url": args.url,
+        "server_env": server_env,
+        "model": {key: model_info.get(key) for key in ('model_path', 'inference_backend', 'lean_engine', 'imgsz', 'model_version')},
+        "images": len(samples),
+        "concurrency": args.concurrency,
+        "rate": args.rate,
+        "batch_size": args.batch_size,
+        "stream_frames": args.stream_frames,
+        "stream_window": args.stream_window,
+        "results": results,
+    }
+
+    print(f"\n{'mode':<11}{'req/s':>9}{'img/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}{'top1':>7}")
+    for r in results:
+        fmt = lambda v: f"{v:>9.1f}" if v is not None else f"{'-':>9}"
+        top1 = f"{r['top1']:>7.3f}" if r['top1'] is not None else f"{'-':>7}"
+        print(f"{r['mode']:<11}{r['requests_per_second']:>9.1f}{r['images_per_second']:>9.1f}"
+              f"{fmt(r['latency_ms_p50'])}{fmt(r['latency_ms_p95'])}{fmt(r['latency_ms_p99'])}"
+              f"{r['error_rate']:>8.1%}{top1}")
+
+    with open(args.report, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nReport written to {args.report}")
+
+if __name__ == "__main__":
+    main()
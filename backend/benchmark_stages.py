@@ -0,0 +1,329 @@
+"""
+Micro-benchmarks for the stages of ``detect_signs()`` with a regression gate.
+
+Each stage of the /detect hot path is timed in isolation on fixed inputs:
+
+- ``jpeg_decode@WxH``  - ``decode_image_bytes`` of a JPEG upload (reduced decode included)
+- ``base64@WxH``       - ``base64.b64decode`` of the same JPEG
+- ``cvtcolor@WxH``     - BGR -> RGB conversion of a full frame
+- ``resize@WxH``       - shortest-edge resize and center crop to the model input
+- ``rasterize_landmarks@WxH`` - drawing two hands and a face mesh at model size for /detect_landmarks
+- ``forward@bN``       - the model forward pass on a preprocessed batch of N
+- ``topk@bN``          - top-k extraction over N rows of class probabilities
+- ``format_probs``     - ``format_detections`` on an ultralytics classification result
+- ``format_boxes``     - ``format_detections`` on an ultralytics result with boxes
+- ``serialize``        - building the /detect JSON response (``json_response``)
+
+Every stage is run in several timed repeats of enough calls to last a few
+tens of milliseconds, and the fastest repeat's time per call is reported
+(the least disturbed by other work on the machine). Results are compared
+with ``benchmark_baselines.json``; a stage slower than its baseline by more
+than the tolerance (25% by default, overridable per stage in the baselines
+file) fails the run with exit code 1. So does a gap in the gate: a stage that
+ran without a baseline, or a stage with a baseline that did not run (say the
+``forward`` stages, when ``--model`` is missing).
+
+Timings depend on the machine, so baselines are only comparable on the host
+that recorded them (the file records it and says so in its ``note``). After
+an intended change, or on a new host, record new baselines with
+``--update``. The ``forward`` stages run the runtime the app loads for
+``--model`` (following ``INFERENCE_BACKEND``) and are skipped when the model
+is missing or not on the lean path. They only say something about the
+production model on the production hardware, so they are reported but not
+gated until baselines for them are recorded there with ``--update
+--record-forward``; plain ``--update`` leaves them out.
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import base64
+import logging
+import argparse
+import platform
+import importlib
+
+import cv2
+import numpy as np
+
+import landmarks
+from image_io import decode_image_bytes
+from lean_engine import LeanClassifier, top_k
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINES = os.path.join(BACKEND_DIR, 'benchmark_baselines.json')
+DEFAULT_IMAGE = os.path.join(BACKEND_DIR, '..', 'ML', 'dataset', 'test', 'Hello', '14.png')
+
+INPUT_SIZES = ((64, 64), (320, 240), (640, 480), (1280, 720))
+BATCH_SIZES = (1, 8, 32)
+
+def import_server(model_path):
+    """Import the app with ``model_path`` loaded synchronously, so loading is over before timing starts."""
+    os.environ['MODEL_PATH'] = model_path
+    os.environ['MODEL_BACKGROUND_LOAD'] = '0'
+    os.environ['INFERENCE_PROCESSES'] = '0'
+    server = importlib.import_module('app')
+    logging.getLogger('app').setLevel(logging.WARNING)
+    return server
+
+def measure(fn, repeats=7, target=0.05):
+    """Best seconds per call of ``fn`` over ``repeats`` timed runs of about ``target`` seconds each."""
+    fn()
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= target / 4 or loops >= 1 << 20:
+            break
+        loops *= 2
+    loops = max(1, int(loops * target / max(elapsed, 1e-9)))
+
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        timings.append((time.perf_counter() - start) / loops)
+    return min(timings), loops
+
+def sample_frame(path, size):
+    """A natural-looking BGR frame of ``size`` (width, height) made from a dataset image."""
+    img = cv2.imread(path, cv2.IMREAD_COLOR)
+    if img is None:
+        raise FileNotFoundError(f"Cannot read benchmark image {path}")
+    return cv2.resize(img, size, interpolation=cv2.INTER_LINEAR)
+
+# mediapipe.solutions.face_mesh.FACEMESH_FACE_OVAL, in order from the forehead
+FACE_OVAL = (10, 109, 67, 103, 54, 21, 162, 127, 234, 93, 132, 58, 172, 136, 150, 149, 176, 148,
+             152, 377, 400, 378, 379, 365, 397, 288, 361, 323, 454, 356, 389, 251, 284, 332, 297, 338)
+# An open hand, wrist at the origin, one finger length is about 1
+HAND_SHAPE = np.array([
+    (0, 0), (-0.35, -0.2), (-0.6, -0.4), (-0.8, -0.55), (-1.0, -0.7),
+    (-0.3, -0.9), (-0.35, -1.3), (-0.38, -1.55), (-0.4, -1.75),
+    (-0.05, -0.95), (-0.05, -1.4), (-0.05, -1.7), (-0.05, -1.95),
+    (0.2, -0.9), (0.25, -1.3), (0.28, -1.55), (0.3, -1.75),
+    (0.42, -0.8), (0.5, -1.1), (0.55, -1.3), (0.58, -1.45)])
+
+def sample_landmarks(width, height):
+    """A face mesh and two hands laid out like a signer in front of a ``width`` x ``height`` camera.
+    
+    The mesh is a Tutte embedding of the tessellation (the oval on an ellipse,
+    every other point at the mean of its neighbours), so its edges are as short
+    and as dense as on a real face.
+    """
+    points = 468
+    adjacency = np.zeros((points, points))
+    for a, b in landmarks.FACE_CONNECTIONS:
+        adjacency[a, b] = adjacency[b, a] = 1
+    laplacian = np.diag(adjacency.sum(axis=1)) - adjacency
+    
+    oval = np.array(FACE_OVAL)
+    inner = np.setdiff1d(np.arange(points), oval)
+    angles = np.linspace(0, 2 * np.pi, len(oval), endpoint=False)
+    face = np.zeros((points, 2))
+    face[oval] = np.stack([0.8 * np.sin(angles), -np.cos(angles)], axis=1)
+    face[inner] = np.linalg.solve(laplacian[np.ix_(inner, inner)], -laplacian[np.ix_(inner, oval)] @ face[oval])
+    
+    aspect = width / height
+    # The face a third of the frame high, the hands below it on either side
+    face = face * (0.17 / aspect, 0.17) + (0.5, 0.42)
+    hands = [HAND_SHAPE * (side * 0.11 / aspect, 0.11) + (0.5 + side * 0.2, 0.72) for side in (-1, 1)]
+    return landmarks.Landmarks(hands, face, width, height)
+
+def build_benchmarks(server, image_path, imgsz):
+    """Return ``(name, fn)`` pairs for every stage that can run here.
+    
+    The forward stages use the runtime the server itself loaded (so they follow
+    ``INFERENCE_BACKEND``) and are skipped when no lean-path model is loaded.
+    """
+    benchmarks = []
+    rng = np.random.default_rng(0)
+    num_classes = len(server.ACTION_NAMES)
+
+    for width, height in INPUT_SIZES:
+        label = f"{width}x{height}"
+        frame = sample_frame(image_path, (width, height))
+        jpeg = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 90])[1].tobytes()
+        encoded = base64.b64encode(jpeg)
+        rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        resizer = LeanClassifier(None, imgsz)
+
+        benchmarks += [
+            (f"jpeg_decode@{label}", lambda jpeg=jpeg: decode_image_bytes(jpeg, imgsz)),
+            (f"base64@{label}", lambda encoded=encoded: base64.b64decode(encoded)),
+            (f"cvtcolor@{label}", lambda frame=frame: cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)),
+            (f"resize@{label}", lambda rgb=rgb, resizer=resizer: resizer.resize_crop(rgb)),
+        ]
+
+    # Drawn straight to the model input size, as /detect_landmarks does
+    for width, height in ((640, 480), (1280, 720)):
+        frame_landmarks = sample_landmarks(width, height)
+        benchmarks.append((f"rasterize_landmarks@{width}x{height}",
+                           lambda frame_landmarks=frame_landmarks: landmarks.rasterize(frame_landmarks, imgsz)))
+
+    if server.lean_engine is not None:
+        runtime = server.lean_engine.runtime
+        for batch_size in BATCH_SIZES:
+            batch = rng.random((batch_size, 3, imgsz, imgsz), dtype=np.float32)
+            benchmarks.append((f"forward@b{batch_size}", lambda batch=batch: runtime(batch)))
+    else:
+        print(f"No lean-path model loaded ({server.model_error or server.model_path}); skipping forward stages")
+
+    for batch_size in BATCH_SIZES:
+        probs = rng.dirichlet(np.ones(num_classes), size=batch_size).astype(np.float32)
+        benchmarks.append((f"topk@b{batch_size}", lambda probs=probs: top_k(probs, 5)))
+
+    import torch
+    from ultralytics.engine.results import Results
+
+    names = dict(server.ACTION_NAMES)
+    blank = np.zeros((imgsz, imgsz, 3), dtype=np.uint8)
+    probs = torch.from_numpy(rng.dirichlet(np.ones(num_classes)).astype(np.float32))
+    prob_results = [Results(blank, path='', names=names, probs=probs)]
+
+    boxes = np.zeros((20, 6), dtype=np.float32)
+    boxes[:, :2] = rng.uniform(0, 300, (20, 2))
+    boxes[:, 2:4] = boxes[:, :2] + rng.uniform(10, 300, (20, 2))
+    boxes[:, 4] = rng.uniform(0.25, 1.0, 20)
+    boxes[:, 5] = rng.integers(0, num_classes, 20)
+    box_results = [Results(np.zeros((640, 640, 3), dtype=np.uint8), path='', names=names,
+                           boxes=torch.from_numpy(boxes))]
+
+    detections = server.format_detections(prob_results)
+    payload = {
+        "success": True,
+        "detections": detections,
+        "cached": False,
+        "model_version": 1,
+        "timestamp": time.time()
+    }
+
+    def serialize():
+        with server.app.app_context():
+            server.json_response(payload)
+
+    benchmarks += [
+        ("format_probs", lambda: server.format_detections(prob_results)),
+        ("format_boxes", lambda: server.format_detections(box_results)),
+        ("serialize", serialize),
+    ]
+    return benchmarks
+
+def load_baselines(path):
+    if not os.path.exists(path):
+        return {"stages": {}, "tolerance": {}}
+    with open(path) as f:
+        return json.load(f)
+
+def is_forward(name):
+    return name.startswith('forward@')
+
+def host_info():
+    return {"platform": platform.platform(), "python": platform.python_version(),
+            "processor": platform.processor() or platform.machine(), "cpus": os.cpu_count()}
+
+def host_note(host):
+    return (f"Host-specific: recorded on a {host['cpus']}-CPU {host['processor']} machine ({host['platform']}). "
+            "Only compare with runs on the same host; elsewhere record new baselines with --update.")
+
+def main():
+    parser = argparse.ArgumentParser(description='Time the /detect stages in isolation and compare them with stored baselines')
+    parser.add_argument('--model', default=os.environ.get('MODEL_PATH', 'best(4).pt'), help='Model for the forward stages')
+    parser.add_argument('--imgsz', type=int, default=int(os.environ.get('MODEL_IMGSZ', 64)), help='Model input size')
+    parser.add_argument('--image', default=DEFAULT_IMAGE, help='Dataset image the input frames are made from')
+    parser.add_argument('--baselines', default=DEFAULT_BASELINES, help='Baselines JSON file')
+    parser.add_argument('--tolerance', type=float, default=None, help='Allowed slowdown as a fraction (default from the baselines file, else 0.25)')
+    parser.add_argument('--filter', default=None, help='Only run stages whose name matches this regular expression')
+    parser.add_argument('--repeats', type=int, default=7, help='Timed repeats per stage')
+    parser.add_argument('--update', action='store_true', help='Write the measured times as the new baselines')
+    parser.add_argument('--record-forward', action='store_true',
+                        help='With --update, also record the forward stages (only on the deployment host, with the production model)')
+    parser.add_argument('--report', default=None, help='Also write the measurements as JSON here')
+
+    args = parser.parse_args()
+    server = import_server(args.model)
+
+    baselines = load_baselines(args.baselines)
+    stage_tolerances = baselines.get("tolerance", {})
+    default_tolerance = args.tolerance if args.tolerance is not None else stage_tolerances.get("default", 0.25)
+    if baselines.get("host") and baselines["host"] != host_info():
+        print(f"WARNING: baselines were recorded on a different host: {baselines['host']}")
+
+    benchmarks = build_benchmarks(server, args.image, args.imgsz)
+    pattern = re.compile(args.filter or '')
+    benchmarks = [(name, fn) for name, fn in benchmarks if pattern.search(name)]
+    model = f"{os.path.basename(args.model)} ({server.active_backend})"
+    if any(is_forward(name) for name, _ in benchmarks) and baselines.get("model") not in (None, model):
+        print(f"WARNING: forward baselines were recorded with {baselines['model']}, timing {model}")
+
+    measured = {}
+    regressions = []
+    print(f"\n{'stage':<24}{'us/call':>12}{'baseline':>12}{'change':>10}")
+    for name, fn in benchmarks:
+        seconds, _ = measure(fn, repeats=args.repeats)
+        micros = seconds * 1e6
+        measured[name] = round(micros, 3)
+
+        baseline = baselines.get("stages", {}).get(name)
+        if baseline:
+            change = micros / baseline - 1.0
+            tolerance = stage_tolerances.get(name, default_tolerance)
+            flag = "  REGRESSION" if change > tolerance else ""
+            if flag:
+                regressions.append((name, change, tolerance))
+            print(f"{name:<24}{micros:>12.2f}{baseline:>12.2f}{change:>+10.1%}{flag}")
+        elif is_forward(name):
+            print(f"{name:<24}{micros:>12.2f}{'-':>12}{'ungated':>10}")
+        else:
+            print(f"{name:<24}{micros:>12.2f}{'-':>12}{'new':>10}")
+
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump({"host": host_info(), "model": args.model, "backend": server.active_backend, "stages": measured}, f, indent=2)
+
+    if args.update:
+        recorded = {name: micros for name, micros in measured.items()
+                    if args.record_forward or not is_forward(name)}
+        stages = dict(baselines.get("stages", {}))
+        stages.update(recorded)
+        baselines.update({
+            "host": host_info(),
+            "model": model if any(is_forward(n) for n in recorded) else baselines.get("model"),
+            "imgsz": args.imgsz,
+            "recorded": time.strftime('%Y-%m-%d'),
+            "note": host_note(host_info()),
+            "stages": dict(sorted(stages.items())),
+            "tolerance": stage_tolerances or {"default": 0.25},
+        })
+        with open(args.baselines, 'w') as f:
+            json.dump(baselines, f, indent=2)
+            f.write('\n')
+        print(f"\nBaselines written to {args.baselines}")
+        return
+
+    # A stage the gate cannot compare is a failure too, or a missing model would pass silently.
+    # Forward stages are only gated once they have baselines from the deployment host
+    unbaselined = [name for name in measured
+                   if not baselines.get("stages", {}).get(name) and not is_forward(name)]
+    not_run = [name for name in baselines.get("stages", {}) if name not in measured and pattern.search(name)]
+    if unbaselined:
+        print(f"\nWARNING: {len(unbaselined)} stage(s) have no baseline, record them with --update: "
+              f"{', '.join(unbaselined)}")
+    if not_run:
+        print(f"\nWARNING: {len(not_run)} stage(s) with a baseline did not run (is --model there?): "
+              f"{', '.join(not_run)}")
+
+    if regressions:
+        print(f"\n{len(regressions)} stage(s) regressed past their tolerance:")
+        for name, change, tolerance in regressions:
+            print(f"  {name}: {change:+.1%} (allowed {tolerance:+.0%})")
+    if regressions or unbaselined or not_run:
+        sys.exit(1)
+    print("\nNo stage regressed past its tolerance")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+Sampled debug capture of request frames, written off the request path.
+
+Requests only decide whether a frame should be kept and hand it to a bounded
+queue; a background thread does the JPEG encode and disk writes. Captures are
+kept as a rolling ring of the newest ``ring_size`` frames in ``directory``,
+each with a JSON sidecar holding its predictions. File names carry the
+capture time and process id so several gunicorn workers can share the same
+directory without overwriting each other.
+"""
+
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+import cv2
+
+logger = logging.getLogger(__name__)
+
+
+class DebugRecorder:
+    """Bounded-queue recorder that keeps the last K sampled frames on disk."""
+
+    def __init__(self, directory="debug_captures", ring_size=50, sample_every=100,
+                 low_confidence=None, queue_size=16):
+        self.directory = directory
+        self.ring_size = max(1, int(ring_size))
+        self.sample_every = max(0, int(sample_every))
+        self.low_confidence = low_confidence
+        self.queue_size = max(1, int(queue_size))
+
+        self._queue = queue.Queue(maxsize=self.queue_size)
+        self._worker = None
+        self._worker_lock = threading.Lock()
+
+        self._lock = threading.Lock()
+        self._seen = 0
+        self._queued = 0
+        self._dropped = 0
+        self._written = 0
+        self._errors = 0
+
+    @property
+    def enabled(self):
+        return self.sample_every > 0 or self.low_confidence is not None
+
+    def should_capture(self, detections):
+        """Sampling decision: every Nth frame, or any low-confidence result."""
+        with self._lock:
+            self._seen += 1
+            seen = self._seen
+
+        if self.sample_every and seen % self.sample_every == 0:
+            return True
+
+        if self.low_confidence is not None:
+            top = max((d["confidence"] for d in detections), default=0.0)
+            return top < self.low_confidence
+
+        return False
+
+    def capture(self, img, detections, **info):
+        """Queue a frame for writing if it is sampled. Never blocks the caller."""
+        if not self.enabled or not self.should_capture(detections):
+            return False
+
+        self._ensure_worker()
+
+        try:
+            self._queue.put_nowait((time.time(), img, detections, info))
+        except queue.Full:
+            with self._lock:
+                self._dropped += 1
+            return False
+
+        with self._lock:
+            self._queued += 1
+        return True
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "directory": self.directory,
+                "ring_size": self.ring_size,
+                "sample_every": self.sample_every,
+                "low_confidence": self.low_confidence,
+                "queue_depth": self._queue.qsize(),
+                "seen": self._seen,
+                "queued": self._queued,
+                "dropped": self._dropped,
+                "written": self._written,
+                "errors": self._errors,
+            }
+
+    def recent(self):
+        """Names of the captures currently in the ring, newest first."""
+        try:
+            names = [f[:-4] for f in os.listdir(self.directory) if f.endswith(".jpg")]
+        except FileNotFoundError:
+            return []
+        return sorted(names, reverse=True)
+
+    def _ensure_worker(self):
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._worker_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(
+                    target=self._run, name="debug-recorder", daemon=True
+                )
+                self._worker.start()
+
+    def _run(self):
+        while True:
+            captured_at, img, detections, info = self._queue.get()
+            try:
+                self._write(captured_at, img, detections, info)
+                with self._lock:
+                    self._written += 1
+            except Exception as e:
+                logger.error(f"Failed to write debug capture: {e}")
+                with self._lock:
+                    self._errors += 1
+
+    def _write(self, captured_at, img, detections, info):
+        os.makedirs(self.directory, exist_ok=True)
+
+        name = f"{int(captured_at * 1000):013d}_{os.getpid()}"
+        base = os.path.join(self.directory, name)
+
+        # Frames arrive as RGB; OpenCV encodes BGR
+        ok, encoded = cv2.imencode(".jpg", cv2.cvtColor(img, cv2.COLOR_RGB2BGR))
+        if not ok:
+            raise ValueError("JPEG encode failed")
+
+        # Write to temporary names and rename so readers never see partial files
+        with open(base + ".jpg.tmp", "wb") as f:
+            f.write(encoded.tobytes())
+        with open(base + ".json.tmp", "w") as f:
+            json.dump({"timestamp": captured_at, "shape": list(img.shape),
+                       "detections": detections, **info}, f)
+        os.replace(base + ".json.tmp", base + ".json")
+        os.replace(base + ".jpg.tmp", base + ".jpg")
+
+        self._prune()
+
+    def _prune(self):
+        for name in self.recent()[self.ring_size:]:
+            for ext in (".jpg", ".json"):
+                try:
+                    os.remove(os.path.join(self.directory, name + ext))
+                except FileNotFoundError:
+                    pass
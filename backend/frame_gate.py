@@ -0,0 +1,106 @@
+"""
+Per-session change detection for incoming frames.
+
+Each frame is reduced to a small grayscale thumbnail. If the mean absolute
+difference against the last frame that actually went through the model is
+below ``threshold`` (on the 0-255 pixel scale), the previous detections are
+reused and the forward pass is skipped. Comparing against the last inferred
+frame, rather than the last received one, keeps slow drift from being
+skipped forever.
+"""
+
+import math
+import threading
+
+import cv2
+import numpy as np
+
+
+class FrameGate:
+    """Decides whether a session's new frame differs enough to need inference."""
+
+    def __init__(self, threshold=2.0, size=16, enabled=True):
+        self.threshold = float(threshold)
+        self.size = int(size)
+        self.enabled = bool(enabled)
+
+        self._lock = threading.Lock()
+        self._checked = 0
+        self._skipped = 0
+
+    def fingerprint(self, img):
+        """Downscaled grayscale thumbnail of an RGB frame used for comparing frames."""
+        gray = cv2.cvtColor(img, cv2.COLOR_RGB2GRAY) if img.ndim == 3 else img
+        return cv2.resize(gray, (self.size, self.size), interpolation=cv2.INTER_AREA).astype(np.int16)
+
+    def check(self, session, img, model_version=None):
+        """Return ``(detections, fingerprint)`` for a new frame.
+
+        ``detections`` holds the session's previous result when the frame has
+        not meaningfully changed (and came from the same model version), and
+        is None when inference is needed.
+        """
+        if not self.enabled or session is None:
+            return None, None
+
+        fingerprint = self.fingerprint(img)
+
+        with session.lock:
+            previous = session.gate_fingerprint
+            detections = session.last_detections
+            version = session.gate_version
+
+        reuse = (
+            version == model_version
+            and previous is not None
+            and detections is not None
+            and previous.shape == fingerprint.shape
+            and float(np.abs(fingerprint - previous).mean()) < self.threshold
+        )
+
+        with self._lock:
+            self._checked += 1
+            if reuse:
+                self._skipped += 1
+
+        return (detections if reuse else None), fingerprint
+
+    def record(self, session, fingerprint, detections, model_version=None):
+        """Remember the frame that was just sent through the model."""
+        if session is None:
+            return
+        with session.lock:
+            session.last_detections = detections
+            session.gate_version = model_version
+            if fingerprint is not None:
+                session.gate_fingerprint = fingerprint
+
+    def configure(self, threshold=None, enabled=None):
+        """Change the settings at runtime; nothing changes if either value is invalid.
+
+        Raises TypeError unless ``enabled`` is a bool and ``threshold`` a number,
+        and ValueError unless ``threshold`` is finite and within 0-255.
+        """
+        if threshold is not None:
+            if isinstance(threshold, bool) or not isinstance(threshold, (int, float)):
+                raise TypeError(f"threshold must be a number, got {threshold!r}")
+            if not (math.isfinite(threshold) and 0 <= threshold <= 255):
+                raise ValueError(f"threshold must be a finite number between 0 and 255, got {threshold!r}")
+        if enabled is not None and not isinstance(enabled, bool):
+            raise TypeError(f"enabled must be true or false, got {enabled!r}")
+
+        if threshold is not None:
+            self.threshold = float(threshold)
+        if enabled is not None:
+            self.enabled = enabled
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "threshold": self.threshold,
+                "thumbnail_size": self.size,
+                "checked": self._checked,
+                "skipped": self._skipped,
+                "skip_rate": (self._skipped / self._checked) if self._checked else 0.0,
+            }
@@ -0,0 +1,65 @@
+"""
+Gunicorn settings for the Flask backend (used by run.sh).
+
+With ``preload_app`` the model is loaded once in the master and the workers
+share its weights copy-on-write after fork instead of each loading their own
+copy. ``gc.freeze()`` moves everything allocated during the preload into the
+permanent generation so the garbage collector never writes to (and copies)
+those pages in the workers.
+
+Each worker then sizes its inference thread pools from its share of the CPU
+cores (see ``worker_topology.py``) so the workers do not oversubscribe the
+machine.
+
+Settings come from the environment:
+
+- ``PORT`` - port to bind (default 8000)
+- ``GUNICORN_WORKERS`` - worker processes (default 4)
+- ``GUNICORN_THREADS`` - request threads per worker (default 12, leaving
+  threads free to answer 429s and health checks when ``ADMISSION_MAX_IN_FLIGHT``
+  detection requests are already running)
+- ``GUNICORN_PRELOAD`` - load the model in the master (default 1). This
+  delays binding the port until the model is loaded; with ``0`` each worker
+  accepts connections immediately and loads its model in the background
+- ``GUNICORN_TIMEOUT`` - worker timeout in seconds (default 120)
+
+The same file serves the ASGI entry point with ``-k uvicorn_worker.UvicornWorker
+asgi_app:app`` (``SERVER_MODE=asgi`` in run.sh); ``threads`` does not apply
+there, ``ASGI_EXECUTOR_THREADS`` sizes each worker's executor instead.
+"""
+
+import gc
+import os
+import sys
+
+from worker_topology import apply_thread_budget, thread_budget
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 8000)}"
+workers = int(os.environ.get('GUNICORN_WORKERS', 4))
+worker_class = 'gthread'
+# Threaded workers let concurrent requests in one worker reach the batch scheduler
+threads = int(os.environ.get('GUNICORN_THREADS', 12))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1').lower() not in ('0', 'false', 'no')
+
+if preload_app:
+    # The workers can only share a model the master has finished loading
+    os.environ.setdefault('MODEL_BACKGROUND_LOAD', '0')
+
+
+def when_ready(server):
+    if preload_app:
+        # Everything the preload allocated stays put, so its pages stay shared
+        gc.collect()
+        gc.freeze()
+        server.log.info(f"Froze {gc.get_freeze_count()} objects from the preloaded app")
+
+
+def post_fork(server, worker):
+    intra, inter = thread_budget(server.cfg.workers)
+    apply_thread_budget(intra, inter)
+
+    # Without preload the app is imported after this hook and loads with the budget already set
+    app_module = sys.modules.get('app')
+    if app_module is not None:
+        app_module.init_worker()
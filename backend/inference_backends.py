@@ -0,0 +1,181 @@
+"""
+Inference backends selectable at load time.
+
+``INFERENCE_BACKEND`` picks the runtime that executes the forward pass:
+
+- ``pytorch``  - the model's own ``nn.Module`` (default)
+- ``onnx``     - an exported ONNX model on ONNX Runtime's CPU provider
+- ``openvino`` - an exported OpenVINO IR model on the CPU plugin
+- ``onnx-int8`` - the INT8 model written by ``quantize_model.py`` on ONNX Runtime
+
+Exported artifacts live next to the ``.pt`` file using the ultralytics
+naming (``best(4).onnx``, ``best(4)_openvino_model/``) and are exported
+automatically when missing. The INT8 model (``best(4).int8.onnx``) needs
+calibration data, so it is only ever produced by ``quantize_model.py``.
+Before a backend is used its outputs are compared against PyTorch on a
+fixed probe batch; a mismatch raises ``BackendParityError`` so the caller
+can fall back to PyTorch.
+"""
+
+import glob
+import logging
+import os
+import threading
+
+import numpy as np
+
+from lean_engine import LeanClassifier
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ('pytorch', 'onnx', 'openvino', 'onnx-int8')
+
+
+class BackendParityError(RuntimeError):
+    """Raised when an exported backend disagrees with the PyTorch model."""
+
+
+class OnnxRuntime:
+    """ONNX Runtime CPU session over an NCHW float32 batch."""
+
+    name = "onnx"
+
+    def __init__(self, path, threads=None):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = int(threads)
+
+        self.path = path
+        self.session = ort.InferenceSession(path, sess_options=options, providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, batch):
+        return self.session.run(None, {self.input_name: batch})[0]
+
+
+class OpenVinoRuntime:
+    """OpenVINO compiled model on the CPU plugin over an NCHW float32 batch.
+
+    Calls may come from several threads; each thread gets its own infer request.
+    """
+
+    name = "openvino"
+
+    def __init__(self, path, threads=None):
+        import openvino as ov
+
+        xml = path if path.endswith('.xml') else glob.glob(os.path.join(path, '*.xml'))[0]
+        config = {"PERFORMANCE_HINT": "LATENCY"}
+        if threads:
+            config["INFERENCE_NUM_THREADS"] = int(threads)
+
+        self.path = xml
+        core = ov.Core()
+        self.compiled = core.compile_model(core.read_model(xml), 'CPU', config)
+        self.output = self.compiled.output(0)
+        self._local = threading.local()
+
+    def __call__(self, batch):
+        request = getattr(self._local, 'request', None)
+        if request is None:
+            request = self._local.request = self.compiled.create_infer_request()
+        return np.asarray(request.infer(batch)[self.output])
+
+
+RUNTIMES = {
+    'onnx': OnnxRuntime,
+    'openvino': OpenVinoRuntime,
+    'onnx-int8': OnnxRuntime,
+}
+
+
+def artifact_path(model_path, backend):
+    """Where the exported model for ``backend`` is expected to be."""
+    stem = os.path.splitext(model_path)[0]
+    if backend == 'onnx':
+        return stem + '.onnx'
+    if backend == 'onnx-int8':
+        return stem + '.int8.onnx'
+    if backend == 'openvino':
+        return stem + '_openvino_model'
+    return model_path
+
+
+def ensure_artifact(model_path, backend, imgsz):
+    """Return the exported model for ``backend``, exporting it first if missing."""
+    path = artifact_path(model_path, backend)
+    if os.path.exists(path):
+        return path
+
+    if backend == 'onnx-int8':
+        raise FileNotFoundError(f"Quantized model not found at {path}; run quantize_model.py first")
+
+    from ultralytics import YOLO
+
+    logger.info(f"Exporting {model_path} to {backend} at imgsz={imgsz}")
+    # Export from a fresh instance so the serving model is left untouched
+    exported = YOLO(model_path).export(format=backend, imgsz=imgsz, dynamic=True)
+    return str(exported)
+
+
+def probe_frames(imgsz, count=2):
+    """Deterministic frames used to compare backends."""
+    rng = np.random.default_rng(0)
+    return [rng.integers(0, 256, (imgsz * 2, imgsz * 3, 3), dtype=np.uint8) for _ in range(count)]
+
+
+def check_parity(runtime, reference, imgsz, tolerance):
+    """Compare a classifier runtime against the reference on the probe batch."""
+    batch = LeanClassifier(reference, imgsz).preprocess(probe_frames(imgsz))
+    expected = reference(batch)
+    actual = runtime(batch)
+
+    if actual.shape != expected.shape:
+        raise BackendParityError(f"{runtime.name} output shape {actual.shape} != {expected.shape}")
+
+    diff = float(np.abs(actual - expected).max())
+    if diff > tolerance:
+        raise BackendParityError(f"{runtime.name} differs from PyTorch by {diff:.6f} (tolerance {tolerance})")
+
+    logger.info(f"{runtime.name} parity check passed (max difference {diff:.2e})")
+    return diff
+
+
+def load_classifier_runtime(model_path, backend, imgsz, reference, tolerance=1e-3, threads=None):
+    """Build and verify the runtime for a classification model."""
+    if backend == 'pytorch':
+        return reference
+    if backend not in RUNTIMES:
+        raise ValueError(f"Unknown inference backend '{backend}', expected one of {', '.join(BACKENDS)}")
+
+    runtime = RUNTIMES[backend](ensure_artifact(model_path, backend, imgsz), threads=threads)
+    check_parity(runtime, reference, imgsz, tolerance)
+    return runtime
+
+
+def load_yolo_backend(yolo_model, model_path, backend, imgsz, tolerance=1e-3):
+    """Load a non-classification model through ultralytics on an exported backend."""
+    if backend == 'pytorch':
+        return yolo_model
+    if backend not in RUNTIMES:
+        raise ValueError(f"Unknown inference backend '{backend}', expected one of {', '.join(BACKENDS)}")
+
+    from ultralytics import YOLO
+
+    exported = YOLO(ensure_artifact(model_path, backend, imgsz), task=yolo_model.task)
+
+    probe = probe_frames(imgsz, count=1)[0]
+    expected = yolo_model(probe, imgsz=imgsz, verbose=False)[0].boxes
+    actual = exported(probe, imgsz=imgsz, verbose=False)[0].boxes
+    if len(expected) != len(actual):
+        raise BackendParityError(f"{backend} found {len(actual)} boxes, PyTorch found {len(expected)}")
+    if len(expected):
+        diff = float(np.abs(actual.conf.cpu().numpy() - expected.conf.cpu().numpy()).max())
+        if diff > tolerance:
+            raise BackendParityError(f"{backend} confidences differ by {diff:.6f} (tolerance {tolerance})")
+
+    logger.info(f"{backend} parity check passed")
+    return exported
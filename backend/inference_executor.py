@@ -0,0 +1,89 @@
+"""
+Thread-safe access to the model for threaded (gthread) workers.
+
+The ultralytics predictor keeps per-call state on the ``YOLO`` object
+(source, batch, results), and the lean classifier reuses its input buffers,
+so neither may be entered by two threads at once. ``InferenceExecutor`` owns
+a fixed number of independent predictors built over the same weights and
+lends one to each call.
+
+Concurrency contract:
+
+- ``executor(frames)`` may be called from any thread;
+- at most ``size`` forward passes run at the same time, each on a predictor
+  no other thread is using;
+- further callers wait (up to ``timeout`` seconds) for a predictor to free up.
+
+Predictors share the model's weights, so extra predictors cost input buffers
+and predictor state, not another copy of the model.
+"""
+
+import copy
+import logging
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def clone_predictor(yolo_model):
+    """A ``YOLO`` wrapper that shares ``yolo_model``'s weights but gets its own predictor."""
+    clone = copy.copy(yolo_model)
+    clone.predictor = None
+    return clone
+
+
+class InferenceExecutor:
+    """Bounded pool of predictors lent out one call at a time.
+
+    ``factory()`` builds a ready-to-use predictor: a callable mapping a list
+    of frames to one result per frame.
+    """
+
+    def __init__(self, factory, size=2, timeout=None):
+        self.size = max(1, int(size))
+        self.timeout = timeout
+
+        # LIFO keeps the most recently used (cache-warm) predictors busy
+        self._idle = queue.LifoQueue()
+        for _ in range(self.size):
+            self._idle.put(factory())
+
+        self._lock = threading.Lock()
+        self._calls = 0
+        self._waits = 0
+        self._wait_time = 0.0
+
+    def __call__(self, frames):
+        try:
+            predictor = self._idle.get_nowait()
+            waited = None
+        except queue.Empty:
+            start = time.perf_counter()
+            try:
+                predictor = self._idle.get(timeout=self.timeout)
+            except queue.Empty:
+                raise TimeoutError("Timed out waiting for a free predictor") from None
+            waited = time.perf_counter() - start
+
+        with self._lock:
+            self._calls += 1
+            if waited is not None:
+                self._waits += 1
+                self._wait_time += waited
+
+        try:
+            return predictor(frames)
+        finally:
+            self._idle.put(predictor)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "predictors": self.size,
+                "busy": self.size - self._idle.qsize(),
+                "calls": self._calls,
+                "waits": self._waits,
+                "mean_wait_ms": (self._wait_time / self._waits * 1000.0) if self._waits else 0.0,
+            }
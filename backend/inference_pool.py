@@ -0,0 +1,251 @@
+"""
+Inference process pool fed through shared memory.
+
+HTTP workers decode and validate requests; a fixed set of inference
+processes, forked from the process that loaded the model, own the model and
+run it. Scaling HTTP capacity then no longer means adding model copies and
+inference threads.
+
+Frames travel through an anonymous shared ``mmap`` split into slots. Each
+slot holds one frame plus room for its JSON-encoded detections, and a small
+header (frame shape, result status). A request copies its frame into a free
+slot, puts the slot index on the task queue and waits on that slot's
+semaphore; only the index is ever pickled. Because the mapping, queue and
+semaphores are inherited over ``fork``, the pool must be created in the
+gunicorn master (``preload_app``) for all HTTP workers to share it.
+
+If a request gives up waiting, its slot is marked abandoned and the
+inference process frees it when it finishes, so a timeout never leaks slots.
+"""
+
+import atexit
+import json
+import logging
+import mmap
+import multiprocessing
+import os
+import signal
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Slot header columns
+_HEIGHT, _WIDTH, _CHANNELS, _STATUS, _ABANDONED, _IN_USE = range(6)
+_HEADER_FIELDS = 6
+
+# Counter indices
+_SUBMITTED, _COMPLETED, _FAILED, _TIMED_OUT = range(4)
+
+
+class InferencePoolError(RuntimeError):
+    """Raised when the pool could not produce a result for a frame."""
+
+
+class InferencePool:
+    """Fixed set of inference processes that take frames through shared-memory slots.
+
+    ``detect`` runs inside the inference processes, maps an RGB frame to a
+    JSON-serializable detections list and must be usable after ``fork``.
+    ``init_process(index)`` runs once in each inference process before it
+    starts serving.
+    """
+
+    def __init__(self, detect, processes=2, slots=16, max_frame_bytes=8 * 1024 * 1024,
+                 max_result_bytes=64 * 1024, timeout=30.0, init_process=None):
+        self.detect = detect
+        self.processes = max(1, int(processes))
+        self.slots = max(1, int(slots))
+        self.max_frame_bytes = int(max_frame_bytes)
+        self.max_result_bytes = int(max_result_bytes)
+        self.timeout = float(timeout)
+        self.init_process = init_process
+
+        self.slot_bytes = self.max_frame_bytes + self.max_result_bytes
+
+        ctx = multiprocessing.get_context('fork')
+
+        # Anonymous shared mappings survive fork, so every descendant sees the same pages
+        self._data = mmap.mmap(-1, self.slots * self.slot_bytes)
+        self._header_map = mmap.mmap(-1, self.slots * _HEADER_FIELDS * 8)
+        self._headers = np.frombuffer(self._header_map, dtype=np.int64).reshape(self.slots, _HEADER_FIELDS)
+        self._counter_map = mmap.mmap(-1, 4 * 8)
+        self._counters = np.frombuffer(self._counter_map, dtype=np.int64)
+
+        self._tasks = ctx.SimpleQueue()
+        self._done = [ctx.Semaphore(0) for _ in range(self.slots)]
+        self._free = ctx.Semaphore(self.slots)
+        # Guards slot allocation, the abandoned flags and the counters
+        self._lock = ctx.Lock()
+
+        self._pids = []
+
+    def start(self):
+        """Fork the inference processes."""
+        for index in range(self.processes):
+            pid = os.fork()
+            if pid == 0:
+                # Plain fork rather than multiprocessing.Process: gunicorn workers forked later
+                # would otherwise inherit the process handles and try to join them on exit
+                try:
+                    self._serve(index)
+                finally:
+                    os._exit(1)
+            self._pids.append(pid)
+
+        owner = os.getpid()
+        atexit.register(self._stop, owner)
+        logger.info(f"Started {self.processes} inference processes with {self.slots} frame slots")
+
+    def _stop(self, owner):
+        if os.getpid() != owner:
+            return
+        for pid in self._pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def detect_frame(self, frame):
+        """Run one RGB frame through the pool and return its detections."""
+        return self._wait(self._submit(frame))
+
+    def detect_frames(self, frames):
+        """Run several frames through the pool, keeping a bounded number in flight."""
+        window = max(1, min(self.slots // 2, self.processes * 2))
+        pending = []
+        results = []
+        try:
+            for frame in frames:
+                if len(pending) >= window:
+                    results.append(self._wait(pending.pop(0)))
+                pending.append(self._submit(frame))
+            while pending:
+                results.append(self._wait(pending.pop(0)))
+        except BaseException:
+            for slot in pending:
+                if not self._abandon(slot):
+                    self._release(slot)
+            raise
+        return results
+
+    def stats(self):
+        with self._lock:
+            in_use = int(self._headers[:, _IN_USE].sum())
+            counters = self._counters.tolist()
+        return {
+            "processes": self.processes,
+            "alive": sum(1 for pid in self._pids if _pid_alive(pid)),
+            "slots": self.slots,
+            "slots_in_use": in_use,
+            "max_frame_bytes": self.max_frame_bytes,
+            "submitted": counters[_SUBMITTED],
+            "completed": counters[_COMPLETED],
+            "failed": counters[_FAILED],
+            "timed_out": counters[_TIMED_OUT],
+        }
+
+    def _frame_view(self, slot, shape):
+        offset = slot * self.slot_bytes
+        count = int(np.prod(shape))
+        return np.frombuffer(self._data, dtype=np.uint8, count=count, offset=offset).reshape(shape)
+
+    def _result_view(self, slot):
+        offset = slot * self.slot_bytes + self.max_frame_bytes
+        return memoryview(self._data)[offset:offset + self.max_result_bytes]
+
+    def _submit(self, frame):
+        if frame.ndim != 3:
+            raise ValueError(f"Expected an HxWxC frame, got shape {frame.shape}")
+        if frame.nbytes > self.max_frame_bytes:
+            raise ValueError(f"Frame of {frame.nbytes} bytes exceeds the {self.max_frame_bytes} byte pool slot")
+
+        if not self._free.acquire(timeout=self.timeout):
+            self._count(_TIMED_OUT)
+            raise InferencePoolError("Timed out waiting for a free inference slot")
+
+        with self._lock:
+            slot = int(np.flatnonzero(self._headers[:, _IN_USE] == 0)[0])
+            self._headers[slot, _IN_USE] = 1
+            self._counters[_SUBMITTED] += 1
+
+        # The one copy on the way in: straight into shared memory
+        self._frame_view(slot, frame.shape)[...] = frame
+        self._headers[slot, _HEIGHT:_CHANNELS + 1] = frame.shape
+        self._tasks.put(slot)
+        return slot
+
+    def _wait(self, slot):
+        if not self._done[slot].acquire(timeout=self.timeout) and self._abandon(slot):
+            self._count(_TIMED_OUT)
+            raise InferencePoolError(f"Inference did not finish within {self.timeout} seconds")
+
+        try:
+            status = int(self._headers[slot, _STATUS])
+            if status < 0:
+                raise InferencePoolError(bytes(self._result_view(slot)[:-status - 1]).decode(errors='replace'))
+            return json.loads(bytes(self._result_view(slot)[:status]))
+        finally:
+            self._release(slot)
+
+    def _abandon(self, slot):
+        """Leave a slot to the inference process. False if its result arrived meanwhile."""
+        with self._lock:
+            if self._done[slot].acquire(block=False):
+                return False
+            self._headers[slot, _ABANDONED] = 1
+            return True
+
+    def _release(self, slot):
+        with self._lock:
+            self._headers[slot, _IN_USE] = 0
+        self._free.release()
+
+    def _finish(self, slot):
+        """Hand a finished slot back to its requester, or free it if they gave up."""
+        with self._lock:
+            abandoned = bool(self._headers[slot, _ABANDONED])
+            self._headers[slot, _ABANDONED] = 0
+            if not abandoned:
+                self._done[slot].release()
+        if abandoned:
+            self._release(slot)
+
+    def _count(self, index):
+        with self._lock:
+            self._counters[index] += 1
+
+    def _serve(self, index):
+        if self.init_process is not None:
+            self.init_process(index)
+
+        while True:
+            slot = self._tasks.get()
+            shape = tuple(int(v) for v in self._headers[slot, _HEIGHT:_CHANNELS + 1])
+            result = self._result_view(slot)
+
+            try:
+                payload = json.dumps(self.detect(self._frame_view(slot, shape))).encode()
+                if len(payload) > self.max_result_bytes:
+                    raise ValueError(f"Result of {len(payload)} bytes exceeds the {self.max_result_bytes} byte slot")
+                result[:len(payload)] = payload
+                self._headers[slot, _STATUS] = len(payload)
+                self._count(_COMPLETED)
+            except Exception as e:
+                logger.error(f"Inference process {index} failed on slot {slot}: {e}")
+                message = str(e).encode()[:self.max_result_bytes]
+                result[:len(message)] = message
+                self._headers[slot, _STATUS] = -len(message) - 1
+                self._count(_FAILED)
+
+            self._finish(slot)
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
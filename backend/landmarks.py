@@ -0,0 +1,408 @@
+"""
+Landmark-coordinate input: MediaPipe landmarks rasterized into training-style frames.
+
+The classifier was trained on frames rendered by ``ML/ds.py``: MediaPipe hand
+and face-mesh landmarks drawn with ``mp_drawing.draw_landmarks`` on a black
+canvas the size of the camera frame. Clients that already run MediaPipe can
+send the landmarks instead of a camera image; ``rasterize`` redraws them the
+way ``ds.py`` did, so the model sees its training distribution and the server
+skips image decoding.
+
+Coordinates are MediaPipe's normalized ``x, y`` (``z``, when sent, is
+ignored), in the frame the landmarks were detected on. ``ds.py`` mirrors the
+camera frame before detection; set ``mirror`` when the landmarks come from an
+unmirrored video so that ``x`` is flipped to match.
+
+JSON (``application/json``)::
+
+    {"hands": [[[x, y, z], ... 21 points], ...],
+     "face": [[x, y, z], ... 468 points],
+     "width": 640, "height": 480, "mirror": false}
+
+``hands`` and ``face`` may each be empty or left out; ``width`` and
+``height`` (the capture size the strokes are scaled to) default to
+``DEFAULT_WIDTH`` x ``DEFAULT_HEIGHT``.
+
+Binary (``application/vnd.signserenade.landmarks``, little-endian)
+    A 10-byte header ``<BBBBHHH``: format version (1), flags, hand count,
+    values per point (2 or 3), face point count, width, height. Flags: 1 values
+    are float16 (else float32), 2 mirror. Then ``hands * 21 * dims`` values for
+    the hands followed by ``face_points * dims`` for the face. Two hands and a
+    468-point face mesh as float16 ``x, y`` come to about 2 KB.
+
+The hand connections and the face mesh edges (``face_mesh.py``) are
+MediaPipe's own, so no ``mediapipe`` install is needed on the server.
+"""
+
+import collections
+import functools
+import json
+import math
+import struct
+
+import cv2
+import numpy as np
+
+from face_mesh import FACEMESH_TESSELATION
+from lean_engine import crop_box
+
+MIMETYPE = 'application/vnd.signserenade.landmarks'
+
+BINARY_VERSION = 1
+BINARY_HEADER = struct.Struct('<BBBBHHH')
+FLAG_FLOAT16 = 1
+FLAG_MIRROR = 2
+
+HAND_POINTS = 21
+# Face mesh without (468) and with (478) the refined iris points
+FACE_POINTS = (468, 478)
+MAX_HANDS = 2
+DEFAULT_WIDTH = 640
+DEFAULT_HEIGHT = 480
+MAX_CANVAS_SIDE = 4096
+
+# mediapipe.solutions.hands.HAND_CONNECTIONS
+HAND_CONNECTIONS = (
+    (0, 1), (1, 2), (2, 3), (3, 4),
+    (0, 5), (5, 6), (6, 7), (7, 8),
+    (5, 9), (9, 10), (10, 11), (11, 12),
+    (9, 13), (13, 14), (14, 15), (15, 16),
+    (13, 17), (0, 17), (17, 18), (18, 19), (19, 20),
+)
+FACE_CONNECTIONS = FACEMESH_TESSELATION
+# As (edges, 2) index arrays, so a frame's segments are one fancy-indexing operation
+_HAND_EDGES = np.array(HAND_CONNECTIONS, dtype=np.intp)
+_FACE_EDGES = np.array(FACE_CONNECTIONS, dtype=np.intp)
+
+# ds.py drawing specs as (color, thickness, circle radius). ds.py's colors are BGR
+# (green points, blue lines; yellow and magenta for the face); these are RGB,
+# since frames are drawn in the RGB order the decoders return
+HAND_POINT_SPEC = ((0, 255, 0), 2, 3)
+HAND_LINE_SPEC = ((0, 0, 255), 2)
+FACE_POINT_SPEC = ((255, 255, 0), 1, 1)
+FACE_LINE_SPEC = ((255, 0, 255), 1)
+# drawing_utils outlines every landmark with this color before filling it
+BORDER_COLOR = (224, 224, 224)
+# Farthest any stroke reaches from a landmark's pixel: the outer edge of the widest border circle
+_MARGIN = max(max(radius + 1, int(radius * 1.2)) + thickness
+              for _, thickness, radius in (HAND_POINT_SPEC, FACE_POINT_SPEC))
+
+
+class Landmarks:
+    """Normalized landmarks for one frame: ``(21, 2)`` arrays per hand, an ``(N, 2)`` face array or None."""
+
+    __slots__ = ("hands", "face", "width", "height")
+
+    def __init__(self, hands, face, width=DEFAULT_WIDTH, height=DEFAULT_HEIGHT):
+        self.hands = hands
+        self.face = face
+        self.width = width
+        self.height = height
+
+
+def _points(values, count, name, mirror):
+    # float64 so pixel rounding matches drawing_utils' Python floats
+    try:
+        points = np.asarray(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        # Objects, strings and ragged lists are not arrays of coordinates
+        raise ValueError(f"{name} must be a list of [x, y] or [x, y, z] number lists") from None
+    if points.ndim != 2 or points.shape[1] not in (2, 3) or (count is not None and len(points) != count):
+        expected = f"{count}" if count is not None else "N"
+        raise ValueError(f"{name} must be {expected} points of [x, y] or [x, y, z], got shape {points.shape}")
+    points = points[:, :2].copy()
+    if not np.isfinite(points).all():
+        raise ValueError(f"{name} coordinates must be finite numbers")
+    if mirror:
+        points[:, 0] = 1.0 - points[:, 0]
+    return points
+
+
+def _canvas_size(width, height):
+    width, height = int(width), int(height)
+    if not (0 < width <= MAX_CANVAS_SIDE and 0 < height <= MAX_CANVAS_SIDE):
+        raise ValueError(f"Canvas size {width}x{height} is outside 1..{MAX_CANVAS_SIDE}")
+    return width, height
+
+
+def _frame(hands, face, width, height, mirror):
+    if len(hands) > MAX_HANDS:
+        raise ValueError(f"At most {MAX_HANDS} hands are supported, got {len(hands)}")
+    hands = [_points(hand, HAND_POINTS, "hand", mirror) for hand in hands]
+    if face is not None and len(face):
+        face = _points(face, None, "face", mirror)
+        if len(face) not in FACE_POINTS:
+            raise ValueError(f"face must have {' or '.join(map(str, FACE_POINTS))} points, got {len(face)}")
+    else:
+        face = None
+    return Landmarks(hands, face, *_canvas_size(width, height))
+
+
+def parse_json(payload):
+    """``Landmarks`` from a decoded JSON payload. Raises ValueError for malformed payloads."""
+    if not isinstance(payload, dict):
+        raise ValueError("Landmark payload must be a JSON object")
+    try:
+        return _frame(payload.get("hands") or [], payload.get("face"),
+                      payload.get("width", DEFAULT_WIDTH), payload.get("height", DEFAULT_HEIGHT),
+                      bool(payload.get("mirror", False)))
+    except TypeError as e:
+        # Fields of the wrong JSON type, e.g. a number for "hands" or a list for "width"
+        raise ValueError(f"Malformed landmark payload: {e}") from None
+
+
+def parse_binary(data):
+    """``Landmarks`` from a ``MIMETYPE`` body. Raises ValueError for malformed payloads."""
+    if len(data) < BINARY_HEADER.size:
+        raise ValueError("Landmark payload is shorter than its header")
+    version, flags, hand_count, dims, face_points, width, height = BINARY_HEADER.unpack_from(data)
+    if version != BINARY_VERSION:
+        raise ValueError(f"Unsupported landmark format version {version}")
+    if dims not in (2, 3):
+        raise ValueError(f"Landmarks must have 2 or 3 values per point, got {dims}")
+
+    dtype = np.dtype('<f2') if flags & FLAG_FLOAT16 else np.dtype('<f4')
+    count = (hand_count * HAND_POINTS + face_points) * dims
+    if len(data) - BINARY_HEADER.size != count * dtype.itemsize:
+        raise ValueError(f"Landmark payload has {len(data) - BINARY_HEADER.size} value bytes, "
+                         f"expected {count * dtype.itemsize}")
+
+    values = np.frombuffer(data, dtype, count=count, offset=BINARY_HEADER.size).reshape(-1, dims)
+    hands = [values[i * HAND_POINTS:(i + 1) * HAND_POINTS] for i in range(hand_count)]
+    return _frame(hands, values[hand_count * HAND_POINTS:], width, height, bool(flags & FLAG_MIRROR))
+
+
+def encode_binary(landmarks, float16=True, mirror=False):
+    """Build a ``MIMETYPE`` body from ``Landmarks`` (the inverse of parse_binary, for clients and tests)."""
+    face = landmarks.face if landmarks.face is not None else np.zeros((0, 2), np.float32)
+    dtype = '<f2' if float16 else '<f4'
+    flags = (FLAG_FLOAT16 if float16 else 0) | (FLAG_MIRROR if mirror else 0)
+    header = BINARY_HEADER.pack(BINARY_VERSION, flags, len(landmarks.hands), 2, len(face),
+                                landmarks.width, landmarks.height)
+    values = [np.asarray(points, np.float32)[:, :2] for points in [*landmarks.hands, face]]
+    return header + np.concatenate(values).astype(dtype).tobytes()
+
+
+def decode(data, mimetype):
+    """``Landmarks`` from a request body of either format."""
+    if mimetype == MIMETYPE:
+        return parse_binary(data)
+    try:
+        payload = json.loads(data)
+    except ValueError as e:
+        raise ValueError(f"Landmark payload is not valid JSON: {e}") from None
+    return parse_json(payload)
+
+
+def _pixels(points, width, height):
+    """Pixel coordinates as drawing_utils computes them, and which points are inside the frame.
+
+    Points outside [0, 1] are not drawn, nor are the connections that touch them.
+    """
+    valid = np.all((points >= 0) & (points <= 1), axis=1)
+    pixels = np.floor(np.clip(points, 0, 1) * (width, height)).astype(np.intp)
+    np.minimum(pixels, (width - 1, height - 1), out=pixels)
+    return pixels, valid
+
+
+def _trails(connections):
+    """Index arrays of walks that between them follow every connection exactly once.
+
+    A mesh drawn as a few long polylines puts down the same pixels as one
+    ``cv2.line`` per connection, without paying cv2's per-polyline overhead
+    thousands of times per frame.
+    """
+    edges = list(connections)
+    degree = collections.Counter(point for edge in edges for point in edge)
+    # Joining every odd-degree point to a virtual point makes Euler circuits exist;
+    # cutting the circuits at that point leaves the trails
+    edges += [(point, -1) for point in sorted(degree) if degree[point] % 2]
+    adjacency = collections.defaultdict(list)
+    for index, (a, b) in enumerate(edges):
+        adjacency[a].append((b, index))
+        adjacency[b].append((a, index))
+
+    used = [False] * len(edges)
+    trails = []
+    for start in sorted(adjacency):
+        # Hierholzer's algorithm over the start point's component
+        stack, circuit = [start], []
+        while stack:
+            point = stack[-1]
+            while adjacency[point] and used[adjacency[point][-1][1]]:
+                adjacency[point].pop()
+            if adjacency[point]:
+                neighbor, index = adjacency[point].pop()
+                used[index] = True
+                stack.append(neighbor)
+            else:
+                circuit.append(stack.pop())
+
+        trail = []
+        for point in circuit + [-1]:
+            if point != -1:
+                trail.append(point)
+                continue
+            if len(trail) > 1:
+                trails.append(np.array(trail, dtype=np.intp))
+            trail = []
+    return trails
+
+
+@functools.lru_cache(maxsize=None)
+def _circle_offsets(radius, thickness):
+    """``(dy, dx)`` of the pixels ``cv2.circle`` draws around an integer center."""
+    center = radius + thickness
+    stamp = np.zeros((2 * center + 1, 2 * center + 1), dtype=np.uint8)
+    cv2.circle(stamp, (center, center), radius, 1, thickness)
+    dy, dx = np.nonzero(stamp)
+    return dy - center, dx - center
+
+
+@functools.lru_cache(maxsize=None)
+def _landmark_stamp(point_spec):
+    """``(dy, dx, colors)`` of one landmark as drawing_utils paints it: the border circle, then the fill."""
+    color, thickness, radius = point_spec
+    border_dy, border_dx = _circle_offsets(max(radius + 1, int(radius * 1.2)), thickness)
+    fill_dy, fill_dx = _circle_offsets(radius, thickness)
+    colors = np.repeat(np.array([BORDER_COLOR, color], np.uint8), [len(border_dy), len(fill_dy)], axis=0)
+    return np.concatenate([border_dy, fill_dy]), np.concatenate([border_dx, fill_dx]), colors
+
+
+def _circles(canvas, pixels, point_spec):
+    """The two ``cv2.circle`` calls per landmark, in landmark order, as stamps where they fit."""
+    color, thickness, radius = point_spec
+    border_radius = max(radius + 1, int(radius * 1.2))
+    dy, dx, colors = _landmark_stamp(point_spec)
+    height, width = canvas.shape[:2]
+    offsets = dy * width + dx
+    flat_canvas = canvas.reshape(-1, 3)
+
+    # cv2 clips circles at the canvas edge differently from cutting off a stamp,
+    # so landmarks that close to it are drawn by cv2 itself
+    reach = border_radius + thickness
+    clipped = ((pixels < reach) | (pixels >= (width - reach, height - reach))).any(axis=1)
+    for run in np.split(np.arange(len(pixels)), np.flatnonzero(np.diff(clipped)) + 1):
+        if not len(run):
+            continue
+        if clipped[run[0]]:
+            for x, y in pixels[run].tolist():
+                cv2.circle(canvas, (x, y), border_radius, BORDER_COLOR, thickness)
+                cv2.circle(canvas, (x, y), radius, color, thickness)
+            continue
+        flat = ((pixels[run, 1] * width + pixels[run, 0])[:, None] + offsets).ravel()
+        # NumPy does not define the order of repeated fancy-index writes, so find the last
+        # stamp pixel to reach each canvas pixel and write its color wherever that pixel repeats
+        last = np.zeros(height * width, dtype=np.int32)
+        np.maximum.at(last, flat, np.arange(1, len(flat) + 1, dtype=np.int32))
+        flat_canvas[flat] = colors[(last[flat] - 1) % len(offsets)]
+
+
+def _draw(canvas, points, edges, trails, point_spec, line_spec, width, height, origin=(0, 0)):
+    """Equivalent of ``mp_drawing.draw_landmarks`` with the given specs.
+
+    ``canvas`` is the part of the ``width`` x ``height`` frame whose top-left
+    pixel is ``origin``. Every pixel lands where a ``cv2.line`` per connection
+    and two ``cv2.circle`` per landmark would put it.
+    """
+    pixels, valid = _pixels(points, width, height)
+    pixels -= origin
+    color, thickness = line_spec
+    lines = pixels.astype(np.int32)
+    if valid.all():
+        cv2.polylines(canvas, [lines[trail] for trail in trails], False, color, thickness)
+    else:
+        edges = edges[valid[edges].all(axis=1)]
+        if len(edges):
+            cv2.polylines(canvas, lines[edges], False, color, thickness)
+
+    _circles(canvas, pixels[valid], point_spec)
+
+
+_HAND_TRAILS = _trails(HAND_CONNECTIONS)
+_FACE_TRAILS = _trails(FACE_CONNECTIONS)
+
+
+def _extent(landmarks):
+    """``(x0, y0, x1, y1)`` bounding every pixel ``rasterize`` can draw, or None if nothing is drawn."""
+    points = list(landmarks.hands)
+    if landmarks.face is not None:
+        points.append(landmarks.face)
+    if not points:
+        return None
+    pixels, valid = _pixels(np.concatenate(points), landmarks.width, landmarks.height)
+    if not valid.any():
+        return None
+    pixels = pixels[valid]
+    low, high = pixels.min(axis=0) - _MARGIN, pixels.max(axis=0) + _MARGIN + 1
+    return (max(low[0], 0), max(low[1], 0),
+            min(high[0], landmarks.width), min(high[1], landmarks.height))
+
+
+def _span(low, high, crop_start, size, source, resized):
+    """Where to draw and what to resize along one axis for source pixels ``[low, high)``.
+
+    Returns ``(canvas_start, canvas_stop, view_start, view_stop, first, last)``
+    or None when nothing in ``[low, high)`` reaches the crop. ``first:last`` are
+    the crop's output pixels the landmarks reach. INTER_AREA averages each
+    output pixel over the source pixels under it, so resizing only
+    ``view_start:view_stop`` (starting on a pixel boundary of both sizes and
+    running past ``last``) gives the same ``first:last`` as resizing the whole
+    axis. The canvas also covers ``[low, high)`` so no stroke is clipped.
+    """
+    first = max(crop_start, low * resized // source)
+    last = min(crop_start + size, -(-high * resized // source))
+    if first >= last:
+        return None
+    period = source // math.gcd(source, resized)
+    view_start = first * source // resized // period * period
+    view_stop = -(-last * source // resized)
+    return min(low, view_start), max(high, view_stop), view_start, view_stop, first, last
+
+
+def _render(canvas, landmarks, origin=(0, 0)):
+    for hand in landmarks.hands:
+        _draw(canvas, hand, _HAND_EDGES, _HAND_TRAILS, HAND_POINT_SPEC, HAND_LINE_SPEC,
+              landmarks.width, landmarks.height, origin)
+    if landmarks.face is not None:
+        # The tessellation only covers the first 468 points; the iris points are drawn unconnected
+        _draw(canvas, landmarks.face, _FACE_EDGES, _FACE_TRAILS, FACE_POINT_SPEC, FACE_LINE_SPEC,
+              landmarks.width, landmarks.height, origin)
+
+
+def rasterize(landmarks, size=None):
+    """Render ``Landmarks`` as ``ds.py`` did, as an RGB uint8 frame like the image decoders return.
+
+    With ``size``, a frame larger than ``size`` on its shortest side comes back
+    already shrunk the way the classifier would (``LeanClassifier.resize_crop``:
+    shortest edge to ``size``, area interpolation, center crop), with the
+    same pixels as rendering at full size first. Only the rows and columns the
+    landmarks reach are drawn and resized, so this costs a fraction of that.
+    """
+    width, height = landmarks.width, landmarks.height
+    if size is None or min(width, height) <= size:
+        canvas = np.zeros((height, width, 3), dtype=np.uint8)
+        _render(canvas, landmarks)
+        return canvas
+
+    resized_height, resized_width, top, left = crop_box(height, width, size)
+    crop = np.zeros((size, size, 3), dtype=np.uint8)
+    extent = _extent(landmarks)
+    x = extent and _span(extent[0], extent[2], left, size, width, resized_width)
+    y = extent and _span(extent[1], extent[3], top, size, height, resized_height)
+    if not (x and y):
+        return crop
+
+    canvas_x0, canvas_x1, view_x0, view_x1, first_x, last_x = x
+    canvas_y0, canvas_y1, view_y0, view_y1, first_y, last_y = y
+    canvas = np.zeros((canvas_y1 - canvas_y0, canvas_x1 - canvas_x0, 3), dtype=np.uint8)
+    _render(canvas, landmarks, (canvas_x0, canvas_y0))
+
+    # Scale factors rather than an output size, so cv2 uses the full frame's scale for the view
+    view = canvas[view_y0 - canvas_y0:view_y1 - canvas_y0, view_x0 - canvas_x0:view_x1 - canvas_x0]
+    shrunk = cv2.resize(view, None, fx=resized_width / width, fy=resized_height / height,
+                        interpolation=cv2.INTER_AREA)
+    offset_x, offset_y = view_x0 * resized_width // width, view_y0 * resized_height // height
+    crop[first_y - top:last_y - top, first_x - left:last_x - left] = \
+        shrunk[first_y - offset_y:last_y - offset_y, first_x - offset_x:last_x - offset_x]
+    return crop
@@ -0,0 +1,140 @@
+"""
+Lean execution path for YOLO classification (``-cls``) models.
+
+The generic ultralytics predictor does source checks, PIL/torchvision
+transforms and builds a ``Results`` object per image on every call. For a
+64x64 classifier that overhead dominates the forward pass. ``LeanClassifier``
+does the same preprocessing directly with OpenCV into a preallocated
+float32 buffer, hands it to a runtime (PyTorch here, ONNX Runtime or
+OpenVINO via ``inference_backends``) and returns top-k indices and
+probabilities as NumPy arrays.
+
+Preprocessing mirrors ``ClassificationPredictor`` so results stay in parity
+with ``model(img)``:
+
+- the shortest edge is resized to ``imgsz`` (long edge truncated, as
+  torchvision's ``Resize(int)`` does) and the center ``imgsz`` square kept;
+- the predictor treats NumPy input as BGR and swaps it to RGB, so the same
+  channel swap is applied here to the frames the server passes in;
+- pixels are scaled to [0, 1] with no mean/std normalization.
+"""
+
+import threading
+
+import cv2
+import numpy as np
+
+
+class TopK:
+    """Top-k class indices and their probabilities for one image, best first."""
+
+    __slots__ = ("indices", "confidences")
+
+    def __init__(self, indices, confidences):
+        self.indices = indices
+        self.confidences = confidences
+
+
+def top_k(probs, k=5):
+    """Top-k ``TopK`` per row of an (N, classes) probability array, best first."""
+    k = min(int(k), probs.shape[1])
+    top = np.argpartition(-probs, k - 1, axis=1)[:, :k]
+    top_probs = np.take_along_axis(probs, top, axis=1)
+    order = np.argsort(-top_probs, axis=1)
+
+    indices = np.take_along_axis(top, order, axis=1)
+    confidences = np.take_along_axis(top_probs, order, axis=1)
+    return [TopK(i, c) for i, c in zip(indices, confidences)]
+
+
+def crop_box(height, width, size):
+    """``(resized_height, resized_width, top, left)`` of ``resize_crop`` for a ``height`` x ``width`` frame."""
+    if height <= width:
+        nh, nw = size, int(size * width / height)
+    else:
+        nh, nw = int(size * height / width), size
+    return nh, nw, int(round((nh - size) / 2.0)), int(round((nw - size) / 2.0))
+
+
+class TorchRuntime:
+    """Runs the model's own ``nn.Module`` on an NCHW float32 batch."""
+
+    name = "pytorch"
+
+    def __init__(self, yolo_model):
+        import torch
+
+        self.torch = torch
+        net = yolo_model.model
+        if hasattr(net, 'fuse'):
+            # Same Conv+BN fusion the predictor's AutoBackend applies
+            net = net.fuse(verbose=False)
+        self.net = net.float().eval()
+        self.device = next(self.net.parameters()).device
+
+    def __call__(self, batch):
+        with self.torch.inference_mode():
+            output = self.net(self.torch.from_numpy(batch).to(self.device))
+        if isinstance(output, (list, tuple)):
+            output = output[0]
+        return output.float().cpu().numpy()
+
+
+class LeanClassifier:
+    """Direct resize + forward for classification models, bypassing the predictor.
+
+    ``runtime`` maps an (N, 3, imgsz, imgsz) float32 array to (N, classes)
+    probabilities, e.g. ``TorchRuntime(model)``.
+    """
+
+    def __init__(self, runtime, imgsz, topk=5):
+        self.runtime = runtime
+
+        self.imgsz = int(imgsz)
+        self.topk = int(topk)
+
+        self._buffers = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def supports(yolo_model):
+        """Only PyTorch classification models can take the lean path."""
+        import torch
+
+        return (
+            getattr(yolo_model, 'task', None) == 'classify'
+            and isinstance(getattr(yolo_model, 'model', None), torch.nn.Module)
+        )
+
+    def resize_crop(self, frame):
+        """Shortest-edge resize to imgsz followed by a center crop."""
+        size = self.imgsz
+        h, w = frame.shape[:2]
+        nh, nw, top, left = crop_box(h, w, size)
+
+        interpolation = cv2.INTER_AREA if nh < h else cv2.INTER_LINEAR
+        resized = cv2.resize(frame, (nw, nh), interpolation=interpolation)
+        return resized[top:top + size, left:left + size]
+
+    def preprocess(self, frames, out=None):
+        """Pack RGB frames into an (N, 3, imgsz, imgsz) float32 array in [0, 1]."""
+        # Reverse channels to match the predictor's BGR->RGB conversion of NumPy input
+        batch = np.stack([self.resize_crop(frame)[..., ::-1] for frame in frames])
+        if out is None:
+            out = np.empty((len(frames), 3, self.imgsz, self.imgsz), dtype=np.float32)
+        np.multiply(batch.transpose(0, 3, 1, 2), np.float32(1.0 / 255.0), out=out, casting='unsafe')
+        return out
+
+    def probabilities(self, frames):
+        """Class probabilities for a list of RGB frames as an (N, classes) array."""
+        with self._lock:
+            buffer = self._buffers.get(len(frames))
+            if buffer is None:
+                buffer = np.empty((len(frames), 3, self.imgsz, self.imgsz), dtype=np.float32)
+                self._buffers[len(frames)] = buffer
+
+            return self.runtime(self.preprocess(frames, out=buffer))
+
+    def __call__(self, frames):
+        """Top-k result per frame, in input order."""
+        return top_k(self.probabilities(frames), self.topk)
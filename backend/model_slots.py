@@ -0,0 +1,157 @@
+"""
+Double-buffered model serving for zero-downtime reloads.
+
+Everything needed to run one loaded model (weights, predictors, batch
+scheduler, version) lives in a ``ModelSlot``. A reload builds and warms a
+complete standby slot while the active one keeps serving, then
+``ModelSlots.swap`` makes it active in a single reference assignment.
+
+Requests pin the slot they start on for as long as they use it, so a
+request never mixes two models and the version it reports is the one that
+produced its result. The previous slot is retired at the swap and closed
+once its last in-flight request releases it. A load that fails never
+reaches ``swap``, so the active model keeps serving.
+"""
+
+import logging
+import threading
+from contextlib import contextmanager
+
+import admission
+
+logger = logging.getLogger(__name__)
+
+
+class ModelSlot:
+    """One loaded, warmed-up model and the machinery that runs it.
+
+    ``executor`` maps a list of frames to one result per frame; ``scheduler``
+    is an optional ``BatchScheduler`` over it.
+    """
+
+    def __init__(self, version, path, model, executor, scheduler=None, imgsz=None,
+                 backend='pytorch', lean_engine=None):
+        self.version = version
+        self.path = path
+        self.model = model
+        self.executor = executor
+        self.scheduler = scheduler
+        self.imgsz = imgsz
+        self.backend = backend
+        self.lean_engine = lean_engine
+
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._retired = False
+        self._closed = False
+
+    @property
+    def in_flight(self):
+        return self._in_flight
+
+    def run_batch(self, frames):
+        """Run a list of frames in one forward pass, one result per frame."""
+        return self.executor(frames)
+
+    def run(self, frame, deadline=None):
+        """Run one frame, sharing a forward pass with concurrent callers when batching.
+
+        Raises ``admission.DeadlineExceeded`` instead of running once ``deadline`` has passed.
+        """
+        if self.scheduler is not None:
+            return self.scheduler.submit(frame, deadline=deadline)
+        admission.check(deadline, "forward pass")
+        return self.run_batch([frame])[0]
+
+    def run_many(self, frames, deadline=None):
+        """Run several frames from one caller together, one result per frame."""
+        if self.scheduler is not None:
+            return self.scheduler.submit_many(frames, deadline=deadline)
+        admission.check(deadline, "forward pass")
+        return self.run_batch(frames)
+
+    def acquire(self):
+        with self._lock:
+            self._in_flight += 1
+
+    def release(self):
+        with self._lock:
+            self._in_flight -= 1
+            close = self._retired and self._in_flight == 0
+        if close:
+            self._close()
+
+    def retire(self):
+        """Stop taking new work; close as soon as nothing is in flight."""
+        with self._lock:
+            self._retired = True
+            close = self._in_flight == 0
+        if close:
+            self._close()
+
+    def _close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        if self.scheduler is not None:
+            self.scheduler.close()
+        logger.info(f"Model version {self.version} drained and released")
+
+
+class ModelSlots:
+    """The active ``ModelSlot`` plus in-flight accounting for swaps."""
+
+    def __init__(self):
+        self._active = None
+        self._swap_lock = threading.Lock()
+        self._swaps = 0
+
+    def current(self):
+        """The active slot (or None), without pinning it."""
+        return self._active
+
+    def acquire(self):
+        """Pin the active slot for the caller; pair with ``slot.release()``.
+
+        Returns None when no model is loaded.
+        """
+        while True:
+            slot = self._active
+            if slot is None:
+                return None
+            slot.acquire()
+            # A swap may have retired the slot between the read and the pin
+            if slot is self._active:
+                return slot
+            slot.release()
+
+    @contextmanager
+    def use(self):
+        """Context manager pinning the active slot for the duration of the block."""
+        slot = self.acquire()
+        try:
+            yield slot
+        finally:
+            if slot is not None:
+                slot.release()
+
+    def swap(self, slot):
+        """Make ``slot`` active and retire the previous one. Returns the previous slot."""
+        with self._swap_lock:
+            previous, self._active = self._active, slot
+            self._swaps += 1
+        if previous is not None:
+            logger.info(f"Swapped model version {previous.version} -> {slot.version}; "
+                        f"{previous.in_flight} requests still on the old model")
+            previous.retire()
+        return previous
+
+    def stats(self):
+        slot = self._active
+        return {
+            "version": slot.version if slot else None,
+            "path": slot.path if slot else None,
+            "in_flight": slot.in_flight if slot else 0,
+            "swaps": self._swaps,
+        }
@@ -0,0 +1,143 @@
+"""
+Vectorized conversion of model output into the detections lists the API returns.
+
+Every detection response goes through here, so the per-result work is kept
+to a few NumPy operations:
+
+- boxes, confidences and classes are pulled off the device in one transfer
+  (``boxes.data``) instead of three tensor reads per box;
+- classification top-k uses ``argpartition`` rather than sorting every class
+  (below ``PARTITION_MIN_CLASSES`` a plain sort of the few classes is cheaper);
+- class ids are mapped to names through a precomputed ``ClassNames`` table.
+
+``dumps`` serializes response payloads with orjson (in requirements.txt); the
+standard library fallback only keeps the app working where it cannot be
+installed.
+"""
+
+import json
+
+import numpy as np
+
+from lean_engine import TopK
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Classification entries below this confidence are left out of the response
+MIN_CONFIDENCE = 0.01
+TOP_K = 5
+# Below this many classes argsort beats argpartition + a sort of the top k
+PARTITION_MIN_CLASSES = 256
+
+
+class ClassNames:
+    """Class id -> name lookup table; ids without a name map to ``unknown_<id>``."""
+
+    def __init__(self, names):
+        names = dict(names or {})
+        size = max(names, default=-1) + 1
+        self.names = [names.get(i, f"unknown_{i}") for i in range(size)]
+        self.table = np.array(self.names, dtype=object)
+
+    def name(self, class_id):
+        return self.names[class_id] if 0 <= class_id < len(self.names) else f"unknown_{class_id}"
+
+    def lookup(self, class_ids):
+        """Names for an integer array of class ids, as a list."""
+        class_ids = np.asarray(class_ids, dtype=np.int64)
+        if class_ids.size and 0 <= class_ids.min() and class_ids.max() < len(self.names):
+            return self.table[class_ids].tolist()
+        return [self.name(i) for i in class_ids.tolist()]
+
+
+# ClassNames per model names dict, so detection results reuse one lookup array
+_names_cache = {}
+
+
+def names_for(names):
+    """The cached ``ClassNames`` for a model's ``names`` dict."""
+    cached = _names_cache.get(id(names))
+    if cached is None or cached[0] is not names:
+        cached = _names_cache[id(names)] = (names, ClassNames(names))
+    return cached[1]
+
+
+def _class_detections(indices, confidences, class_names, min_confidence):
+    # At most TOP_K entries: plain Python beats further NumPy calls here
+    return [
+        {"class_id": class_id, "class_name": class_names.name(class_id), "confidence": confidence}
+        for class_id, confidence in zip(indices, confidences)
+        if confidence > min_confidence
+    ]
+
+
+def topk_detections(top, class_names, min_confidence=MIN_CONFIDENCE):
+    """Detections for one image's ``TopK``, dropping entries below ``min_confidence``."""
+    return _class_detections(top.indices.tolist(), top.confidences.tolist(), class_names, min_confidence)
+
+
+def probs_detections(probs, class_names, k=TOP_K, min_confidence=MIN_CONFIDENCE):
+    """Top-k detections for one image's class probability vector, best first."""
+    probs = np.asarray(probs).ravel()
+    k = min(k, probs.size)
+    if probs.size >= PARTITION_MIN_CLASSES:
+        top = np.argpartition(probs, probs.size - k)[-k:]
+        top = top[np.argsort(probs[top])[::-1]]
+    else:
+        top = probs.argsort()[-k:][::-1]
+    return _class_detections(top.tolist(), probs[top].tolist(), class_names, min_confidence)
+
+
+def box_detections(boxes, class_names):
+    """Detections for an ultralytics ``Boxes`` object, read in one device transfer."""
+    data = boxes.data
+    if hasattr(data, 'cpu'):
+        data = data.cpu().numpy()
+    if not len(data):
+        return []
+
+    # Columns are x1, y1, x2, y2, [track id,] confidence, class
+    xyxy = data[:, :4].tolist()
+    confidences = data[:, -2].tolist()
+    class_ids = data[:, -1].astype(np.int64)
+    return [
+        {"class_id": class_id, "class_name": name, "confidence": confidence, "bbox": bbox}
+        for class_id, name, confidence, bbox in zip(class_ids.tolist(), class_names.lookup(class_ids),
+                                                    confidences, xyxy)
+    ]
+
+
+def format_detections(results, class_names):
+    """Detections list for the model results of one image.
+
+    ``results`` is the output of one forward pass: a list holding either a
+    lean-path ``TopK`` or ultralytics ``Results``. Classification results are
+    named through ``class_names``; boxes use each result's own ``names``.
+    """
+    if not hasattr(results, '__iter__'):
+        raise ValueError(f"Invalid results format: {type(results)}")
+    first = results[0] if len(results) else None
+
+    if isinstance(first, TopK):
+        return topk_detections(first, class_names)
+
+    if getattr(first, 'probs', None) is not None:
+        return probs_detections(first.probs.data.cpu().numpy(), class_names)
+
+    detections = []
+    for result in results:
+        boxes = getattr(result, 'boxes', None)
+        if boxes is None:
+            continue
+        detections.extend(box_detections(boxes, names_for(result.names)))
+    return detections
+
+
+def dumps(payload):
+    """Serialize a response payload to JSON bytes (NumPy scalars and arrays allowed with orjson)."""
+    if orjson is not None:
+        return orjson.dumps(payload, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(payload, separators=(',', ':')).encode()
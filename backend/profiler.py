@@ -0,0 +1,128 @@
+"""
+On-demand stack-sampling profiler for a running worker.
+
+``SamplingProfiler.run(seconds)`` wakes up every ``interval`` seconds on a
+background thread, snapshots the Python stack of every other thread with
+``sys._current_frames()`` and counts identical stacks. Nothing is installed
+in the request path (no ``sys.setprofile`` hooks), so the cost is one stack
+walk per thread per sample and only while a profile is being taken.
+
+The result is in the collapsed-stack format read by ``flamegraph.pl``,
+speedscope and similar tools: one line per distinct stack, frames from the
+thread name (root) to the innermost function separated by ``;``, followed by
+a space and the sample count.
+
+Samples show Python frames only; time spent inside native code (a torch
+forward pass, ``cv2.imdecode``) is attributed to the Python function that
+called it.
+"""
+
+import math
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+# Innermost frames of threads that are blocked waiting for work rather than running
+_IDLE_FRAMES = {
+    ('threading.py', 'wait'),
+    ('threading.py', '_wait_for_tstate_lock'),
+    ('queue.py', 'get'),
+    ('selectors.py', 'select'),
+    ('socket.py', 'accept'),
+    ('socket.py', 'readinto'),
+    ('multiprocessing/synchronize.py', '__enter__'),
+}
+
+
+class ProfilerBusyError(RuntimeError):
+    """Raised when a profile is requested while another one is running."""
+
+
+def _frame_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _is_idle(frame):
+    code = frame.f_code
+    filename = code.co_filename.replace(os.sep, '/')
+    return any(filename.endswith(name) and code.co_name == func for name, func in _IDLE_FRAMES)
+
+
+class SamplingProfiler:
+    """Samples every thread's stack at a fixed interval; one profile at a time."""
+
+    def __init__(self, interval=0.005, max_seconds=60.0):
+        self.interval = float(interval)
+        self.max_seconds = float(max_seconds)
+        self._running = threading.Lock()
+
+    def run(self, seconds, interval=None, include_idle=False):
+        """Sample for ``seconds`` and return ``(stacks, summary)``.
+
+        ``stacks`` maps a collapsed stack string to its sample count. Threads
+        blocked waiting for work are skipped unless ``include_idle`` is set.
+        The calling thread is never sampled. Raises ValueError unless
+        ``seconds`` and ``interval`` are finite and positive.
+        """
+        seconds, interval = float(seconds), float(self.interval if interval is None else interval)
+        if not (math.isfinite(seconds) and seconds > 0):
+            raise ValueError(f"seconds must be a positive finite number, got {seconds}")
+        if not (math.isfinite(interval) and interval > 0):
+            raise ValueError(f"interval must be a positive finite number, got {interval}")
+        seconds = min(seconds, self.max_seconds)
+        interval = max(interval, 0.001)
+
+        if not self._running.acquire(blocking=False):
+            raise ProfilerBusyError("A profile is already running in this worker")
+        try:
+            stacks = Counter()
+            skip = {threading.get_ident()}
+            names = {}
+            samples = 0
+
+            start = time.perf_counter()
+            deadline = start + seconds
+            next_sample = start
+            while True:
+                now = time.perf_counter()
+                if now >= deadline:
+                    break
+                if now < next_sample:
+                    time.sleep(next_sample - now)
+                next_sample += interval
+
+                frames = sys._current_frames()
+                if len(names) != len(frames):
+                    names = {thread.ident: thread.name for thread in threading.enumerate()}
+                samples += 1
+
+                for ident, frame in frames.items():
+                    if ident in skip or (not include_idle and _is_idle(frame)):
+                        continue
+                    labels = []
+                    while frame is not None:
+                        labels.append(_frame_label(frame.f_code))
+                        frame = frame.f_back
+                    labels.append(names.get(ident, f"thread-{ident}"))
+                    labels.reverse()
+                    stacks[';'.join(labels)] += 1
+                del frames
+
+            summary = {
+                "pid": os.getpid(),
+                "seconds": round(time.perf_counter() - start, 3),
+                "interval_ms": interval * 1000.0,
+                "samples": samples,
+                "stacks": len(stacks),
+            }
+            return stacks, summary
+        finally:
+            self._running.release()
+
+
+def collapse(stacks):
+    """Render sampled stacks in the collapsed-stack text format, heaviest first."""
+    lines = [f"{stack} {count}" for stack, count in stacks.most_common()]
+    return '\n'.join(lines) + ('\n' if lines else '')
@@ -0,0 +1,203 @@
+"""
+Script to build an INT8 version of the classifier and report what it costs.
+
+Exports the model to ONNX (if needed), quantizes it with ONNX Runtime
+post-training quantization and writes ``<model>.int8.onnx`` next to the
+``.pt`` file, which the server loads with ``INFERENCE_BACKEND=onnx-int8``.
+
+Static quantization (the default) calibrates activation ranges on images
+from ML/dataset/train, preprocessed exactly as the server does. Dynamic
+quantization only needs the weights.
+
+The FP32 PyTorch, FP32 ONNX and INT8 ONNX models are then compared on
+ML/dataset/test for top-1/top-5 accuracy and single-image latency, and the
+report is printed and written as JSON.
+
+Needs onnx and onnxruntime: ``pip install -r requirements-backends.txt``.
+"""
+
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+import random
+
+import numpy as np
+import onnx
+from onnxruntime.quantization import (CalibrationDataReader, CalibrationMethod, QuantFormat,
+                                      QuantType, quantize_dynamic, quantize_static)
+from ultralytics import YOLO
+
+from image_io import decode_image_bytes
+from inference_backends import OnnxRuntime, artifact_path, ensure_artifact
+from lean_engine import LeanClassifier, TorchRuntime
+
+DATASET_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'ML', 'dataset')
+
+def list_images(folder, names, per_class=None, seed=0):
+    """Return ``(path, class_id)`` pairs for every class folder that matches a model class."""
+    class_ids = {name: idx for idx, name in names.items()}
+    rng = random.Random(seed)
+
+    samples = []
+    for class_name in sorted(os.listdir(folder)):
+        class_dir = os.path.join(folder, class_name)
+        if not os.path.isdir(class_dir) or class_name not in class_ids:
+            continue
+        paths = sorted(glob.glob(os.path.join(class_dir, '*.png')) + glob.glob(os.path.join(class_dir, '*.jpg')))
+        if per_class:
+            rng.shuffle(paths)
+            paths = paths[:per_class]
+        samples.extend((path, class_ids[class_name]) for path in paths)
+    return samples
+
+def load_frame(path, imgsz):
+    """Decode an image file the same way the server decodes uploads."""
+    with open(path, 'rb') as f:
+        return decode_image_bytes(f.read(), imgsz)
+
+class FolderCalibrationReader(CalibrationDataReader):
+    """Feeds preprocessed training images to the ONNX Runtime calibrator."""
+
+    def __init__(self, samples, preprocessor, input_name):
+        self.samples = samples
+        self.preprocessor = preprocessor
+        self.input_name = input_name
+        self.index = 0
+
+    def get_next(self):
+        if self.index >= len(self.samples):
+            return None
+        path, _ = self.samples[self.index]
+        self.index += 1
+        batch = self.preprocessor.preprocess([load_frame(path, self.preprocessor.imgsz)])
+        return {self.input_name: batch}
+
+def quantize(fp32_path, int8_path, mode, calibration_samples, imgsz):
+    """Write a quantized copy of ``fp32_path`` to ``int8_path``."""
+    if mode == 'dynamic':
+        quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+    else:
+        input_name = onnx.load(fp32_path, load_external_data=False).graph.input[0].name
+        reader = FolderCalibrationReader(calibration_samples, LeanClassifier(None, imgsz), input_name)
+        quantize_static(
+            fp32_path, int8_path, reader,
+            quant_format=QuantFormat.QDQ,
+            per_channel=True,
+            activation_type=QuantType.QUInt8,
+            weight_type=QuantType.QInt8,
+            calibrate_method=CalibrationMethod.MinMax,
+        )
+
+    # Keep the ultralytics metadata (names, imgsz, task) on the quantized model
+    fp32_meta = onnx.load(fp32_path, load_external_data=False).metadata_props
+    int8_model = onnx.load(int8_path)
+    existing = {prop.key for prop in int8_model.metadata_props}
+    for prop in fp32_meta:
+        if prop.key not in existing:
+            int8_model.metadata_props.append(prop)
+    onnx.save(int8_model, int8_path)
+
+def evaluate(name, runtime, samples, imgsz, warmup=5):
+    """Top-1/top-5 accuracy and per-image latency of a runtime on ``samples``."""
+    engine = LeanClassifier(runtime, imgsz)
+    frames = [load_frame(path, imgsz) for path, _ in samples]
+    labels = np.array([label for _, label in samples])
+
+    for frame in frames[:warmup]:
+        engine.probabilities([frame])
+
+    latencies = []
+    probs = []
+    for frame in frames:
+        start = time.perf_counter()
+        probs.append(engine.probabilities([frame])[0])
+        latencies.append((time.perf_counter() - start) * 1000.0)
+
+    probs = np.stack(probs)
+    top5 = np.argsort(-probs, axis=1)[:, :5]
+    latencies = np.array(latencies)
+
+    return {
+        "name": name,
+        "images": len(samples),
+        "top1": float((top5[:, 0] == labels).mean()),
+        "top5": float((top5 == labels[:, None]).any(axis=1).mean()),
+        "latency_ms_mean": float(latencies.mean()),
+        "latency_ms_p50": float(np.percentile(latencies, 50)),
+        "latency_ms_p95": float(np.percentile(latencies, 95)),
+    }
+
+def file_size_mb(path):
+    """Size of a model file including any external ONNX data file."""
+    total = os.path.getsize(path)
+    if os.path.exists(path + '.data'):
+        total += os.path.getsize(path + '.data')
+    return total / (1024 * 1024)
+
+def main():
+    parser = argparse.ArgumentParser(description='Quantize the classifier to INT8 and report accuracy/latency')
+    parser.add_argument('--model', default=os.environ.get('MODEL_PATH', 'best(4).pt'), help='Path to the YOLO classification model')
+    parser.add_argument('--mode', choices=['static', 'dynamic'], default='static', help='Post-training quantization mode')
+    parser.add_argument('--calib-dir', default=os.path.join(DATASET_DIR, 'train'), help='Calibration images (one folder per class)')
+    parser.add_argument('--calib-per-class', type=int, default=10, help='Calibration images per class')
+    parser.add_argument('--test-dir', default=os.path.join(DATASET_DIR, 'test'), help='Evaluation images (one folder per class)')
+    parser.add_argument('--output', default=None, help='Quantized model path (defaults to <model>.int8.onnx)')
+    parser.add_argument('--report', default='quantization_report.json', help='Where to write the JSON report')
+
+    args = parser.parse_args()
+
+    model = YOLO(args.model)
+    if model.task != 'classify':
+        print(f"ERROR: Model task is '{model.task}', only classification models are supported")
+        sys.exit(1)
+
+    imgsz = int(model.overrides.get('imgsz') or 64)
+    fp32_path = ensure_artifact(args.model, 'onnx', imgsz)
+    int8_path = args.output or artifact_path(args.model, 'onnx-int8')
+
+    calibration = list_images(args.calib_dir, model.names, per_class=args.calib_per_class)
+    test_samples = list_images(args.test_dir, model.names)
+    if not test_samples:
+        print(f"ERROR: No test images found in {args.test_dir}")
+        sys.exit(1)
+
+    print(f"Quantizing {fp32_path} ({args.mode}, {len(calibration)} calibration images)")
+    start = time.time()
+    quantize(fp32_path, int8_path, args.mode, calibration, imgsz)
+    print(f"Wrote {int8_path} in {time.time() - start:.1f} seconds")
+
+    print(f"Evaluating on {len(test_samples)} test images...")
+    results = [
+        evaluate("pytorch-fp32", TorchRuntime(model), test_samples, imgsz),
+        evaluate("onnx-fp32", OnnxRuntime(fp32_path), test_samples, imgsz),
+        evaluate("onnx-int8", OnnxRuntime(int8_path), test_samples, imgsz),
+    ]
+
+    report = {
+        "model": args.model,
+        "mode": args.mode,
+        "imgsz": imgsz,
+        "calibration_images": len(calibration),
+        "sizes_mb": {
+            "pytorch-fp32": os.path.getsize(args.model) / (1024 * 1024),
+            "onnx-fp32": file_size_mb(fp32_path),
+            "onnx-int8": file_size_mb(int8_path),
+        },
+        "results": results,
+    }
+
+    print(f"\n{'model':<14}{'top1':>8}{'top5':>8}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'size MB':>10}")
+    for r in results:
+        print(f"{r['name']:<14}{r['top1']:>8.3f}{r['top5']:>8.3f}{r['latency_ms_mean']:>10.2f}"
+              f"{r['latency_ms_p50']:>10.2f}{r['latency_ms_p95']:>10.2f}{report['sizes_mb'][r['name']]:>10.1f}")
+
+    with open(args.report, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nReport written to {args.report}")
+    print(f"Serve the quantized model with INFERENCE_BACKEND=onnx-int8 MODEL_PATH={args.model}")
+
+if __name__ == "__main__":
+    main()
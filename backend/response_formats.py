@@ -0,0 +1,134 @@
+"""
+Compact binary encodings of /detect responses, negotiated through ``Accept``.
+
+JSON stays the default (and is what ``*/*`` gets). Clients that ask for one
+of the binary formats get the same result without the per-detection class
+name strings or the timestamp; they map ``class_id`` to a name once, using
+``detection_class_names`` from ``/model_info``.
+
+``application/msgpack`` (needs ``msgpack``, from ``requirements-backends.txt``)
+    A map with ``success``, ``model_version``, the ``cached`` / ``reused`` /
+    ``superseded`` flags that apply, and ``detections`` as arrays of
+    ``[class_id, confidence]`` or ``[class_id, confidence, x1, y1, x2, y2]``
+    (floats as 32-bit).
+
+``application/vnd.signserenade.detections`` (fixed little-endian layout)
+    An 8-byte header ``<BBHI``: format version (1), flags, detection count,
+    model version. Flags: 1 success, 2 cached, 4 reused, 8 has boxes,
+    16 superseded. Then one record per detection, best first: ``<Hf``
+    (class_id uint16, confidence float32; 6 bytes) or, when the boxes flag is
+    set, ``<Hf4f`` (followed by x1, y1, x2, y2 float32; 22 bytes).
+
+Error responses are always JSON.
+"""
+
+import logging
+import struct
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+logger = logging.getLogger(__name__)
+
+JSON = 'application/json'
+MSGPACK = 'application/msgpack'
+STRUCT = 'application/vnd.signserenade.detections'
+
+STRUCT_VERSION = 1
+STRUCT_HEADER = struct.Struct('<BBHI')
+CLASS_RECORD = struct.Struct('<Hf')
+BOX_RECORD = struct.Struct('<Hf4f')
+
+FLAG_SUCCESS = 1
+FLAG_CACHED = 2
+FLAG_REUSED = 4
+FLAG_BOXES = 8
+FLAG_SUPERSEDED = 16
+
+_FLAGS = (('success', FLAG_SUCCESS), ('cached', FLAG_CACHED), ('reused', FLAG_REUSED),
+          ('superseded', FLAG_SUPERSEDED))
+
+# Set once a client has been refused msgpack, so the warning is logged once per process
+_msgpack_refused = False
+
+
+def available():
+    """Response mimetypes this server can produce, default first."""
+    return [JSON, MSGPACK, STRUCT] if msgpack is not None else [JSON, STRUCT]
+
+
+def negotiate(accept_mimetypes):
+    """Best response mimetype for a werkzeug ``Accept`` header (JSON unless a binary format is preferred)."""
+    global _msgpack_refused
+    offered = available()
+    if msgpack is not None:
+        offered.append('application/x-msgpack')
+    elif not _msgpack_refused and any(q > 0 and value in (MSGPACK, 'application/x-msgpack')
+                                      for value, q in accept_mimetypes):
+        _msgpack_refused = True
+        logger.warning("A client asked for msgpack but it is not installed; answering with another format "
+                       "(pip install -r requirements-backends.txt)")
+    best = accept_mimetypes.best_match(offered, default=JSON)
+    return MSGPACK if best == 'application/x-msgpack' else best
+
+
+def _rows(detections):
+    rows = []
+    for d in detections:
+        row = [d["class_id"], d["confidence"]]
+        if "bbox" in d:
+            row.extend(d["bbox"])
+        rows.append(row)
+    return rows
+
+
+def encode_msgpack(payload):
+    body = {key: value for key, value in payload.items() if key not in ('detections', 'timestamp', 'error')}
+    body["detections"] = _rows(payload.get("detections") or [])
+    # Confidences and boxes are float32 to begin with, so single floats lose nothing
+    return msgpack.packb(body, use_bin_type=True, use_single_float=True)
+
+
+def encode_struct(payload):
+    detections = payload.get("detections") or []
+    flags = sum(flag for key, flag in _FLAGS if payload.get(key))
+    boxes = any("bbox" in d for d in detections)
+    if boxes:
+        flags |= FLAG_BOXES
+
+    parts = [STRUCT_HEADER.pack(STRUCT_VERSION, flags, len(detections), payload.get("model_version") or 0)]
+    if boxes:
+        parts.extend(BOX_RECORD.pack(d["class_id"], d["confidence"], *d.get("bbox", (0.0,) * 4)) for d in detections)
+    else:
+        parts.extend(CLASS_RECORD.pack(d["class_id"], d["confidence"]) for d in detections)
+    return b''.join(parts)
+
+
+def decode_struct(data):
+    """Parse a ``STRUCT`` body back into a dict (for clients and tests)."""
+    version, flags, count, model_version = STRUCT_HEADER.unpack_from(data)
+    if version != STRUCT_VERSION:
+        raise ValueError(f"Unsupported detections format version {version}")
+    record = BOX_RECORD if flags & FLAG_BOXES else CLASS_RECORD
+
+    detections = []
+    for fields in record.iter_unpack(data[STRUCT_HEADER.size:STRUCT_HEADER.size + count * record.size]):
+        detection = {"class_id": fields[0], "confidence": fields[1]}
+        if flags & FLAG_BOXES:
+            detection["bbox"] = list(fields[2:])
+        detections.append(detection)
+
+    result = {key: bool(flags & flag) for key, flag in _FLAGS}
+    result.update(model_version=model_version, detections=detections)
+    return result
+
+
+def encode(payload, mimetype):
+    """Encode a successful /detect payload as ``mimetype`` (``MSGPACK`` or ``STRUCT``)."""
+    if mimetype == MSGPACK:
+        return encode_msgpack(payload)
+    if mimetype == STRUCT:
+        return encode_struct(payload)
+    raise ValueError(f"Unsupported response format: {mimetype}")
@@ -0,0 +1,168 @@
+"""
+Content-addressed cache for inference results.
+
+Entries are keyed by a fast hash of the raw request payload plus the model
+version, kept in LRU order and expired after ``ttl`` seconds. Concurrent
+lookups for the same key while it is being computed wait for the single
+in-flight computation instead of running their own. Each caller waits only
+until its own deadline, and a leader dropped for missing *its* deadline does
+not fail the others: they compute the result themselves instead.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from admission import DeadlineExceeded
+
+
+class _Flight:
+    """A computation in progress that other callers can wait on."""
+
+    __slots__ = ("done", "value", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class ResultCache:
+    """Thread-safe LRU + TTL cache with single-flight computation."""
+
+    def __init__(self, max_entries=1024, ttl=60.0):
+        self.max_entries = max(0, int(max_entries))
+        self.ttl = float(ttl)
+
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+        self._hits = 0
+        self._misses = 0
+        self._coalesced = 0
+        self._evictions = 0
+        self._expirations = 0
+        self._invalidations = 0
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    @staticmethod
+    def make_key(data, model_version, namespace=""):
+        """Build a cache key from raw payload bytes and the model version."""
+        if isinstance(data, str):
+            data = data.encode()
+        digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+        return f"{namespace}:{model_version}:{digest}"
+
+    def get(self, key):
+        """Return the cached value for ``key``, or None on a miss."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            value = self._lookup(key)
+            if value is not None:
+                self._hits += 1
+            return value
+
+    def get_or_compute(self, key, compute, deadline=None):
+        """Return the cached value for ``key``, computing it at most once.
+
+        Returns ``(value, cached)`` where ``cached`` is True when no new
+        computation was run by this caller. ``deadline`` (``time.monotonic()``
+        based) bounds how long this caller waits for another caller's
+        computation; past it, DeadlineExceeded is raised.
+        """
+        if not self.enabled:
+            return compute(), False
+
+        while True:
+            with self._lock:
+                value = self._lookup(key)
+                if value is not None:
+                    self._hits += 1
+                    return value, True
+
+                flight = self._inflight.get(key)
+                if flight is not None:
+                    self._coalesced += 1
+                    leader = False
+                else:
+                    flight = _Flight()
+                    self._inflight[key] = flight
+                    self._misses += 1
+                    leader = True
+
+            if leader:
+                break
+
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            if not flight.done.wait(timeout):
+                raise DeadlineExceeded("Deadline passed while waiting for an identical request")
+            if isinstance(flight.error, DeadlineExceeded):
+                # The leader's deadline is not ours: take over (or follow a newer flight)
+                continue
+            if flight.error is not None:
+                raise flight.error
+            return flight.value, True
+
+        try:
+            flight.value = compute()
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+                if flight.error is None and flight.value is not None:
+                    self._store(key, flight.value)
+            flight.done.set()
+
+        return flight.value, False
+
+    def clear(self):
+        """Drop every entry, e.g. after the model weights change."""
+        with self._lock:
+            self._invalidations += 1
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._misses + self._coalesced
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "hits": self._hits,
+                "misses": self._misses,
+                "coalesced": self._coalesced,
+                "evictions": self._evictions,
+                "expirations": self._expirations,
+                "invalidations": self._invalidations,
+                "hit_rate": ((self._hits + self._coalesced) / lookups) if lookups else 0.0,
+            }
+
+    def _lookup(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        stored_at, value = entry
+        if time.monotonic() - stored_at > self.ttl:
+            del self._entries[key]
+            self._expirations += 1
+            return None
+
+        self._entries.move_to_end(key)
+        return value
+
+    def _store(self, key, value):
+        self._entries[key] = (time.monotonic(), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._evictions += 1
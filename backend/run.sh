@@ -7,8 +7,28 @@ export MODEL_PATH=best(4).pt
 # Use PORT from Render (Render sets this automatically)
 export PORT=${PORT:-8000}
 
-# Install dependencies
-pip install -r requirements.txt
+# Install dependencies (SERVER_MODE=asgi also needs the ASGI server packages)
+if [ "${SERVER_MODE:-wsgi}" = "asgi" ]; then
+    pip install -r requirements-asgi.txt
+else
+    pip install -r requirements.txt
+fi
+# ... and INFERENCE_BACKEND=onnx, onnx-int8 or openvino needs its runtime
+if [ "${INFERENCE_BACKEND:-pytorch}" != "pytorch" ]; then
+    pip install -r requirements-backends.txt
+fi
+
+# Micro-batching: concurrent /detect requests in a worker share one forward pass
+export BATCH_MAX_SIZE=${BATCH_MAX_SIZE:-8}
+export BATCH_MAX_WAIT_MS=${BATCH_MAX_WAIT_MS:-5}
 
 # Run the Flask app using Gunicorn (better for production)
-exec gunicorn -w 4 -b 0.0.0.0:$PORT app:app
+# gunicorn.conf.py preloads the model once and shares it with the workers, binding the port only once
+# it is loaded; GUNICORN_PRELOAD=0 binds at once and loads a copy per worker in the background
+export GUNICORN_WORKERS=${GUNICORN_WORKERS:-4}
+
+# SERVER_MODE=asgi serves the same API from uvicorn workers (see asgi_app.py)
+if [ "${SERVER_MODE:-wsgi}" = "asgi" ]; then
+    exec gunicorn -c gunicorn.conf.py -k uvicorn_worker.UvicornWorker asgi_app:app
+fi
+exec gunicorn -c gunicorn.conf.py app:app
@@ -0,0 +1,172 @@
+"""
+Bounded per-client session state.
+
+Sessions are keyed by a client-supplied id and kept in LRU order. The store
+keeps at most ``max_sessions`` entries, and sessions that have been idle for
+longer than ``idle_ttl`` seconds are evicted on access. Eviction skips busy
+sessions, ones with a frame running or waiting (see ``Session.busy``), so a
+client's frames never end up split across two Session objects; the store only
+goes over ``max_sessions`` while more sessions than that are busy.
+
+A session also serializes its own frames, latest frame wins: one frame runs
+at a time and at most one waits behind it. A newer frame replaces the waiting
+one, which is told it was superseded straight away (see ``claim_turn``).
+"""
+
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+class Session:
+    """State kept for one client session."""
+
+    def __init__(self, session_id):
+        self.id = session_id
+        self.created = time.time()
+        self.last_seen = time.monotonic()
+        self.frames = 0
+        self.last_detections = None
+        self.gate_fingerprint = None
+        self.gate_version = None
+        self.lock = threading.Lock()
+
+        self._turn = threading.Condition()
+        self._latest = 0
+        self._running = False
+        self._waiting = 0
+        self._in_flight = 0
+
+    def touch(self):
+        self.last_seen = time.monotonic()
+
+    def busy(self):
+        """True while a frame of this session is running or waiting for its turn."""
+        with self._turn:
+            return self._running or self._waiting > 0 or self._in_flight > 0
+
+    @contextmanager
+    def in_use(self):
+        """Mark the session busy for frames that do not take turns (``/stream``)."""
+        with self._turn:
+            self._in_flight += 1
+        try:
+            yield self
+        finally:
+            with self._turn:
+                self._in_flight -= 1
+
+    def claim_turn(self, timeout=None):
+        """Wait until no other frame of this session is running, then run this one.
+
+        Returns True once it is this frame's turn (pair with ``release_turn``),
+        or False as soon as a newer frame has arrived and this one is
+        superseded. Raises TimeoutError if the running frame takes longer
+        than ``timeout`` seconds.
+        """
+        with self._turn:
+            self._latest += 1
+            ticket = self._latest
+            # Wakes the frame waiting so far, which now finds itself superseded
+            self._turn.notify_all()
+
+            deadline = None if timeout is None else time.monotonic() + timeout
+            self._waiting += 1
+            try:
+                while self._running and self._latest == ticket:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        raise TimeoutError("Timed out waiting for the session's previous frame")
+                    self._turn.wait(remaining)
+            finally:
+                self._waiting -= 1
+
+            if self._latest != ticket:
+                return False
+            self._running = True
+            return True
+
+    def release_turn(self):
+        with self._turn:
+            self._running = False
+            self._turn.notify_all()
+
+
+class SessionStore:
+    """Thread-safe LRU store of sessions with idle eviction (busy sessions are never evicted)."""
+
+    def __init__(self, max_sessions=256, idle_ttl=60.0):
+        self.max_sessions = max(1, int(max_sessions))
+        self.idle_ttl = float(idle_ttl)
+
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._evicted_lru = 0
+        self._evicted_idle = 0
+
+    @staticmethod
+    def new_id():
+        return uuid.uuid4().hex
+
+    def get(self, session_id):
+        """Return the session for ``session_id``, creating it if needed."""
+        with self._lock:
+            self._evict_idle()
+
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = Session(session_id)
+                self._sessions[session_id] = session
+                self._created += 1
+                self._evict_lru()
+            else:
+                self._sessions.move_to_end(session_id)
+
+            session.touch()
+            return session
+
+    def discard(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "active": len(self._sessions),
+                "max_sessions": self.max_sessions,
+                "idle_ttl": self.idle_ttl,
+                "created": self._created,
+                "evicted_lru": self._evicted_lru,
+                "evicted_idle": self._evicted_idle,
+            }
+
+    def _evict_lru(self):
+        # Least recently used first, skipping busy sessions and the one just added
+        excess = len(self._sessions) - self.max_sessions
+        if excess <= 0:
+            return
+        victims = []
+        for session_id, session in list(self._sessions.items())[:-1]:
+            if not session.busy():
+                victims.append(session_id)
+                if len(victims) == excess:
+                    break
+        for session_id in victims:
+            del self._sessions[session_id]
+        self._evicted_lru += len(victims)
+
+    def _evict_idle(self):
+        # Oldest sessions are at the front, so stop at the first fresh one
+        cutoff = time.monotonic() - self.idle_ttl
+        victims = []
+        for session_id, session in self._sessions.items():
+            if session.last_seen >= cutoff:
+                break
+            if not session.busy():
+                victims.append(session_id)
+        for session_id in victims:
+            del self._sessions[session_id]
+        self._evicted_idle += len(victims)
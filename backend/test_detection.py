@@ -5,6 +5,7 @@ import numpy as np
 import argparse
 import json
 import os
+import struct
 
 def test_health(url):
     """Test the health endpoint."""
@@ -65,6 +66,69 @@ def test_detection_with_base64(url, image_path):
         print(f"Error testing detection with base64: {e}")
         return None
 
+def test_detection_with_raw(url, image_path):
+    """Test the detect endpoint with a raw RGB payload (no server-side decode)."""
+    try:
+        img = cv2.cvtColor(cv2.imread(image_path), cv2.COLOR_BGR2RGB)
+        height, width, channels = img.shape
+        payload = struct.pack('<HHH', height, width, channels) + img.tobytes()
+        
+        response = requests.post(
+            f"{url}/detect",
+            data=payload,
+            headers={'Content-Type': 'application/octet-stream'},
+            timeout=30
+        )
+        
+        print(f"Detection status code: {response.status_code}")
+        print(f"Response: {json.dumps(response.json(), indent=2)}")
+        return response.json()
+    except Exception as e:
+        print(f"Error testing detection with raw payload: {e}")
+        return None
+
+def test_detection_batch(url, image_path, count=4):
+    """Test the detect_batch endpoint with several copies of an image."""
+    try:
+        with open(image_path, 'rb') as f:
+            image_data = f.read()
+        
+        files = [('image[]', (f"{i}_{os.path.basename(image_path)}", image_data, 'image/jpeg'))
+                 for i in range(count)]
+        response = requests.post(f"{url}/detect_batch", files=files, timeout=30)
+        
+        print(f"Batch detection status code: {response.status_code}")
+        print(f"Response: {json.dumps(response.json(), indent=2)}")
+        return response.json()
+    except Exception as e:
+        print(f"Error testing batch detection: {e}")
+        return None
+
+def test_detection_stream(url, image_path, count=10):
+    """Test the stream endpoint by sending the same frame several times."""
+    try:
+        with open(image_path, 'rb') as f:
+            image_data = f.read()
+        
+        def frames():
+            for _ in range(count):
+                yield struct.pack('>I', len(image_data)) + image_data
+            yield struct.pack('>I', 0)
+        
+        response = requests.post(f"{url}/stream", data=frames(), stream=True, timeout=30)
+        print(f"Stream status code: {response.status_code}")
+        print(f"Session id: {response.headers.get('X-Session-Id')}")
+        
+        results = []
+        for line in response.iter_lines():
+            if line:
+                results.append(json.loads(line))
+                print(f"Frame result: {json.dumps(results[-1])}")
+        return results
+    except Exception as e:
+        print(f"Error testing stream detection: {e}")
+        return None
+
 def create_test_image(output_path="test_image.jpg"):
     """Create a simple test image."""
     # Create a black image with a white rectangle
@@ -81,7 +145,7 @@ def main():
     parser.add_argument('--url', default='http://localhost:8000', help='Backend URL')
     parser.add_argument('--image', help='Path to test image')
     parser.add_argument('--create-image', action='store_true', help='Create a test image')
-    parser.add_argument('--method', choices=['file', 'base64'], default='file', help='Method to send image')
+    parser.add_argument('--method', choices=['file', 'base64', 'raw', 'batch', 'stream'], default='file', help='Method to send image')
     
     args = parser.parse_args()
     
@@ -102,6 +166,12 @@ def main():
     print(f"\n=== Testing Detection Endpoint with {args.method} method ===")
     if args.method == 'file':
         test_detection_with_file(args.url, image_path)
+    elif args.method == 'raw':
+        test_detection_with_raw(args.url, image_path)
+    elif args.method == 'batch':
+        test_detection_batch(args.url, image_path)
+    elif args.method == 'stream':
+        test_detection_stream(args.url, image_path)
     else:
         test_detection_with_base64(args.url, image_path)
     
@@ -0,0 +1,121 @@
+"""
+Check that the lean classifier path matches the ultralytics predictor.
+
+Runs every image in ML/dataset/test through both ``model(img)`` and
+``LeanClassifier`` using the same decode the server uses, and compares the
+class probabilities. The top-1 class must agree unless the predictor's own
+top two classes are within the probability tolerance of each other.
+
+Probabilities alone prove little for a model whose outputs are nearly
+uniform (an untrained stand-in passes any tolerance), so the preprocessed
+input tensors are compared too: the lean resize is cv2's, the predictor's is
+PIL's, and their mean absolute difference per image must stay within
+``input_tolerance``.
+"""
+
+import os
+import sys
+import glob
+import argparse
+import time
+
+import numpy as np
+from ultralytics import YOLO
+
+from image_io import decode_image_bytes
+from lean_engine import LeanClassifier, TorchRuntime
+
+DEFAULT_DATASET = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'ML', 'dataset', 'test')
+
+def check_parity(model_path=None, dataset=DEFAULT_DATASET, tolerance=1e-3, limit=None, input_tolerance=0.01):
+    """Compare lean and predictor inputs and probabilities on every test image; True if they agree."""
+    model_path = model_path or os.environ.get('MODEL_PATH', 'best(4).pt')
+    print(f"Testing lean classifier parity for {model_path}")
+
+    model = YOLO(model_path)
+    if not LeanClassifier.supports(model):
+        print(f"Model task is '{model.task}', the lean engine only handles classification models")
+        return False
+
+    imgsz = int(model.overrides.get('imgsz') or 64)
+    engine = LeanClassifier(TorchRuntime(model), imgsz)
+
+    paths = sorted(glob.glob(os.path.join(dataset, '*', '*.png')))
+    if limit:
+        paths = paths[:limit]
+    if not paths:
+        print(f"No test images found in {dataset}")
+        return False
+
+    max_diff = 0.0
+    max_input_diff = 0.0
+    top1_agree = 0
+    mismatches = []
+    predictor_time = 0.0
+    lean_time = 0.0
+
+    for path in paths:
+        with open(path, 'rb') as f:
+            img = decode_image_bytes(f.read(), imgsz)
+
+        start = time.perf_counter()
+        expected = model(img, verbose=False)[0].probs.data.cpu().numpy()
+        predictor_time += time.perf_counter() - start
+
+        start = time.perf_counter()
+        actual = engine.probabilities([img])[0]
+        lean_time += time.perf_counter() - start
+
+        max_diff = max(max_diff, float(np.abs(expected - actual).max()))
+        top1_agree += int(expected.argmax() == actual.argmax())
+
+        # The predictor has just preprocessed this image; redo it to compare what both fed the model
+        reference_input = model.predictor.preprocess([img]).cpu().numpy()
+        input_diff = float(np.abs(reference_input - engine.preprocess([img])).mean())
+        max_input_diff = max(max_input_diff, input_diff)
+
+        top_two = np.sort(expected)[-2:]
+        if expected.argmax() != actual.argmax() and top_two[1] - top_two[0] > tolerance:
+            mismatches.append(path)
+
+    print(f"Images compared: {len(paths)}")
+    print(f"Max mean input difference: {max_input_diff:.6f} (tolerance {input_tolerance})")
+    print(f"Max probability difference: {max_diff:.6f} (tolerance {tolerance})")
+    print(f"Top-1 agreement: {top1_agree}/{len(paths)}, mismatches outside ties: {len(mismatches)}")
+    for path in mismatches[:10]:
+        print(f"  {path}")
+    print(f"Predictor: {predictor_time / len(paths) * 1000:.2f} ms/image, "
+          f"lean: {lean_time / len(paths) * 1000:.2f} ms/image")
+
+    return max_diff <= tolerance and max_input_diff <= input_tolerance and not mismatches
+
+def test_lean_engine():
+    """Lean engine parity with the default model and dataset (also collected by pytest)."""
+    import pytest
+
+    model_path = os.environ.get('MODEL_PATH', 'best(4).pt')
+    if not os.path.exists(model_path):
+        # ultralytics would otherwise try to download a model by that name
+        pytest.skip(f"model {model_path} not found; set MODEL_PATH")
+    assert check_parity(model_path), "lean classifier differs from the ultralytics predictor"
+
+def main():
+    parser = argparse.ArgumentParser(description='Check lean classifier parity with the ultralytics predictor')
+    parser.add_argument('--model', default=None, help='Path to the YOLO classification model (defaults to MODEL_PATH)')
+    parser.add_argument('--dataset', default=DEFAULT_DATASET, help='Folder with one sub-folder of images per class')
+    parser.add_argument('--tolerance', type=float, default=1e-3, help='Maximum allowed probability difference')
+    parser.add_argument('--input-tolerance', type=float, default=0.01,
+                        help='Maximum mean absolute difference between the preprocessed inputs of one image')
+    parser.add_argument('--limit', type=int, default=None, help='Only compare the first N images')
+
+    args = parser.parse_args()
+
+    if check_parity(args.model, args.dataset, args.tolerance, args.limit, args.input_tolerance):
+        print("Lean engine parity test passed!")
+        sys.exit(0)
+    else:
+        print("Lean engine parity test failed!")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
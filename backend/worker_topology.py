@@ -0,0 +1,82 @@
+"""
+CPU thread budgets for gunicorn workers that each run inference.
+
+Every torch (or ONNX Runtime / OpenVINO) instance sizes its thread pool to
+the whole machine by default, so ``-w 4`` on a 4-core box ends up with 16+
+compute threads fighting over 4 cores. The budget splits the cores available
+to the process between the workers instead: each worker gets
+``cores // workers`` intra-op threads (at least one) and a single inter-op
+thread, since the models here are single graphs with no parallel branches.
+
+``INFERENCE_INTRA_THREADS`` / ``INFERENCE_INTER_THREADS`` override the
+computed values.
+"""
+
+import logging
+import os
+import sys
+
+logger = logging.getLogger(__name__)
+
+# Environment variables read by the OpenMP/MKL pools that torch and the exported backends use
+THREAD_ENV_VARS = ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS')
+
+# Budget recorded by apply_thread_budget() and the one last applied to torch
+_budget = None
+_applied = None
+
+
+def available_cores():
+    """CPU cores this process may run on (respects affinity masks and cpusets)."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def thread_budget(workers, cores=None):
+    """Return ``(intra_op, inter_op)`` thread counts for one of ``workers`` workers."""
+    cores = cores or available_cores()
+    intra = max(1, cores // max(1, int(workers)))
+    inter = 1
+
+    if os.environ.get('INFERENCE_INTRA_THREADS'):
+        intra = max(1, int(os.environ['INFERENCE_INTRA_THREADS']))
+    if os.environ.get('INFERENCE_INTER_THREADS'):
+        inter = max(1, int(os.environ['INFERENCE_INTER_THREADS']))
+    return intra, inter
+
+
+def apply_thread_budget(intra, inter):
+    """Record this process's thread budget and apply it to torch once torch is imported."""
+    global _budget
+
+    _budget = (intra, inter)
+    for name in THREAD_ENV_VARS:
+        os.environ[name] = str(intra)
+
+    # When torch is not imported yet the app applies the budget after importing it
+    if 'torch' in sys.modules:
+        configure_torch()
+
+
+def configure_torch():
+    """Size torch's thread pools from the recorded budget (no-op without one)."""
+    global _applied
+
+    if _budget is None or _applied == _budget:
+        return
+    intra, inter = _budget
+
+    import torch
+
+    torch.set_num_threads(intra)
+    try:
+        torch.set_num_interop_threads(inter)
+    except RuntimeError as e:
+        # Only allowed before the inter-op pool has started; after a fork from a
+        # master that already ran inference the inherited setting stays
+        logger.debug(f"Keeping inter-op thread count {torch.get_num_interop_threads()}: {e}")
+
+    _applied = _budget
+    logger.info(f"Worker {os.getpid()} using {intra} intra-op / {torch.get_num_interop_threads()} inter-op threads")